@@ -29,13 +29,50 @@
     }
   };
 
+  // For services with too many templates to list on one page, ask the
+  // server to search instead of filtering what’s already on the page
+  let search = ($searchBox, $targets, $results, url) => {
+    let timeout, request;
+
+    return () => {
+      let query = $searchBox.val().trim();
+
+      clearTimeout(timeout);
+      if (request) request.abort();
+
+      if (query == "") {
+        $results.empty();
+        $targets.css("display", "");
+        return;
+      }
+
+      timeout = setTimeout(() => {
+        request = $.get(url, { q: query }).done((response) => {
+          $targets.not(":has(:checked)").hide();
+          $results.empty().append(
+            response.results.map((item) =>
+              $("<p class='message-name'>").append(
+                $("<a>")
+                  .attr("href", item.url)
+                  .addClass(item.type == "folder" ? "template-list-folder" : "template-list-template")
+                  .text(item.path.concat([item.name]).join(" / "))
+              )
+            )
+          );
+        });
+      }, 200);
+    };
+  };
+
   Modules.LiveSearch = function () {
     this.start = function (component) {
       let $component = $(component);
 
       let $searchBox = $("input", $component);
 
-      let filterFunc = filter($searchBox, $($component.data("targets")));
+      let filterFunc = $component.data("searchUrl")
+        ? search($searchBox, $($component.data("targets")), $(".live-search-results", $component), $component.data("searchUrl"))
+        : filter($searchBox, $($component.data("targets")));
 
       $searchBox.on("keyup input", filterFunc);
 
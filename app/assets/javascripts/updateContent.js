@@ -2,14 +2,22 @@
   "use strict";
 
   var queues = {};
+  var cursors = {};
   //var dd = new diffDOM();
   var dd = new window.DiffDOM();
 
   var getRenderer = ($component) => (response) => {
+    // Responses only include the parts of the page which have changed
+    if (!($component.data("key") in response)) return;
     var contentStr = $(response[$component.data("key")]).get(0);
     return dd.apply($component.get(0), dd.diff($component.get(0), contentStr));
   };
 
+  var getData = function (resource, form) {
+    if (form) return $("#" + form).serialize();
+    return cursors[resource] ? { cursor: cursors[resource] } : {};
+  };
+
   var getQueue = (resource) => (queues[resource] = queues[resource] || []);
 
   var flushQueue = function (queue, response) {
@@ -22,9 +30,10 @@
     if (document.visibilityState !== "hidden" && queue.push(renderer) === 1)
       $.ajax(resource, {
         method: form ? "post" : "get",
-        data: form ? $("#" + form).serialize() : {},
+        data: getData(resource, form),
       })
         .done((response) => {
+          if (response.cursor) cursors[resource] = response.cursor;
           flushQueue(queue, response);
           if (response.stop === 1) {
             poll = function () {};
@@ -37,13 +46,16 @@
   };
 
   Modules.UpdateContent = function () {
-    this.start = (component) =>
+    this.start = (component) => {
+      var resource = $(component).data("resource");
+      if ($(component).data("cursor")) cursors[resource] = $(component).data("cursor");
       poll(
         getRenderer($(component)),
-        $(component).data("resource"),
-        getQueue($(component).data("resource")),
+        resource,
+        getQueue(resource),
         ($(component).data("interval-seconds") || 1.5) * 1000,
         $(component).data("form")
       );
+    };
   };
 })(window.GOVUK.Modules);
@@ -0,0 +1,77 @@
+import atexit
+import logging
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundQueue:
+    """
+    Processes items on a background thread, so that the request which
+    queued them doesn’t have to wait for them.
+
+    Items queued while earlier ones are being processed are handed to
+    `process` together, up to `batch_size` at a time. If the queue fills
+    up, new items are dropped rather than blocking the request, unless
+    there’s a `spill` function, in which case they’re handed to that. Any
+    items still queued when the process exits are spilled too.
+    """
+
+    def __init__(self, process, batch_size=1, maxsize=10_000, spill=None):
+        self.process = process
+        self.batch_size = batch_size
+        self.spill = spill
+        self.queue = queue.Queue(maxsize)
+        self._thread = None
+        self._lock = threading.Lock()
+        if spill:
+            atexit.register(self._spill_remaining)
+
+    def put(self, item):
+        self._start()
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            if self.spill:
+                self.spill([item])
+            else:
+                logger.warning("Background queue for {} is full, dropping item".format(self.process.__name__))
+
+    def _start(self):
+        # Started on first use rather than on import, so that each worker
+        # process gets its own thread after forking
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            items = [self.queue.get()]
+            while len(items) < self.batch_size:
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.process(items)
+            except Exception:
+                logger.exception("Error in background queue for {}".format(self.process.__name__))
+            finally:
+                for _ in items:
+                    self.queue.task_done()
+
+    def _spill_remaining(self):
+        items = []
+        while True:
+            try:
+                items.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        if items:
+            self.spill(items)
+
+    def join(self):
+        """Waits until everything queued so far has been processed"""
+        self.queue.join()
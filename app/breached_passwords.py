@@ -0,0 +1,126 @@
+import hashlib
+import math
+import mmap
+import struct
+from threading import Lock
+
+from flask import current_app
+
+MAGIC = b"NOTIFYBF"
+# The magic bytes, then the number of bits and the number of hashes
+HEADER = struct.Struct(">8sQI")
+
+_filters = {}
+_filters_lock = Lock()
+
+
+def get_password_hash(password):
+    # Breached password dumps are lists of SHA-1 hashes
+    return hashlib.sha1(password.encode("utf-8")).digest()
+
+
+class BloomFilter:
+    """
+    A Bloom filter of SHA-1 password hashes, read from a file which is
+    memory-mapped so that it’s shared between processes and only the
+    pages which are looked at are read from disk.
+
+    Looking up a password never gives a false negative. It gives a false
+    positive at the rate the filter was built with, which means that
+    roughly that proportion of passwords which haven’t been breached will
+    be rejected anyway.
+    """
+
+    def __init__(self, bits, number_of_bits, number_of_hashes):
+        self.bits = bits
+        self.number_of_bits = number_of_bits
+        self.number_of_hashes = number_of_hashes
+
+    @staticmethod
+    def get_size(number_of_items, false_positive_rate):
+        number_of_bits = math.ceil(-max(number_of_items, 1) * math.log(false_positive_rate) / math.log(2) ** 2)
+        number_of_bits = (number_of_bits + 7) // 8 * 8
+        number_of_hashes = max(round(number_of_bits / max(number_of_items, 1) * math.log(2)), 1)
+        return number_of_bits, number_of_hashes
+
+    def _get_positions(self, password_hash):
+        # SHA-1 hashes are already uniformly distributed, so two halves of
+        # one can be combined to give as many positions as are needed
+        first, second = struct.unpack(">QQ", password_hash[:16])
+        second |= 1
+        for i in range(self.number_of_hashes):
+            yield (first + i * second) % self.number_of_bits
+
+    def add(self, password_hash):
+        for position in self._get_positions(password_hash):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, password_hash):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._get_positions(password_hash))
+
+    @classmethod
+    def create(cls, number_of_items, false_positive_rate):
+        number_of_bits, number_of_hashes = cls.get_size(number_of_items, false_positive_rate)
+        return cls(bytearray(number_of_bits // 8), number_of_bits, number_of_hashes)
+
+    def save(self, path):
+        with open(path, "wb") as file:
+            file.write(HEADER.pack(MAGIC, self.number_of_bits, self.number_of_hashes))
+            file.write(self.bits)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as file:
+            bits = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, number_of_bits, number_of_hashes = HEADER.unpack(bits[: HEADER.size])
+        if magic != MAGIC or len(bits) < HEADER.size + number_of_bits // 8:
+            bits.close()
+            raise ValueError("{} is not a breached passwords filter".format(path))
+        return cls(memoryview(bits)[HEADER.size :], number_of_bits, number_of_hashes)
+
+
+def read_password_hashes(lines, min_count=1):
+    """
+    Reads the hashes from a dump of breached passwords in the format
+    published by Have I Been Pwned, one `HASH:COUNT` per line.
+    """
+    for line in lines:
+        password_hash, _, count = line.strip().partition(":")
+        if not password_hash:
+            continue
+        if count and int(count) < min_count:
+            continue
+        yield bytes.fromhex(password_hash)
+
+
+def build_breached_passwords_filter(password_hashes, number_of_items, false_positive_rate):
+    bloom_filter = BloomFilter.create(number_of_items, false_positive_rate)
+    for password_hash in password_hashes:
+        bloom_filter.add(password_hash)
+    return bloom_filter
+
+
+def get_breached_passwords_filter():
+    path = current_app.config["BREACHED_PASSWORDS_FILTER"]
+    if not path:
+        return None
+
+    with _filters_lock:
+        if path not in _filters:
+            try:
+                _filters[path] = BloomFilter.load(path)
+            except (OSError, ValueError):
+                current_app.logger.exception("Could not load breached passwords filter from {}".format(path))
+                _filters[path] = None
+        return _filters[path]
+
+
+def is_breached_password(password):
+    """
+    Returns whether the password is in the breached passwords filter, or
+    `None` if there’s no filter to check it against.
+    """
+    bloom_filter = get_breached_passwords_filter()
+    if bloom_filter is None:
+        return None
+    return get_password_hash(password) in bloom_filter
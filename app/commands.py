@@ -1,5 +1,11 @@
+from datetime import timedelta
+
+import click
 from flask import current_app
 
+from app.breached_passwords import build_breached_passwords_filter, read_password_hashes
+from app.report_snapshots import DAILY_REPORTS, get_first_live_day
+
 
 def list_routes():
     """List URLs of all application routes."""
@@ -7,5 +13,39 @@ def list_routes():
         print("{:10} {}".format(", ".join(rule.methods - set(["OPTIONS", "HEAD"])), rule.rule))  # noqa
 
 
+@click.argument("dump", type=click.Path(exists=True, dir_okay=False))
+@click.argument("output", type=click.Path(dir_okay=False, writable=True))
+@click.option("--false-positive-rate", default=0.001, show_default=True, help="Proportion of safe passwords rejected.")
+@click.option("--min-count", default=1, show_default=True, help="Ignore passwords seen in fewer breaches than this.")
+def build_breached_passwords_filter_command(dump, output, false_positive_rate, min_count):
+    """Build the breached passwords filter from a Have I Been Pwned SHA-1 dump."""
+    with open(dump) as lines:
+        number_of_items = sum(1 for _ in read_password_hashes(lines, min_count))
+    with open(dump) as lines:
+        bloom_filter = build_breached_passwords_filter(
+            read_password_hashes(lines, min_count),
+            number_of_items,
+            false_positive_rate,
+        )
+    bloom_filter.save(output)
+    print("Wrote {} passwords to {}".format(number_of_items, output))  # noqa
+
+
+@click.option("--start-date", type=click.DateTime(formats=["%Y-%m-%d"]), help="Defaults to the last complete day.")
+@click.option("--end-date", type=click.DateTime(formats=["%Y-%m-%d"]), help="Defaults to the last complete day.")
+def snapshot_platform_admin_reports(start_date, end_date):
+    """Store the platform admin reports for past days, so they don’t have to be fetched from the API again."""
+    last_complete_day = get_first_live_day() - timedelta(days=1)
+    start_date = start_date.date() if start_date else last_complete_day
+    end_date = min(end_date.date() if end_date else last_complete_day, last_complete_day)
+    if start_date > end_date:
+        raise click.BadParameter("Start date must be on or before {}".format(end_date))
+    for report in DAILY_REPORTS:
+        report.snapshot(start_date, end_date)
+        print("Stored {} from {} to {}".format(report.name, start_date, end_date))  # noqa
+
+
 def setup_commands(application):
     application.cli.command("list-routes")(list_routes)
+    application.cli.command("build-breached-passwords-filter")(build_breached_passwords_filter_command)
+    application.cli.command("snapshot-platform-admin-reports")(snapshot_platform_admin_reports)
@@ -43,6 +43,8 @@ class Config(object):
     ASSET_PATH = "/static/"
     ASSETS_DEBUG = False
     AWS_REGION = os.environ.get("AWS_REGION", "us-east-1")
+    # Built with `flask build-breached-passwords-filter`
+    BREACHED_PASSWORDS_FILTER = os.getenv("BREACHED_PASSWORDS_FILTER")
     BULK_SEND_AWS_BUCKET = os.getenv("BULK_SEND_AWS_BUCKET")
     BULK_SEND_TEST_SERVICE_ID = os.getenv("BULK_SEND_TEST_SERVICE_ID")
     CHECK_PROXY_HEADER = False
@@ -50,6 +52,11 @@ class Config(object):
     CSV_MAX_ROWS = env.int("CSV_MAX_ROWS", 50_000)
     CSV_MAX_ROWS_BULK_SEND = env.int("CSV_MAX_ROWS_BULK_SEND", 100_000)
     CSV_UPLOAD_BUCKET_NAME = os.getenv("CSV_UPLOAD_BUCKET_NAME", "notification-alpha-canada-ca-csv-upload")
+    CSV_VALIDATION_CHUNK_SIZE = env.int("CSV_VALIDATION_CHUNK_SIZE", 10_000)
+    # Uploads with at least this many lines are validated by
+    # CSV_VALIDATION_PROCESSES worker processes, forked for the request
+    CSV_VALIDATION_MIN_ROWS_FOR_PROCESSES = env.int("CSV_VALIDATION_MIN_ROWS_FOR_PROCESSES", 20_000)
+    CSV_VALIDATION_PROCESSES = env.int("CSV_VALIDATION_PROCESSES", 0)
     DANGEROUS_SALT = os.environ.get("DANGEROUS_SALT")
     DEBUG = False
     DEFAULT_FREE_SMS_FRAGMENT_LIMITS = {
@@ -69,16 +76,22 @@ class Config(object):
     DOCUMENTATION_DOMAIN = os.getenv("DOCUMENTATION_DOMAIN", "documentation.notification.canada.ca")
     EMAIL_2FA_EXPIRY_SECONDS = 1_800  # 30 Minutes
     EMAIL_EXPIRY_SECONDS = 3600  # 1 hour
+    # Send audit events to the API in the background, rather than during
+    # the request which caused them
+    EVENTS_QUEUE_ENABLED = env.bool("EVENTS_QUEUE_ENABLED", True)
     FREE_YEARLY_SMS_LIMIT = env.int("FREE_YEARLY_SMS_LIMIT", 25_000)
     FREE_YEARLY_EMAIL_LIMIT = env.int("FREE_YEARLY_EMAIL_LIMIT", 10_000_000)
     GOOGLE_ANALYTICS_ID = os.getenv("GOOGLE_ANALYTICS_ID", "UA-102484926-14")
     GOOGLE_TAG_MANAGER_ID = os.getenv("GOOGLE_TAG_MANAGER_ID", "GTM-KRKRZQV")
     HC_EN_SERVICE_ID = os.getenv("HC_EN_SERVICE_ID")
     HC_FR_SERVICE_ID = os.getenv("HC_FR_SERVICE_ID")
-    HIPB_ENABLED = True
+    # Without a BREACHED_PASSWORDS_FILTER, passwords are only checked
+    # against the Have I Been Pwned API, in the request, if this is set
+    HIPB_ENABLED = env.bool("HIPB_ENABLED", False)
     HTTP_PROTOCOL = "http"
     INVITATION_EXPIRY_SECONDS = 3_600 * 24 * 2  # 2 days - also set on api
     IP_GEOLOCATE_SERVICE = os.environ.get("IP_GEOLOCATE_SERVICE", "").rstrip("/")
+    IP_GEOLOCATE_TIMEOUT = env.int("IP_GEOLOCATE_TIMEOUT", 5)
     GC_ARTICLES_API = os.environ.get("GC_ARTICLES_API", "articles.alpha.canada.ca/notification-gc-notify")
     GC_ARTICLES_API_AUTH_USERNAME = os.environ.get("GC_ARTICLES_API_AUTH_USERNAME")
     GC_ARTICLES_API_AUTH_PASSWORD = os.environ.get("GC_ARTICLES_API_AUTH_PASSWORD")
@@ -95,14 +108,28 @@ class Config(object):
     NOTIFY_SERVICE_ID = "d6aa2c68-a2d9-4437-ab19-3ae8eb202553"
     NOTIFY_TEMPLATE_PREFILL_SERVICE_ID = "93305b36-b0a0-4a34-9ab2-c1b7bb5ca489"
     NOTIFY_USER_ID = "6af522d0-2915-4e52-83a3-3690455a5fe6"
+    # How long each process uses its index of organisation domains before
+    # checking whether they’ve changed
+    ORGANISATION_DOMAINS_INDEX_TTL = env.int("ORGANISATION_DOMAINS_INDEX_TTL", 60)
     PERMANENT_SESSION_LIFETIME = 20 * 60 * 60  # 20 hours
+    PLATFORM_ADMIN_SERVICES_CACHE_TTL = env.int("PLATFORM_ADMIN_SERVICES_CACHE_TTL", 300)
+    PLATFORM_ADMIN_SERVICES_PAGE_SIZE = env.int("PLATFORM_ADMIN_SERVICES_PAGE_SIZE", 500)
 
     REDIS_URL = os.environ.get("REDIS_URL")
     REDIS_ENABLED = env.bool("REDIS_ENABLED", False)
 
+    RENDERED_TEMPLATE_CACHE_SIZE = env.int("RENDERED_TEMPLATE_CACHE_SIZE", 1_000)
+    # Platform admin reports for the most recent days are always fetched from
+    # the API. Its nightly tasks re-aggregate the last 4 days, so those (and
+    # today) can still change and mustn't be snapshotted
+    REPORT_SNAPSHOT_LIVE_DAYS = env.int("REPORT_SNAPSHOT_LIVE_DAYS", 5)
+    REPORT_SNAPSHOT_TTL = env.int("REPORT_SNAPSHOT_TTL", 400 * 24 * 60 * 60)
+
     ROUTE_SECRET_KEY_1 = os.environ.get("ROUTE_SECRET_KEY_1", "")
     ROUTE_SECRET_KEY_2 = os.environ.get("ROUTE_SECRET_KEY_2", "")
     WAF_SECRET = os.environ.get("WAF_SECRET", "waf-secret")
+    S3_DOWNLOAD_CONCURRENCY = env.int("S3_DOWNLOAD_CONCURRENCY", 4)
+    S3_DOWNLOAD_PART_SIZE = env.int("S3_DOWNLOAD_PART_SIZE", 8 * 1024 * 1024)
     SECRET_KEY = os.environ.get("SECRET_KEY")
     SECURITY_EMAIL = os.environ.get("SECURITY_EMAIL", "security-securite@cds-snc.ca")
     SEND_FILE_MAX_AGE_DEFAULT = 365 * 24 * 60 * 60  # 1 year
@@ -113,6 +140,7 @@ class Config(object):
     SESSION_REFRESH_EACH_REQUEST = True
     SENSITIVE_SERVICES = os.environ.get("SENSITIVE_SERVICES", "")
     SHOW_STYLEGUIDE = env.bool("SHOW_STYLEGUIDE", True)
+    SMS_FRAGMENT_COUNT_PROCESSES = env.int("SMS_FRAGMENT_COUNT_PROCESSES", 0)
 
     # Hosted graphite statsd prefix
     STATSD_HOST = os.getenv("STATSD_HOST")
@@ -120,8 +148,15 @@ class Config(object):
     STATSD_PORT = 8_125
     STATSD_PREFIX = os.getenv("STATSD_PREFIX")
 
+    # Services with more templates and folders than this only list the
+    # contents of the current folder, and are searched on the server
+    TEMPLATE_LIST_MAX_NESTED_ITEMS = env.int("TEMPLATE_LIST_MAX_NESTED_ITEMS", 500)
+    # Number of services whose templates are fetched at once when listing
+    # templates to copy from every service a user belongs to
+    TEMPLATE_PREFETCH_CONCURRENCY = env.int("TEMPLATE_PREFETCH_CONCURRENCY", 8)
     TEMPLATE_PREVIEW_API_HOST = os.environ.get("TEMPLATE_PREVIEW_API_HOST", "http://localhost:6013")
     TEMPLATE_PREVIEW_API_KEY = os.environ.get("TEMPLATE_PREVIEW_API_KEY", "my-secret-key")
+    TEMPLATE_PREVIEW_API_TIMEOUT = env.int("TEMPLATE_PREVIEW_API_TIMEOUT", 30)
 
     WTF_CSRF_ENABLED = True
     WTF_CSRF_TIME_LIMIT = None
@@ -177,8 +212,10 @@ class Test(Development):
     ASSET_DOMAIN = "static.example.com"
     DANGEROUS_SALT = os.environ.get("DANGEROUS_SALT", "dev-notify-salt")
     DEBUG = True
+    EVENTS_QUEUE_ENABLED = False
     MOU_BUCKET_NAME = "test-mou"
     NOTIFY_ENVIRONMENT = "test"
+    ORGANISATION_DOMAINS_INDEX_TTL = 0
     SECRET_KEY = "dev-notify-secret-key"
     TEMPLATE_PREVIEW_API_HOST = "http://localhost:9999"
     TEMPLATE_PREVIEW_API_KEY = "dev-notify-secret-key"
@@ -0,0 +1,135 @@
+import csv
+from concurrent.futures import ProcessPoolExecutor
+from io import StringIO
+from itertools import accumulate
+
+from notifications_utils.recipients import RecipientCSV
+
+
+class ValidatedRecipientCSV(RecipientCSV):
+    """
+    A RecipientCSV whose rows have already been parsed and validated, so
+    that properties like `has_errors` and `displayed_rows` don’t have to
+    validate every row again inside the request.
+    """
+
+    def __init__(self, file_data, validated_rows, **kwargs):
+        super().__init__(file_data, **kwargs)
+        self._validated_rows = validated_rows
+
+    @property
+    def rows(self):
+        return self._validated_rows
+
+    def __len__(self):
+        return len(self._validated_rows)
+
+    def __getitem__(self, requested_index):
+        return self._validated_rows[requested_index]
+
+    def __iter__(self):
+        return iter(self._validated_rows)
+
+
+def _is_blank(row):
+    return not any(cell.strip() for cell in row)
+
+
+def split_into_chunks(file_data, chunk_size):
+    rows = _read_rows(StringIO(file_data.strip()))
+    header = next(rows, [])
+    chunk, offset = [], 0
+
+    for row in rows:
+        chunk.append(row)
+        # A chunk can’t end on a blank row because it would be stripped
+        # along with the rest of the trailing whitespace in the chunk
+        if len(chunk) >= chunk_size and not _is_blank(row):
+            yield offset, _as_csv_data([header] + chunk)
+            offset += len(chunk)
+            chunk = []
+
+    if chunk or not offset:
+        yield offset, _as_csv_data([header] + chunk)
+
+
+def _read_rows(lines):
+    return csv.reader(lines, quoting=csv.QUOTE_MINIMAL, skipinitialspace=True)
+
+
+def index_rows(file_data):
+    """
+    Returns the column headers of a CSV file, and the byte offsets (in the
+    file encoded as UTF-8) of where each row after them starts, followed by
+    where the last row ends. Rows are split the same way as `RecipientCSV`
+    splits them, so row `n` here is row `n` there.
+    """
+    # Lines are split on `\n` only, like `RecipientCSV` splits them, rather
+    # than on every line boundary `str.splitlines` knows about
+    lines = list(StringIO(file_data.strip()))
+    start = len(file_data[: len(file_data) - len(file_data.lstrip())].encode("utf-8"))
+    line_ends = list(accumulate((len(line.encode("utf-8")) for line in lines), initial=start))
+    lines_read = 0
+
+    def read_lines():
+        nonlocal lines_read
+        for line in lines:
+            lines_read += 1
+            yield line
+
+    rows = _read_rows(read_lines())
+    column_headers = next(rows, [])
+    # The reader only reads as many lines as the row it’s returning takes
+    # up, so the lines read so far always end at the end of a row
+    offsets = [line_ends[lines_read]]
+    for _ in rows:
+        offsets.append(line_ends[lines_read])
+    return column_headers, offsets
+
+
+def recipients_from_rows(column_headers, file_data, **recipient_csv_kwargs):
+    """
+    Returns a `RecipientCSV` of some rows cut out of a file by their offsets
+    from `index_rows`, under the file’s column headers
+    """
+    return RecipientCSV(_as_csv_data([column_headers] + list(_read_rows(StringIO(file_data)))), **recipient_csv_kwargs)
+
+
+def _as_csv_data(rows):
+    with StringIO() as converted:
+        csv.writer(converted).writerows(rows)
+        return converted.getvalue()
+
+
+def validate_chunk(offset, file_data, recipient_csv_kwargs):
+    rows = list(
+        RecipientCSV(
+            file_data,
+            **dict(recipient_csv_kwargs, max_rows=max(recipient_csv_kwargs["max_rows"] - offset, 0)),
+        ).rows
+    )
+    for row in rows:
+        if row:
+            row.index += offset
+    return rows
+
+
+def validate_in_chunks(file_data, processes, chunk_size, **recipient_csv_kwargs):
+    chunks = list(split_into_chunks(file_data, chunk_size))
+    arguments = (
+        (offset for offset, _ in chunks),
+        (chunk for _, chunk in chunks),
+        (recipient_csv_kwargs for _ in chunks),
+    )
+
+    if processes > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            validated_chunks = list(executor.map(validate_chunk, *arguments))
+    else:
+        validated_chunks = list(map(validate_chunk, *arguments))
+
+    return ValidatedRecipientCSV(
+        file_data,
+        [row for validated_chunk in validated_chunks for row in validated_chunk],
+        **recipient_csv_kwargs,
+    )
@@ -1,8 +1,22 @@
-from flask import request
+import json
+import time
+from functools import lru_cache
+
+from flask import current_app, request
 
 from app import events_api_client
+from app.background_queue import BackgroundQueue
+from app.extensions import redis_client
 from app.utils import get_remote_addr
 
+# Events which couldn’t be sent, kept so that they can be tried again
+SPILLED_EVENTS_KEY = "pending-events"
+# Spilled events which still can’t be sent after being tried again this
+# many times are probably never going to be accepted, so are dropped
+MAX_SPILLED_RETRIES = 5
+MAX_ATTEMPTS = 3
+RETRY_DELAY_SECONDS = 0.5
+
 
 def on_user_logged_in(_sender, user):
     _send_event("sucessful_login", user_id=user.id)
@@ -36,7 +50,68 @@ def _send_event(event_type, **kwargs):
     event_data = _construct_event_data(request)
     event_data.update(kwargs)
 
-    events_api_client.create_event(event_type, event_data)
+    if current_app.config["EVENTS_QUEUE_ENABLED"]:
+        event_queue.put((current_app._get_current_object(), event_type, event_data))
+    else:
+        events_api_client.create_event(event_type, event_data)
+
+
+def _create_event(event_type, event_data):
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            events_api_client.create_event(event_type, event_data)
+            return True
+        except Exception:
+            if attempt + 1 == MAX_ATTEMPTS:
+                current_app.logger.exception("Could not create {} event".format(event_type))
+                return False
+            time.sleep(RETRY_DELAY_SECONDS * 2**attempt)
+
+
+def _send_events(events):
+    for index, (app, event_type, event_data) in enumerate(events):
+        with app.app_context():
+            if not _create_event(event_type, event_data):
+                # The API is probably down, so keep the rest for later
+                # rather than waiting for each of them to fail too
+                _spill_events(events[index:])
+                return
+
+    # Now the API is taking events again, try some which couldn’t be sent
+    with app.app_context():
+        for event_type, event_data, retries in _get_spilled_events(len(events)):
+            if not _create_event(event_type, event_data):
+                if retries + 1 < MAX_SPILLED_RETRIES:
+                    _spill_events([(app, event_type, event_data)], retries=retries + 1)
+                else:
+                    current_app.logger.error(
+                        "Dropping {} event after retrying it {} times".format(event_type, MAX_SPILLED_RETRIES)
+                    )
+                return
+
+
+def _spill_events(events, retries=0):
+    if not redis_client.active:
+        return
+    redis_client.redis_store.rpush(
+        SPILLED_EVENTS_KEY,
+        *(json.dumps([event_type, event_data, retries]) for _, event_type, event_data in events),
+    )
+
+
+def _get_spilled_events(count):
+    if not redis_client.active:
+        return
+    for _ in range(count):
+        spilled = redis_client.redis_store.lpop(SPILLED_EVENTS_KEY)
+        if spilled is None:
+            return
+        # Events spilled before retries were counted don’t have a count
+        event_type, event_data, retries = (json.loads(spilled) + [0])[:3]
+        yield event_type, event_data, retries
+
+
+event_queue = BackgroundQueue(_send_events, batch_size=50, maxsize=10_000, spill=_spill_events)
 
 
 def _construct_event_data(request):
@@ -47,16 +122,18 @@ def _construct_event_data(request):
 
 
 def _get_browser_fingerprint(request):
-    browser = request.user_agent.browser
-    version = request.user_agent.version
-    platform = request.user_agent.platform
-    user_agent_string = request.user_agent.string
-    # at some point this may be hashed?
-    finger_print = {
-        "browser": browser,
-        "platform": platform,
-        "version": version,
-        "user_agent_string": user_agent_string,
-    }
+    return dict(_get_user_agent_fingerprint(request.user_agent_class, request.headers.get("User-Agent", "")))
 
-    return finger_print
+
+@lru_cache(maxsize=1_000)
+def _get_user_agent_fingerprint(user_agent_class, user_agent_string):
+    # Browsers send the same user agent with every request, so it only
+    # needs parsing once
+    user_agent = user_agent_class(user_agent_string)
+    # at some point this may be hashed?
+    return (
+        ("browser", user_agent.browser),
+        ("platform", user_agent.platform),
+        ("version", user_agent.version),
+        ("user_agent_string", user_agent_string),
+    )
@@ -0,0 +1,48 @@
+from collections import OrderedDict
+from threading import Lock
+
+
+class LRUCache:
+    """
+    An in-memory cache for each process which forgets the least recently
+    used items once it holds more than `max_size` of them. It can be shared
+    between threads.
+
+    `max_size` can be a number, or a function which returns one so that it
+    can come from the app’s config.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._items:
+                return default
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def set(self, key, value):
+        max_size = self.max_size() if callable(self.max_size) else self.max_size
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > max_size:
+                self._items.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._items))
+
+    def __len__(self):
+        return len(self._items)
@@ -1,4 +1,5 @@
 import weakref
+from collections import defaultdict
 from datetime import datetime, timedelta
 from itertools import chain
 
@@ -288,16 +289,18 @@ class NestedFieldMixin:
         # start map with root option as a single child entry
         child_map = {None: [option for option in self if option.data == self.NONE_OPTION_VALUE]}
 
+        parent_ids = {folder["id"]: folder["parent_id"] for folder in self.all_template_folders}
+        options_by_parent_id = defaultdict(list)
+        for option in self:
+            if option.data in parent_ids:
+                options_by_parent_id[parent_ids[option.data]].append(option)
+
         # add entries for all other children
         for option in self:
             if option.data == self.NONE_OPTION_VALUE:
-                child_ids = [folder["id"] for folder in self.all_template_folders if folder["parent_id"] is None]
-                key = self.NONE_OPTION_VALUE
+                child_map[self.NONE_OPTION_VALUE] = list(options_by_parent_id[None])
             else:
-                child_ids = [folder["id"] for folder in self.all_template_folders if folder["parent_id"] == option.data]
-                key = option.data
-
-            child_map[key] = [option for option in self if option.data in child_ids]
+                child_map[option.data] = list(options_by_parent_id[option.data])
 
         return child_map
 
@@ -1069,6 +1072,10 @@ class SelectCsvFromS3Form(StripWhitespaceForm):
     s3_files = RadioField()
 
 
+class SearchBulkSendUploadsForm(StripWhitespaceForm):
+    prefix = SearchField(_l("File name starts with"))
+
+
 class ServiceReplyToEmailForm(StripWhitespaceForm):
     label_text = _l("Reply-to email address")
     email_address = email_address(label=_l(label_text), gov_user=False)
@@ -1,5 +1,4 @@
 import re
-import time
 
 import pwnedpasswords
 from flask import current_app
@@ -12,9 +11,20 @@ from wtforms import ValidationError
 from wtforms.validators import Email
 
 from app import formatted_list, service_api_client
+from app.breached_passwords import is_breached_password
 from app.main._blocked_passwords import blocked_passwords
 from app.utils import Spreadsheet, email_safe, email_safe_name, is_gov_user
 
+BLOCKED_PASSWORDS = frozenset(blocked_passwords)
+
+
+def _check_pwned_passwords(password):
+    try:
+        return pwnedpasswords.check(password) > 0
+    except Exception:
+        current_app.logger.warning("Could not check password against the Have I Been Pwned API")
+        return False
+
 
 class Blocklist:
     def __init__(self, message=None):
@@ -23,25 +33,17 @@ class Blocklist:
         self.message = message
 
     def __call__(self, form, field):
-        if current_app.config.get("HIPB_ENABLED", None):
-            hibp_bad_password_found = False
-            for i in range(0, 3):  # Try 3 times. If the HIPB API is down then fall back to the old banlist.
-                try:
-                    response = pwnedpasswords.check(field.data)
-                    if response > 0:
-                        hibp_bad_password_found = True
-                        break
-                    elif response == 0:
-                        return
-
-                except Exception:
-                    time.sleep(0.5)
-                    pass
-
-            if hibp_bad_password_found:
-                raise ValidationError(self.message)
-
-        if field.data in blocked_passwords:
+        if field.data in BLOCKED_PASSWORDS:
+            raise ValidationError(self.message)
+
+        breached = is_breached_password(field.data)
+        # Without a local filter of breached passwords, fall back to asking
+        # the Have I Been Pwned API, once, but only if that’s been turned on
+        # because it holds up the request
+        if breached is None and current_app.config.get("HIPB_ENABLED", None):
+            breached = _check_pwned_passwords(field.data)
+
+        if breached:
             raise ValidationError(self.message)
 
 
@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 
+import hashlib
+import json
 from datetime import datetime
 
 from flask import (
@@ -120,6 +122,7 @@ def view_job(service_id, job_id):
             status=request.args.get("status", ""),
         ),
         partials=partials,
+        updates_cursor=partials["cursor"],
         just_sent=bool(request.args.get("just_sent") == "yes" and template["template_type"] == "letter"),
         just_sent_message=just_sent_message,
         can_cancel_letter_job=can_cancel_letter_job,
@@ -198,6 +201,10 @@ def cancel_letter_job(service_id, job_id):
 def view_job_updates(service_id, job_id):
 
     job = job_api_client.get_job(service_id, job_id)["data"]
+    cursor = request.args.get("cursor")
+
+    if not job_has_changed_since(job, cursor):
+        return jsonify(cursor=cursor)
 
     return jsonify(
         **get_job_partials(
@@ -207,6 +214,7 @@ def view_job_updates(service_id, job_id):
                 template_id=job["template"],
                 version=job["template_version"],
             )["data"],
+            cursor=cursor,
         )
     )
 
@@ -388,44 +396,91 @@ def _get_job_counts(job):
     ]
 
 
-def get_job_partials(job, template):
+def _digest(*values):
+    return hashlib.md5(json.dumps(values, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+def _get_job_digest(job):
+    return _digest(
+        job["job_status"],
+        job.get("notification_count", 0),
+        job.get("notifications_requested", 0),
+        job.get("notifications_delivered", 0),
+        job.get("notifications_failed", 0),
+        job.get("scheduled_for"),
+        job.get("processing_started"),
+        # Notifications move between statuses within sending and failed
+        # without the totals changing, but the table shows their statuses
+        sorted(job.get("statistics", []), key=lambda statistic: statistic["status"]),
+    )
+
+
+def job_has_changed_since(job, cursor):
+    return not cursor or _get_job_digest(job) != cursor.split(".")[0]
+
+
+def get_job_partials(job, template, cursor=None):
+    """
+    Renders the parts of the job page which change while the job is being sent,
+    along with a cursor describing what was rendered.
+
+    Given the cursor from a previous response only the parts which have changed
+    since are rendered, and if the job itself hasn’t changed the notifications
+    aren’t fetched either.
+    """
+    previous = dict(zip(["job", "counts", "status", "notifications"], (cursor or "").split(".")))
+    digests = {
+        "job": _get_job_digest(job),
+        "counts": _digest(
+            job["job_status"],
+            job.get("notification_count", 0),
+            job.get("notifications_delivered", 0),
+            job.get("notifications_failed", 0),
+        ),
+        "status": _digest(job["job_status"], job.get("scheduled_for"), job.get("processing_started")),
+    }
+    if not job_has_changed_since(job, cursor):
+        return {"cursor": cursor}
+
     filter_args = parse_filter_args(request.args)
     filter_args["status"] = set_status_filters(filter_args)
     notifications = notification_api_client.get_notifications_for_service(job["service"], job["id"], status=filter_args["status"])
+    digests["notifications"] = _digest(
+        job["job_status"],
+        job.get("notifications_requested", 0),
+        notifications["notifications"],
+        notifications.get("links", {}).get("next"),
+    )
+    changed = {key for key, digest in digests.items() if digest != previous.get(key)}
 
-    if template["template_type"] == "letter":
-        # there might be no notifications if the job has only just been created and the tasks haven't run yet
-        if notifications["notifications"]:
-            postage = notifications["notifications"][0]["postage"]
-        else:
-            postage = template["postage"]
+    partials = {
+        "cursor": ".".join(digests[key] for key in ["job", "counts", "status", "notifications"]),
+        "can_letter_job_be_cancelled": _can_letter_job_be_cancelled(job, template, notifications),
+    }
 
-        counts = render_template(
-            "partials/jobs/count-letters.html",
-            total=job.get("notification_count", 0),
-            delivery_estimate=get_letter_timings(job["created_at"], postage=postage).earliest_delivery,
-        )
-    else:
-        counts = render_template(
-            "partials/count.html",
-            counts=_get_job_counts(job),
-            status=filter_args["status"],
-        )
-    service_data_retention_days = current_service.get_days_of_retention(template["template_type"])
-    can_letter_job_be_cancelled = False
-    if template["template_type"] == "letter":
-        not_cancellable = [n for n in notifications["notifications"] if n["status"] not in CANCELLABLE_JOB_LETTER_STATUSES]
-        job_created = job["created_at"][:-6]
-        if (
-            not letter_can_be_cancelled("created", datetime.strptime(job_created, "%Y-%m-%dT%H:%M:%S.%f"))
-            or len(not_cancellable) != 0
-        ):
-            can_letter_job_be_cancelled = False
+    if "counts" in changed:
+        if template["template_type"] == "letter":
+            # there might be no notifications if the job has only just been created and the tasks haven't run yet
+            if notifications["notifications"]:
+                postage = notifications["notifications"][0]["postage"]
+            else:
+                postage = template["postage"]
+
+            partials["counts"] = render_template(
+                "partials/jobs/count-letters.html",
+                total=job.get("notification_count", 0),
+                delivery_estimate=get_letter_timings(job["created_at"], postage=postage).earliest_delivery,
+            )
         else:
-            can_letter_job_be_cancelled = True
-    return {
-        "counts": counts,
-        "notifications": render_template(
+            partials["counts"] = render_template(
+                "partials/count.html",
+                counts=_get_job_counts(job),
+                status=filter_args["status"],
+            )
+
+    if "notifications" in changed:
+        service_data_retention_days = current_service.get_days_of_retention(template["template_type"])
+        partials["notifications"] = render_template(
             "partials/jobs/notifications.html",
             notifications=list(add_preview_of_content_to_notifications(notifications["notifications"])),
             more_than_one_page=bool(notifications.get("links", {}).get("next")),
@@ -443,17 +498,27 @@ def get_job_partials(job, template):
             job=job,
             template=template,
             template_version=job["template_version"],
-        ),
-        "status": render_template(
+        )
+
+    if "status" in changed:
+        partials["status"] = render_template(
             "partials/jobs/status.html",
             job=job,
             template=template,
             template_type=template["template_type"],
             template_version=job["template_version"],
             letter_print_day=get_letter_printing_statement("created", job["created_at"]),
-        ),
-        "can_letter_job_be_cancelled": can_letter_job_be_cancelled,
-    }
+        )
+
+    return partials
+
+
+def _can_letter_job_be_cancelled(job, template, notifications):
+    if template["template_type"] != "letter":
+        return False
+    not_cancellable = [n for n in notifications["notifications"] if n["status"] not in CANCELLABLE_JOB_LETTER_STATUSES]
+    job_created = job["created_at"][:-6]
+    return letter_can_be_cancelled("created", datetime.strptime(job_created, "%Y-%m-%dT%H:%M:%S.%f")) and not not_cancellable
 
 
 def add_preview_of_content_to_notifications(notifications):
@@ -1,18 +1,19 @@
+import hashlib
 import itertools
+import json
 import re
 from collections import OrderedDict
 from datetime import datetime
 
-from flask import abort, flash, redirect, render_template, request, url_for
+from flask import abort, current_app, flash, redirect, render_template, request, url_for
 from notifications_python_client.errors import HTTPError
 from requests import RequestException
 
 from app import (
-    billing_api_client,
+    cache,
     complaint_api_client,
     format_date_numeric,
     letter_jobs_client,
-    notification_api_client,
     platform_stats_api_client,
     service_api_client,
 )
@@ -26,7 +27,13 @@ from app.main.forms import (
     ReturnedLettersForm,
 )
 from app.notify_client.api_key_api_client import api_key_api_client
+from app.report_snapshots import (
+    get_usage_for_all_services,
+    notification_status_by_service_report,
+    send_method_stats_by_service_report,
+)
 from app.statistics_utils import (
+    get_api_date_converter,
     get_formatted_percentage,
     get_formatted_percentage_two_dp,
 )
@@ -36,6 +43,8 @@ from app.utils import (
     generate_next_dict,
     generate_previous_dict,
     get_page_from_request,
+    stream_csv_report,
+    stream_template,
     user_has_permissions,
     user_is_platform_admin,
 )
@@ -180,19 +189,57 @@ def platform_admin_services():
         api_args["start_date"] = form.start_date.data
         api_args["end_date"] = form.end_date.data or datetime.utcnow().date()
 
-    services = filter_and_sort_services(
-        service_api_client.get_services(api_args)["data"],
+    sort = request.args.get("sort", "usage")
+    page = get_page_from_request()
+    if sort not in SERVICE_SORT_ORDERS or page is None or page < 1:
+        abort(404)
+
+    services, global_stats = get_services_snapshot(
+        api_args,
         trial_mode_services=request.endpoint == "main.trial_services",
+        sort=sort,
     )
 
-    return render_template(
+    page_size = current_app.config["PLATFORM_ADMIN_SERVICES_PAGE_SIZE"]
+    if page > 1 and (page - 1) * page_size >= len(services):
+        abort(404)
+    url_args = {key: value for key, value in request.args.items() if key != "page"}
+
+    return stream_template(
         "views/platform-admin/services.html",
         include_from_test_key=form.include_from_test_key.data,
         form=form,
-        services=list(format_stats_by_service(services)),
+        services=services[(page - 1) * page_size : page * page_size],
         page_title="{} services".format("Trial mode" if request.endpoint == "main.trial_services" else "Live"),
-        global_stats=create_global_stats(services),
+        global_stats=global_stats,
+        sort=sort,
+        sort_orders={key: order[0] for key, order in SERVICE_SORT_ORDERS.items()},
+        prev_page=generate_previous_dict(request.endpoint, None, page, url_args) if page > 1 else None,
+        next_page=generate_next_dict(request.endpoint, None, page, url_args) if page * page_size < len(services) else None,
+    )
+
+
+def get_services_snapshot(api_args, trial_mode_services, sort):
+    """
+    Returns the sorted and formatted services, and the stats across all
+    of them, for a page of the live or trial services list. These are
+    kept for a short time so that going through the pages, or changing
+    the sort order, doesn’t fetch every service again.
+    """
+    cache_key = "platform-admin-services-{}".format(
+        hashlib.sha256(json.dumps([api_args, trial_mode_services, sort], sort_keys=True, default=str).encode("utf-8")).hexdigest()
     )
+    snapshot = cache.get(cache_key)
+    if snapshot is None:
+        snapshot = summarise_services(
+            filter_and_sort_services(
+                service_api_client.get_services(api_args)["data"],
+                trial_mode_services=trial_mode_services,
+                sort=sort,
+            )
+        )
+        cache.set(cache_key, snapshot, timeout=current_app.config["PLATFORM_ADMIN_SERVICES_CACHE_TTL"])
+    return snapshot
 
 
 @main.route("/platform-admin/live-api-keys", endpoint="live_api_keys")
@@ -234,25 +281,13 @@ def live_services_csv():
             ("free_sms_fragment_limit", "Free sms allowance"),
         ]
     )
+    convert_date = get_api_date_converter("%d-%m-%Y")
 
-    # initialise with header row
-    live_services_data = [[x for x in column_names.values()]]
-
-    for row in results:
-        if row["live_date"]:
-            row["live_date"] = datetime.strptime(row["live_date"], "%a, %d %b %Y %X %Z").strftime("%d-%m-%Y")
-
-        live_services_data.append([row[api_key] for api_key in column_names.keys()])
-
-    return (
-        Spreadsheet.from_rows(live_services_data).as_csv_data,
-        200,
-        {
-            "Content-Type": "text/csv; charset=utf-8",
-            "Content-Disposition": 'inline; filename="{} live services report.csv"'.format(
-                format_date_numeric(datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%fZ")),
-            ),
-        },
+    return stream_csv_report(
+        list(column_names.values()),
+        ([convert_date(row[api_key]) if api_key == "live_date" else row[api_key] for api_key in column_names] for row in results),
+        "{} live services report.csv".format(format_date_numeric(datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%fZ"))),
+        disposition="inline",
     )
 
 
@@ -268,6 +303,7 @@ def performance_platform_xlsx():
         "service",
         "count",
     ]
+    convert_date = get_api_date_converter("%Y-%m-%dT%H:%M:%SZ")
     live_services_data = []
     live_services_data.append(live_services_columns)
     for row in results:
@@ -276,9 +312,7 @@ def performance_platform_xlsx():
                 row["service_id"],
                 row["organisation_name"],
                 row["service_name"],
-                datetime.strptime(row["live_date"], "%a, %d %b %Y %X %Z").strftime("%Y-%m-%dT%H:%M:%S") + "Z"
-                if row["live_date"]
-                else None,
+                convert_date(row["live_date"]) or None,
                 "notification",
                 1,
             ]
@@ -310,15 +344,11 @@ def trial_report_csv():
         "notification_sum",
     ]
 
-    return (
-        Spreadsheet.from_rows([headers] + data).as_csv_data,
-        200,
-        {
-            "Content-Type": "text/csv; charset=utf-8",
-            "Content-Disposition": 'inline; filename="{} trial report.csv"'.format(
-                format_date_numeric(datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%fZ")),
-            ),
-        },
+    return stream_csv_report(
+        headers,
+        data,
+        "{} trial report.csv".format(format_date_numeric(datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%fZ"))),
+        disposition="inline",
     )
 
 
@@ -344,26 +374,13 @@ def notifications_sent_by_service():
             "count_sent",
         ]
         # The api returns a dict and we convert the data to a list.
-        result = notification_api_client.get_notification_status_by_service(start_date, end_date)
-        result = list(
-            map(
-                lambda row: list(map(lambda key: row[key], headers)),
-                result,
-            )
-        )
+        result = notification_status_by_service_report.get_rows(start_date, end_date)
+        convert_date = get_api_date_converter("%Y-%m-%d")
 
-        for row in result:
-            row[0] = datetime.strptime(row[0], "%a, %d %b %Y %X %Z").strftime("%Y-%m-%d")
-
-        return (
-            Spreadsheet.from_rows([headers] + result).as_csv_data,
-            200,
-            {
-                "Content-Type": "text/csv; charset=utf-8",
-                "Content-Disposition": 'attachment; filename="{} to {} notification status per service report.csv"'.format(
-                    start_date, end_date
-                ),
-            },
+        return stream_csv_report(
+            headers,
+            ([convert_date(row[headers[0]])] + [row[key] for key in headers[1:]] for row in result),
+            "{} to {} notification status per service report.csv".format(start_date, end_date),
         )
 
     return render_template("views/platform-admin/notifications_by_service.html", form=form)
@@ -386,17 +403,12 @@ def send_method_stats_by_service():
             "send_method",
             "count",
         ]
-        result = platform_stats_api_client.get_send_method_stats_by_service(start_date, end_date)
-
-        return (
-            Spreadsheet.from_rows([headers] + result).as_csv_data,
-            200,
-            {
-                "Content-Type": "text/csv; charset=utf-8",
-                "Content-Disposition": 'attachment; filename="{} to {} send method per service report.csv"'.format(
-                    start_date, end_date
-                ),
-            },
+        result = send_method_stats_by_service_report.get_rows(start_date, end_date)
+
+        return stream_csv_report(
+            headers,
+            result,
+            "{} to {} send method per service report.csv".format(start_date, end_date),
         )
 
     return render_template("views/platform-admin/send_method_stats_by_service.html", form=form)
@@ -421,30 +433,24 @@ def usage_for_all_services():
             "letter_breakdown",
         ]
 
-        result = billing_api_client.get_usage_for_all_services(start_date, end_date)
-        rows = [
-            [
-                r["organisation_id"],
-                r["organisation_name"],
-                r["service_id"],
-                r["service_name"],
-                r["sms_cost"],
-                r["sms_fragments"],
-                r["letter_cost"],
-                r["letter_breakdown"].strip(),
-            ]
-            for r in result
-        ]
-        if rows:
-            return (
-                Spreadsheet.from_rows([headers] + rows).as_csv_data,
-                200,
-                {
-                    "Content-Type": "text/csv; charset=utf-8",
-                    "Content-Disposition": 'attachment; filename="Usage for all services from {} to {}.csv"'.format(
-                        start_date, end_date
-                    ),
-                },
+        result = get_usage_for_all_services(start_date, end_date)
+        if result:
+            return stream_csv_report(
+                headers,
+                (
+                    [
+                        r["organisation_id"],
+                        r["organisation_name"],
+                        r["service_id"],
+                        r["service_name"],
+                        r["sms_cost"],
+                        r["sms_fragments"],
+                        r["letter_cost"],
+                        r["letter_breakdown"].strip(),
+                    ]
+                    for r in result
+                ),
+                "Usage for all services from {} to {}.csv".format(start_date, end_date),
             )
         else:
             flash("No results for dates")
@@ -631,6 +637,7 @@ def clear_cache():
                 ],
             ),
             ("gc-articles", ["gc-articles--*", "gc-articles-fallback--*"]),
+            ("platform_admin_reports", ["report-snapshot-*"]),
         ]
     )
 
@@ -661,17 +668,33 @@ def is_archived(service):
     return service["name"].find("_archive")
 
 
-def filter_and_sort_services(services, trial_mode_services=False):
+SERVICE_SORT_ORDERS = {
+    "usage": (
+        "Most used",
+        lambda service: (service["active"], sum_service_usage(service), service["created_at"]),
+        True,
+    ),
+    "newest": (
+        "Newest",
+        lambda service: (service["active"], service["created_at"]),
+        True,
+    ),
+    "name": (
+        "Name",
+        lambda service: (not service["active"], service["name"].lower()),
+        False,
+    ),
+}
+
+
+def filter_and_sort_services(services, trial_mode_services=False, sort="usage"):
+    _, key, reverse = SERVICE_SORT_ORDERS[sort]
     data = [
         service
         for service in sorted(
             services,
-            key=lambda service: (
-                service["active"],
-                sum_service_usage(service),
-                service["created_at"],
-            ),
-            reverse=True,
+            key=key,
+            reverse=reverse,
         )
         if service["restricted"] == trial_mode_services
     ]
@@ -679,36 +702,64 @@ def filter_and_sort_services(services, trial_mode_services=False):
     return list(filter(is_archived, data))
 
 
-def create_global_stats(services):
-    stats = {
+def _get_empty_global_stats():
+    return {
         "email": {"delivered": 0, "failed": 0, "requested": 0},
         "sms": {"delivered": 0, "failed": 0, "requested": 0},
         "letter": {"delivered": 0, "failed": 0, "requested": 0},
     }
-    for service in services:
-        for msg_type, status in itertools.product(("sms", "email", "letter"), ("delivered", "failed", "requested")):
-            stats[msg_type][status] += service["statistics"][msg_type][status]
 
+
+def _add_to_global_stats(stats, service):
+    for msg_type, status in itertools.product(("sms", "email", "letter"), ("delivered", "failed", "requested")):
+        stats[msg_type][status] += service["statistics"][msg_type][status]
+
+
+def _add_failure_rates(stats):
     for stat in stats.values():
         stat["failure_rate"] = get_formatted_percentage(stat["failed"], stat["requested"])
     return stats
 
 
+def create_global_stats(services):
+    stats = _get_empty_global_stats()
+    for service in services:
+        _add_to_global_stats(stats, service)
+    return _add_failure_rates(stats)
+
+
+def summarise_services(services):
+    """
+    Formats each service and adds up the stats across all of them in the
+    same pass
+    """
+    stats = _get_empty_global_stats()
+    formatted_services = []
+    for service in services:
+        _add_to_global_stats(stats, service)
+        formatted_services.append(format_service_stats(service))
+    return formatted_services, _add_failure_rates(stats)
+
+
+def format_service_stats(service):
+    return {
+        "id": service["id"],
+        "name": service["name"],
+        "stats": {
+            msg_type: {
+                "sending": stats["requested"] - stats["delivered"] - stats["failed"],
+                "delivered": stats["delivered"],
+                "failed": stats["failed"],
+            }
+            for msg_type, stats in service["statistics"].items()
+        },
+        "restricted": service["restricted"],
+        "research_mode": service["research_mode"],
+        "created_at": service["created_at"],
+        "active": service["active"],
+    }
+
+
 def format_stats_by_service(services):
     for service in services:
-        yield {
-            "id": service["id"],
-            "name": service["name"],
-            "stats": {
-                msg_type: {
-                    "sending": stats["requested"] - stats["delivered"] - stats["failed"],
-                    "delivered": stats["delivered"],
-                    "failed": stats["failed"],
-                }
-                for msg_type, stats in service["statistics"].items()
-            },
-            "restricted": service["restricted"],
-            "research_mode": service["research_mode"],
-            "created_at": service["created_at"],
-            "active": service["active"],
-        }
+        yield format_service_stats(service)
@@ -1,5 +1,6 @@
-import itertools
+import hashlib
 import json
+from datetime import timedelta
 from string import ascii_uppercase
 from zipfile import BadZipFile
 
@@ -38,30 +39,37 @@ from app import (
     service_api_client,
     template_statistics_client,
 )
+from app.csv_validation import index_rows, recipients_from_rows, validate_in_chunks
 from app.main import main
 from app.main.forms import (
     ChooseTimeForm,
     CsvUploadForm,
+    SearchBulkSendUploadsForm,
     SelectCsvFromS3Form,
     SetSenderForm,
     get_placeholder_form_instance,
 )
 from app.main.views.dashboard import aggregate_notifications_stats
-from app.models.user import Users
 from app.s3_client.s3_csv_client import (
     copy_bulk_send_file_to_uploads,
+    get_bulk_send_uploads,
     list_bulk_send_uploads,
     s3download,
+    s3download_range,
     s3upload,
     set_metadata_on_csv_upload,
 )
+from app.sms_fragment_counter import SMSFragmentCounter
 from app.template_previews import TemplatePreview, get_page_count_for_letter
 from app.utils import (
     PermanentRedirect,
     Spreadsheet,
     email_or_sms_not_enabled,
-    get_errors_for_csv,
+    generate_next_dict,
+    generate_previous_dict,
+    get_errors_for_csv_row_counts,
     get_help_argument,
+    get_page_from_request,
     get_template,
     should_skip_template_page,
     unicode_truncate,
@@ -88,6 +96,183 @@ def get_csv_max_rows(service_id):
     return int(current_app.config["CSV_MAX_ROWS"])
 
 
+# Uploads are stored under a fresh UUID and never rewritten, so anything derived
+# from one only has to be thrown away when the template changes version.
+CSV_CHECK_CACHE_TTL = int(timedelta(hours=2).total_seconds())
+
+# Each offset in the row index takes up the same number of characters, so
+# the offsets for any rows can be read without reading the whole index
+CSV_ROW_OFFSET_WIDTH = 12
+
+
+def csv_column_headers_cache_key(upload_id):
+    return "csv-upload-{}-column-headers".format(upload_id)
+
+
+def csv_row_index_cache_key(upload_id):
+    return "csv-upload-{}-row-index".format(upload_id)
+
+
+def csv_check_cache_key(upload_id, template_id, template_version, international_sms, safelist):
+    return "csv-upload-{}-check-{}-{}-{}-{}".format(
+        upload_id,
+        template_id,
+        template_version,
+        international_sms,
+        # Rows are checked against the safelist while the service is in trial
+        # mode, so going live or changing the safelist changes the errors
+        hashlib.sha256(json.dumps(sorted(map(str, safelist))).encode("utf-8")).hexdigest() if safelist is not None else "live",
+    )
+
+
+def set_csv_row_index(upload_id, contents):
+    if not redis_client.active:
+        return
+    column_headers, offsets = index_rows(contents)
+    pipeline = redis_client.redis_store.pipeline(transaction=False)
+    pipeline.set(csv_column_headers_cache_key(upload_id), json.dumps(column_headers), ex=CSV_CHECK_CACHE_TTL)
+    pipeline.set(
+        csv_row_index_cache_key(upload_id),
+        "".join("{:0{}x}".format(offset, CSV_ROW_OFFSET_WIDTH) for offset in offsets),
+        ex=CSV_CHECK_CACHE_TTL,
+    )
+    pipeline.execute()
+
+
+def get_recipients_from_row_index(service_id, upload_id, start_row, end_row, **recipient_csv_kwargs):
+    """
+    Returns a `RecipientCSV` of just the rows of an upload from `start_row` up
+    to, but not including, `end_row`, only downloading those rows. Returns
+    `None` if the upload hasn’t been indexed.
+    """
+    if not redis_client.active:
+        return None
+    column_headers = redis_client.get(csv_column_headers_cache_key(upload_id))
+    offsets = redis_client.redis_store.getrange(
+        csv_row_index_cache_key(upload_id),
+        start_row * CSV_ROW_OFFSET_WIDTH,
+        (end_row + 1) * CSV_ROW_OFFSET_WIDTH - 1,
+    )
+    if column_headers is None or len(offsets or "") != (end_row - start_row + 1) * CSV_ROW_OFFSET_WIDTH:
+        return None
+    return recipients_from_rows(
+        json.loads(column_headers),
+        s3download_range(
+            service_id, upload_id, int(offsets[:CSV_ROW_OFFSET_WIDTH], 16), int(offsets[-CSV_ROW_OFFSET_WIDTH:], 16)
+        ),
+        **recipient_csv_kwargs,
+    )
+
+
+def get_displayed_and_preview_recipients(service_id, upload_id, preview_row, count_of_recipients, **recipient_csv_kwargs):
+    """
+    Reads only the rows shown on the check page and, if it isn’t one of them,
+    the row being previewed. Returns `(None, None)` if the upload hasn’t been
+    indexed.
+    """
+    recipients = get_recipients_from_row_index(
+        service_id,
+        upload_id,
+        0,
+        min(recipient_csv_kwargs["max_initial_rows_shown"], count_of_recipients),
+        **recipient_csv_kwargs,
+    )
+    if recipients is None or not len(recipients) < preview_row - 1 <= count_of_recipients:
+        return recipients, None
+
+    preview_recipients = get_recipients_from_row_index(
+        service_id, upload_id, preview_row - 2, preview_row - 1, **recipient_csv_kwargs
+    )
+    if preview_recipients is None:
+        return None, None
+    return recipients, preview_recipients[0]
+
+
+def get_checked_recipients(service_id, upload_id, db_template, template, preview_row, **recipient_csv_kwargs):
+    """
+    Returns the recipients in an upload, the summary of checking them and the
+    row being previewed, if it had to be read separately. An upload without
+    any errors which has been checked before is only partly read.
+    """
+    remaining_messages = recipient_csv_kwargs["remaining_messages"]
+    summary_key = csv_check_cache_key(
+        upload_id,
+        db_template["id"],
+        db_template["version"],
+        recipient_csv_kwargs["international_sms"],
+        recipient_csv_kwargs["safelist"],
+    )
+    summary = get_cached_csv_check_summary(summary_key)
+    recipients = preview_recipient = None
+
+    if summary and can_check_from_row_index(summary, remaining_messages):
+        recipients, preview_recipient = get_displayed_and_preview_recipients(
+            service_id, upload_id, preview_row, summary["count_of_recipients"], **recipient_csv_kwargs
+        )
+
+    if recipients is None:
+        contents = s3download(service_id, upload_id)
+        recipients = get_recipients_from_csv(service_id, contents, **recipient_csv_kwargs)
+        if summary is None:
+            summary = set_csv_check_summary(summary_key, db_template, template, recipients)
+        if can_check_from_row_index(summary, remaining_messages):
+            set_csv_row_index(upload_id, contents)
+
+    return recipients, summary, preview_recipient
+
+
+def get_recipients_from_csv(service_id, contents, **recipient_csv_kwargs):
+    processes = current_app.config["CSV_VALIDATION_PROCESSES"]
+    # Forking worker processes takes longer than validating a small file,
+    # so they’re only used for big ones. Lines overcount rows with line
+    # breaks in them, which doesn’t matter here
+    if (
+        processes > 1
+        and contents.count("\n") >= current_app.config["CSV_VALIDATION_MIN_ROWS_FOR_PROCESSES"]
+        and service_can_bulk_send(service_id)
+    ):
+        return validate_in_chunks(
+            contents,
+            processes=processes,
+            chunk_size=current_app.config["CSV_VALIDATION_CHUNK_SIZE"],
+            **recipient_csv_kwargs,
+        )
+    return RecipientCSV(contents, **recipient_csv_kwargs)
+
+
+def count_sms_parts_to_send(template, recipients):
+    counter = SMSFragmentCounter(template, processes=current_app.config["SMS_FRAGMENT_COUNT_PROCESSES"])
+    return counter.count(recipients[index].recipient_and_personalisation for index in range(len(recipients)))
+
+
+def get_cached_csv_check_summary(redis_key):
+    cached = redis_client.get(redis_key)
+    return json.loads(cached) if cached else None
+
+
+def set_csv_check_summary(redis_key, db_template, template, recipients):
+    sms_parts_to_send = 0
+    if db_template["template_type"] == "sms":
+        sms_parts_to_send = count_sms_parts_to_send(template, recipients)
+
+    summary = {
+        "count_of_recipients": len(recipients),
+        "rows_with_bad_recipients": len(list(recipients.rows_with_bad_recipients)),
+        "rows_with_missing_data": len(list(recipients.rows_with_missing_data)),
+        "sms_parts_to_send": sms_parts_to_send,
+        "has_errors": recipients.has_errors,
+    }
+    redis_client.set(redis_key, json.dumps(summary), ex=CSV_CHECK_CACHE_TTL)
+    return summary
+
+
+def can_check_from_row_index(summary, remaining_messages):
+    # The page lists every row with an error, so only an upload without any
+    # errors can be checked from its first few rows. Whether it has more rows
+    # than the service can send today changes as the day goes on.
+    return not summary.get("has_errors", True) and summary["count_of_recipients"] <= remaining_messages
+
+
 def get_example_csv_fields(column_headers, use_example_as_example, submitted_fields):
     if use_example_as_example:
         return ["example" for header in column_headers]
@@ -177,7 +362,7 @@ def send_messages(service_id, template_id):
         try:
             upload_id = s3upload(
                 service_id,
-                Spreadsheet.from_file(form.file.data, filename=form.file.data.filename).as_dict,
+                Spreadsheet.from_file(form.file.data, filename=form.file.data.filename).as_streaming_dict,
                 current_app.config["AWS_REGION"],
             )
             return redirect(
@@ -264,9 +449,18 @@ def s3_send(service_id, template_id):
         sms_sender=sms_sender,
     )
 
-    s3_objects = list_bulk_send_uploads()
+    page = get_page_from_request()
+    if page is None or page < 1:
+        abort(404, "Invalid page argument ({}).".format(request.args.get("page")))
+    search_form = SearchBulkSendUploadsForm(request.args, meta={"csrf": False})
+    prefix = search_form.prefix.data or ""
+
+    s3_objects, has_next_page = list_bulk_send_uploads(prefix=prefix, page=page)
     form = SelectCsvFromS3Form(
-        choices=[(x.key, x.key) for x in s3_objects],  # (value, label)
+        # Files move down the pages as new ones are uploaded, so the file
+        # chosen can be any which matches the search, not just one still
+        # on the page it was chosen from
+        choices=[(x.key, x.key) for x in (get_bulk_send_uploads(prefix) if request.method == "POST" else s3_objects)],
         label="Select a file from Amazon S3",
     )
 
@@ -295,14 +489,21 @@ def s3_send(service_id, template_id):
                 ).format(form.s3_files.data)
             )
 
+    form.s3_files.choices = [(x.key, x.key) for x in s3_objects]  # (value, label)
+
     column_headings = get_spreadsheet_column_headings_from_template(template)
 
+    url_args = {"template_id": template_id, "prefix": prefix} if prefix else {"template_id": template_id}
+
     return render_template(
         "views/s3-send.html",
         template=template,
         column_headings=list(ascii_uppercase[: len(column_headings)]),
         example=[column_headings, get_example_csv_rows(template)],
         form=form,
+        search_form=search_form,
+        prev_page=generate_previous_dict("main.s3_send", service_id, page, url_args=url_args) if page > 1 else None,
+        next_page=generate_next_dict("main.s3_send", service_id, page, url_args=url_args) if has_next_page else None,
     )
 
 
@@ -642,8 +843,6 @@ def _check_messages(service_id, template_id, upload_id, preview_row, letters_as_
     sms_fragments_sent_today = daily_sms_fragment_count(service_id)
     remaining_sms_message_fragments = current_service.sms_daily_limit - sms_fragments_sent_today
 
-    contents = s3download(service_id, upload_id)
-
     db_template = current_service.get_template_with_user_permission_or_403(template_id, current_user)
 
     email_reply_to = None
@@ -670,15 +869,13 @@ def _check_messages(service_id, template_id, upload_id, preview_row, letters_as_
         sms_sender=sms_sender,
         page_count=get_page_count_for_letter(db_template),
     )
-    recipients = RecipientCSV(
-        contents,
+    safelist = current_service.trial_mode_safelist if current_service.trial_mode else None
+    recipient_csv_kwargs = dict(
         template_type=template.template_type,
         placeholders=template.placeholders,
         max_initial_rows_shown=int(request.args.get("show") or 10),
         max_errors_shown=50,
-        safelist=itertools.chain.from_iterable([user.name, user.mobile_number, user.email_address] for user in Users(service_id))
-        if current_service.trial_mode
-        else None,
+        safelist=safelist,
         remaining_messages=remaining_messages,
         international_sms=current_service.has_permission("international_sms"),
         max_rows=get_csv_max_rows(service_id),
@@ -692,23 +889,16 @@ def _check_messages(service_id, template_id, upload_id, preview_row, letters_as_
         back_link = url_for(".send_messages", service_id=service_id, template_id=template.id)
         choose_time_form = ChooseTimeForm()
 
-    sms_parts_to_send = 0
-    is_sms_parts_estimated = False
-    if db_template["template_type"] == "sms":
-        if len(recipients) > 1000:
-            # estimate using the first row
-            template.values = recipients[0].recipient_and_personalisation
-            sms_parts_to_send = template.fragment_count * len(recipients)
-            is_sms_parts_estimated = True
-        else:
-            for row in range(len(recipients)):
-                template.values = recipients[row].recipient_and_personalisation
-                sms_parts_to_send += template.fragment_count
-
     if preview_row < 2:
         abort(404)
 
-    if preview_row < len(recipients) + 2:
+    recipients, summary, preview_recipient = get_checked_recipients(
+        service_id, upload_id, db_template, template, preview_row, **recipient_csv_kwargs
+    )
+
+    if preview_recipient is not None:
+        template.values = preview_recipient.recipient_and_personalisation
+    elif preview_row < summary["count_of_recipients"] + 2:
         template.values = recipients[preview_row - 2].recipient_and_personalisation
     elif preview_row > 2:
         abort(404)
@@ -717,16 +907,19 @@ def _check_messages(service_id, template_id, upload_id, preview_row, letters_as_
         recipients=recipients,
         template=template,
         errors=recipients.has_errors,
-        row_errors=get_errors_for_csv(recipients, template.template_type),
-        count_of_recipients=len(recipients),
+        row_errors=get_errors_for_csv_row_counts(
+            summary["rows_with_bad_recipients"],
+            summary["rows_with_missing_data"],
+            template.template_type,
+        ),
+        count_of_recipients=summary["count_of_recipients"],
         count_of_displayed_recipients=len(list(recipients.displayed_rows)),
         original_file_name=request.args.get("original_file_name", ""),
         upload_id=upload_id,
         form=CsvUploadForm(),
         remaining_messages=remaining_messages,
         remaining_sms_message_fragments=remaining_sms_message_fragments,
-        sms_parts_to_send=sms_parts_to_send,
-        is_sms_parts_estimated=is_sms_parts_estimated,
+        sms_parts_to_send=summary["sms_parts_to_send"],
         choose_time_form=choose_time_form,
         back_link=back_link,
         help=get_help_argument(),
@@ -1038,7 +1231,6 @@ def _check_notification(service_id, template_id, exception=None):
     sms_parts_data = {}
     if db_template["template_type"] == "sms":
         sms_parts_data["sms_parts_to_send"] = template.fragment_count
-        sms_parts_data["is_sms_parts_estimated"] = False
         sms_parts_data["sms_parts_requested"] = stats_daily["sms"]["requested"]
         sms_parts_data["sms_parts_remaining"] = current_service.sms_daily_limit - daily_sms_fragment_count(service_id)
         sms_parts_data["send_exceeds_daily_limit"] = sms_parts_data["sms_parts_to_send"] > sms_parts_data["sms_parts_remaining"]
@@ -5,6 +5,7 @@ from string import ascii_uppercase
 from dateutil.parser import parse
 from flask import (
     abort,
+    current_app,
     flash,
     jsonify,
     redirect,
@@ -49,12 +50,15 @@ from app.models.template_list import TemplateList, TemplateLists
 from app.template_previews import TemplatePreview, get_page_count_for_letter
 from app.utils import (
     email_or_sms_not_enabled,
+    get_page_from_request,
     get_template,
     should_skip_template_page,
     user_has_permissions,
     user_is_platform_admin,
 )
 
+TEMPLATE_SEARCH_PAGE_SIZE = 50
+
 form_objects = {
     "email": EmailTemplateForm,
     "sms": SMSTemplateForm,
@@ -239,7 +243,15 @@ def choose_template(service_id, template_type="all", template_folder_id=None):
 
     user_has_template_folder_permission = current_user.has_template_folder_permission(template_folder)
 
-    template_list = TemplateList(current_service, template_type, template_folder_id, current_user)
+    search_on_server = current_service.count_of_templates_and_folders > current_app.config["TEMPLATE_LIST_MAX_NESTED_ITEMS"]
+
+    template_list = TemplateList(
+        current_service,
+        template_type,
+        template_folder_id,
+        current_user,
+        recursive=not search_on_server,
+    )
 
     templates_and_folders_form = TemplateAndFoldersSelectionForm(
         all_template_folders=current_service.get_user_template_folders(current_user),
@@ -279,6 +291,14 @@ def choose_template(service_id, template_type="all", template_folder_id=None):
         template_nav_items=get_template_nav_items(template_folder_id, sending_view),
         template_type=template_type,
         search_form=SearchByNameForm(),
+        search_url=url_for(
+            ".search_templates",
+            service_id=service_id,
+            template_type=template_type,
+            view="sending" if sending_view else None,
+        )
+        if search_on_server
+        else None,
         templates_and_folders_form=templates_and_folders_form,
         move_to_children=templates_and_folders_form.move_to.children(),
         user_has_template_folder_permission=user_has_template_folder_permission,
@@ -304,6 +324,47 @@ def process_folder_management_form(form, current_folder_id):
     return redirect(request.url)
 
 
+@main.route("/services/<service_id>/templates/search")
+@user_has_permissions()
+def search_templates(service_id):
+    page = get_page_from_request()
+    if page is None or page < 1:
+        abort(404, "Invalid page argument ({}).".format(request.args.get("page")))
+
+    template_type = request.args.get("template_type", "all")
+    sending_view = request.args.get("view") == "sending"
+    results = [
+        item
+        for item in current_service.search_templates(
+            request.args.get("q", ""),
+            current_user,
+            include_content=request.args.get("content") == "1",
+        )
+        if template_type == "all" or item["type"] == "folder" or item["template_type"] == template_type
+    ]
+    start = (page - 1) * TEMPLATE_SEARCH_PAGE_SIZE
+
+    return jsonify(
+        results=[
+            dict(
+                item,
+                url=url_for(
+                    ".choose_template",
+                    service_id=service_id,
+                    template_type=template_type,
+                    template_folder_id=item["id"],
+                    view="sending" if sending_view else None,
+                )
+                if item["type"] == "folder"
+                else url_for(".view_template", service_id=service_id, template_id=item["id"]),
+            )
+            for item in results[start : start + TEMPLATE_SEARCH_PAGE_SIZE]
+        ],
+        total=len(results),
+        next_page=page + 1 if len(results) > start + TEMPLATE_SEARCH_PAGE_SIZE else None,
+    )
+
+
 def get_template_nav_label(value):
     return {
         "all": _l("All"),
@@ -505,7 +566,12 @@ def choose_template_to_copy(
 
         return render_template(
             "views/templates/copy.html",
-            services_templates_and_folders=TemplateList(service, template_folder_id=from_folder, user=current_user),
+            services_templates_and_folders=TemplateList(
+                service,
+                template_folder_id=from_folder,
+                user=current_user,
+                recursive=service.count_of_templates_and_folders <= current_app.config["TEMPLATE_LIST_MAX_NESTED_ITEMS"],
+            ),
             template_folder_path=service.get_template_folder_path(from_folder),
             from_service=service,
             search_form=SearchByNameForm(),
@@ -1,3 +1,4 @@
+from functools import lru_cache
 from itertools import chain
 
 from flask_babel import lazy_gettext as _l
@@ -18,6 +19,10 @@ roles_by_permission = {
 
 all_permissions = set(roles_by_permission.values())
 
+# Each role as a single bit, so that checking whether a user has any of a
+# set of roles for a service is one bitwise and
+role_bits = {role: 1 << index for index, role in enumerate(sorted(all_permissions))}
+
 permissions = (
     ("view_activity", _l("See dashboard statistics")),
     ("manage_templates", _l("Create and edit message templates")),
@@ -43,3 +48,19 @@ def translate_permissions_from_admin_roles_to_db(permissions):
     Looks them up in the roles dict, falling back to just passing through if they're not recognised.
     """
     return set(chain.from_iterable(roles.get(permission, [permission]) for permission in permissions))
+
+
+@lru_cache(maxsize=None)
+def get_roles_mask(roles):
+    """
+    Given a frozenset of admin roles, return a bitmask with a bit set for each one
+
+    Raises a TypeError if any of them aren't roles we know about
+    """
+    unknown_roles = roles - all_permissions
+    if unknown_roles:
+        raise TypeError("{} are not valid permissions".format(list(unknown_roles)))
+    mask = 0
+    for role in roles:
+        mask |= role_bits[role]
+    return mask
@@ -1,14 +1,30 @@
+import json
+from contextlib import suppress
+
 from flask import Markup, abort, current_app
 from flask_babel import _
 from flask_babel import lazy_gettext as _l
 from notifications_utils.field import Field
 from notifications_utils.formatters import nl2br
+from notifications_utils.recipients import (
+    InvalidEmailError,
+    InvalidPhoneError,
+    validate_and_format_email_address,
+    validate_and_format_phone_number,
+)
 from notifications_utils.take import Take
 from werkzeug.utils import cached_property
 
+from app.extensions import redis_client
 from app.models import JSONModel
 from app.models.organisation import Organisation
+from app.models.template_list import (
+    TemplateFolderTree,
+    get_templates_in_folder,
+    group_templates_by_folder,
+)
 from app.models.user import InvitedUsers, User, Users
+from app.notify_client import cache
 from app.notify_client.api_key_api_client import api_key_api_client
 from app.notify_client.billing_api_client import billing_api_client
 from app.notify_client.email_branding_client import email_branding_client
@@ -18,6 +34,7 @@ from app.notify_client.job_api_client import job_api_client
 from app.notify_client.letter_branding_client import letter_branding_client
 from app.notify_client.service_api_client import service_api_client
 from app.notify_client.template_folder_api_client import template_folder_api_client
+from app.template_search import get_template_search_index
 from app.utils import get_default_sms_sender
 
 
@@ -112,6 +129,32 @@ class Service(JSONModel):
     def active_users(self):
         return Users(self.id)
 
+    @cached_property
+    def trial_mode_safelist(self):
+        """
+        Everyone the service can send to while it’s in trial mode: its team
+        members and the recipients on its safelist, formatted the same way as
+        the recipients they’ll be compared against.
+        """
+        cache_key = "service-{}-trial-mode-safelist".format(self.id)
+        cached = redis_client.get(cache_key)
+        if cached is not None:
+            return frozenset(json.loads(cached))
+
+        safelist = service_api_client.get_safelist(self.id)
+        recipients = {
+            _format_safelist_recipient(recipient)
+            for recipient in (
+                [user.mobile_number for user in self.active_users]
+                + [user.email_address for user in self.active_users]
+                + safelist["phone_numbers"]
+                + safelist["email_addresses"]
+            )
+            if recipient
+        } - {None}
+        redis_client.set(cache_key, json.dumps(sorted(recipients)), ex=cache.TTL)
+        return frozenset(recipients)
+
     @cached_property
     def team_members(self):
         return sorted(
@@ -165,6 +208,10 @@ class Service(JSONModel):
 
         return [template for template in templates if template["template_type"] in self.available_template_types]
 
+    @cached_property
+    def templates_by_folder(self):
+        return group_templates_by_folder(self.all_templates)
+
     @cached_property
     def all_template_ids(self):
         return {template["id"] for template in self.all_templates}
@@ -175,15 +222,7 @@ class Service(JSONModel):
             if not user.has_template_folder_permission(folder):
                 return []
 
-        if isinstance(template_type, str):
-            template_type = [template_type]
-        if template_folder_id:
-            template_folder_id = str(template_folder_id)
-        return [
-            template
-            for template in self.all_templates
-            if (set(template_type) & {"all", template["template_type"]}) and template.get("folder") == template_folder_id
-        ]
+        return get_templates_in_folder(self.templates_by_folder, template_type, template_folder_id)
 
     def get_template(self, template_id, version=None):
         return service_api_client.get_service_template(self.id, str(template_id), version)["data"]
@@ -483,6 +522,22 @@ class Service(JSONModel):
     def all_template_folder_ids(self):
         return {folder["id"] for folder in self.all_template_folders}
 
+    @cached_property
+    def all_template_folders_by_id(self):
+        return {folder["id"]: folder for folder in self.all_template_folders}
+
+    def get_template_folder_ids_with_permission(self, user):
+        """Returns the IDs of the folders a user can see, including `None` for the top level"""
+        if user.platform_admin:
+            return self.all_template_folder_ids | {None}
+        return {None} | {
+            folder["id"] for folder in self.all_template_folders if user.id in folder.get("users_with_permission", [])
+        }
+
+    @cached_property
+    def _user_template_folders(self):
+        return {}
+
     def get_user_template_folders(self, user):
         """Returns a modified list of folders a user has permission to view
 
@@ -497,12 +552,18 @@ class Service(JSONModel):
         folder making sure it displays in the closest visible parent.
 
         """
+        if user.id not in self._user_template_folders:
+            self._user_template_folders[user.id] = self._get_user_template_folders(user)
+        return self._user_template_folders[user.id]
+
+    def _get_user_template_folders(self, user):
+        permitted_folder_ids = self.get_template_folder_ids_with_permission(user)
         user_folders = []
         for folder in self.all_template_folders:
-            if not user.has_template_folder_permission(folder, service=self):
+            if folder["id"] not in permitted_folder_ids:
                 continue
             parent = self.get_template_folder(folder["parent_id"])
-            if user.has_template_folder_permission(parent, service=self):
+            if parent["id"] in permitted_folder_ids:
                 user_folders.append(folder)
             else:
                 folder_attrs = {
@@ -521,24 +582,31 @@ class Service(JSONModel):
                     else:
                         parent = self.get_template_folder(parent["parent_id"])
                         folder_attrs["parent_id"] = parent.get("id", None)
-                        if user.has_template_folder_permission(parent, service=self):
+                        if parent["id"] in permitted_folder_ids:
                             break
                 user_folders.append(folder_attrs)
         return user_folders
 
+    @cached_property
+    def _template_folder_trees(self):
+        return {}
+
+    def get_template_folder_tree(self, user=None):
+        """Returns an index of the folders (as seen by `user`, if given) and templates
+
+        Each tree is built once and kept for the lifetime of this object,
+        which is a single request for `current_service`.
+        """
+        key = user.id if user else None
+        if key not in self._template_folder_trees:
+            self._template_folder_trees[key] = TemplateFolderTree(
+                self.get_user_template_folders(user) if user else self.all_template_folders,
+                self,
+            )
+        return self._template_folder_trees[key]
+
     def get_template_folders(self, template_type="all", parent_folder_id=None, user=None):
-        if user:
-            folders = self.get_user_template_folders(user)
-        else:
-            folders = self.all_template_folders
-        if parent_folder_id:
-            parent_folder_id = str(parent_folder_id)
-
-        return [
-            folder
-            for folder in folders
-            if (folder["parent_id"] == parent_folder_id and self.is_folder_visible(folder["id"], template_type, user))
-        ]
+        return self.get_template_folder_tree(user).get_folders(template_type, parent_folder_id)
 
     def get_template_folder(self, folder_id):
         if folder_id is None:
@@ -547,23 +615,20 @@ class Service(JSONModel):
                 "name": _l("Templates"),
                 "parent_id": None,
             }
-        return self._get_by_id(self.all_template_folders, folder_id)
+        try:
+            return self.all_template_folders_by_id[str(folder_id)]
+        except KeyError:
+            abort(404)
 
     def is_folder_visible(self, template_folder_id, template_type="all", user=None):
+        return self.get_template_folder_tree(user).is_visible(template_folder_id, template_type)
 
-        if template_type == "all":
-            return True
-
-        if self.get_templates(template_type, template_folder_id):
-            return True
-
-        if any(
-            self.is_folder_visible(child_folder["id"], template_type, user)
-            for child_folder in self.get_template_folders(template_type, template_folder_id, user)
-        ):
-            return True
-
-        return False
+    def search_templates(self, query, user, include_content=False):
+        return get_template_search_index(self.id, self.all_templates, self.all_template_folders).search(
+            query,
+            include_content=include_content,
+            permitted_folder_ids=self.get_template_folder_ids_with_permission(user),
+        )
 
     def get_template_folder_path(self, template_folder_id):
 
@@ -608,3 +673,10 @@ class Service(JSONModel):
 
     def get_api_key(self, id):
         return self._get_by_id(self.api_keys, id)
+
+
+def _format_safelist_recipient(recipient):
+    with suppress(InvalidPhoneError):
+        return validate_and_format_phone_number(recipient, international=True)
+    with suppress(InvalidEmailError):
+        return validate_and_format_email_address(recipient)
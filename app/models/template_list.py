@@ -1,5 +1,74 @@
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+from flask.globals import _request_ctx_stack  # type: ignore
 from flask_babel import _
 from flask_babel import lazy_gettext as _l
+from werkzeug.utils import cached_property
+
+
+def group_templates_by_folder(templates):
+    templates_by_folder = defaultdict(list)
+    for template in templates:
+        templates_by_folder[template.get("folder"), "all"].append(template)
+        templates_by_folder[template.get("folder"), template["template_type"]].append(template)
+    return templates_by_folder
+
+
+def get_templates_in_folder(templates_by_folder, template_type, folder_id):
+    if isinstance(template_type, str):
+        template_type = [template_type]
+    folder_id = str(folder_id) if folder_id else None
+    if "all" in template_type:
+        return list(templates_by_folder.get((folder_id, "all"), []))
+    return [
+        template for template in templates_by_folder.get((folder_id, "all"), []) if template["template_type"] in template_type
+    ]
+
+
+class TemplateFolderTree:
+    """
+    An index of a service’s folders and templates, built in one pass so
+    that listing the contents of a folder, or finding out whether it has
+    templates of a given type anywhere inside it, is a lookup rather than
+    a scan of every folder and template.
+    """
+
+    def __init__(self, folders, service):
+        self.folders_by_id = {folder["id"]: folder for folder in folders}
+        self.children = defaultdict(list)
+        self.service = service
+
+        for folder in folders:
+            self.children[folder["parent_id"]].append(folder)
+
+    @cached_property
+    def visible(self):
+        # Templates are only fetched the first time we filter by type
+        visible = set()
+        for folder_id, template_type in self.service.templates_by_folder:
+            if template_type == "all":
+                continue
+            # Walk up from the folder, stopping as soon as we reach one
+            # that has already been marked visible from another branch
+            while (folder_id, template_type) not in visible:
+                visible.add((folder_id, template_type))
+                if folder_id not in self.folders_by_id:
+                    break
+                folder_id = self.folders_by_id[folder_id]["parent_id"]
+        return visible
+
+    def get_templates(self, template_type, folder_id):
+        return get_templates_in_folder(self.service.templates_by_folder, template_type, folder_id)
+
+    def get_folders(self, template_type, parent_folder_id):
+        parent_folder_id = str(parent_folder_id) if parent_folder_id else None
+        return [folder for folder in self.children.get(parent_folder_id, []) if self.is_visible(folder["id"], template_type)]
+
+    def is_visible(self, folder_id, template_type):
+        folder_id = str(folder_id) if folder_id else None
+        return template_type == "all" or (folder_id, template_type) in self.visible
 
 
 class TemplateList:
@@ -9,11 +78,13 @@ class TemplateList:
         template_type="all",
         template_folder_id=None,
         user=None,
+        recursive=True,
     ):
         self.service = service
         self.template_type = template_type
         self.template_folder_id = template_folder_id
         self.user = user
+        self.recursive = recursive
 
     def __iter__(self):
         for item in self.get_templates_and_folders(self.template_type, self.template_folder_id, self.user, ancestors=[]):
@@ -21,20 +92,19 @@ class TemplateList:
 
     def get_templates_and_folders(self, template_type, template_folder_id, user, ancestors):
 
-        for item in self.service.get_template_folders(
-            template_type,
-            template_folder_id,
-            user,
-        ):
+        tree = self.service.get_template_folder_tree(user)
+
+        for item in tree.get_folders(template_type, template_folder_id):
             yield TemplateListFolder(
                 item,
-                folders=self.service.get_template_folders(template_type, item["id"], user),
-                templates=self.service.get_templates(template_type, item["id"]),
+                folders=tree.get_folders(template_type, item["id"]),
+                templates=tree.get_templates(template_type, item["id"]),
                 ancestors=ancestors,
                 service_id=self.service.id,
             )
-            for sub_item in self.get_templates_and_folders(template_type, item["id"], user, ancestors + [item]):
-                yield sub_item
+            if self.recursive:
+                for sub_item in self.get_templates_and_folders(template_type, item["id"], user, ancestors + [item]):
+                    yield sub_item
 
         for item in self.service.get_templates(template_type, template_folder_id, user):
             yield TemplateListTemplate(
@@ -56,6 +126,48 @@ class TemplateList:
         return not any(self.get_templates_and_folders("all", self.template_folder_id, self.user, []))
 
 
+def _prefetch_templates_and_folders(service):
+    # Looking these up fills in the cached properties on the service
+    return service.all_templates, service.all_template_folders
+
+
+def _copy_current_request_context(func):
+    # Like Flask’s `copy_current_request_context`, but the copy also gets
+    # the current user, service and organisation, which Flask doesn’t know
+    # about but the API clients look up when they log calls
+    top = _request_ctx_stack.top
+    ctx = top.copy()
+    for name in ("user", "service", "organisation"):
+        if hasattr(top, name):
+            setattr(ctx, name, getattr(top, name))
+
+    def wrapper(*args, **kwargs):
+        with ctx:
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def prefetch_templates_and_folders(services, concurrency):
+    """
+    Fetches the templates and folders for each service, up to
+    `concurrency` services at a time, rather than one service after
+    another as the list of templates is rendered.
+    """
+    if concurrency > 1 and len(services) > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            # Each task gets its own copy of the request context, because
+            # the API clients need to know who the current user is
+            futures = [
+                executor.submit(_copy_current_request_context(_prefetch_templates_and_folders), service) for service in services
+            ]
+            for future in futures:
+                future.result()
+    else:
+        for service in services:
+            _prefetch_templates_and_folders(service)
+
+
 class TemplateLists:
     def __init__(self, user):
         self.services = sorted(
@@ -63,22 +175,37 @@ class TemplateLists:
             key=lambda service: service.name.lower(),
         )
         self.user = user
+        prefetch_templates_and_folders(self.services, current_app.config["TEMPLATE_PREFETCH_CONCURRENCY"])
+
+    @property
+    def recursive(self):
+        # Above this many templates and folders only the top level of each
+        # service is listed, and the rest is shown when a service is opened
+        return (
+            sum(service.count_of_templates_and_folders for service in self.services)
+            <= current_app.config["TEMPLATE_LIST_MAX_NESTED_ITEMS"]
+        )
 
     def __iter__(self):
 
         if len(self.services) == 1:
 
-            for template_or_folder in TemplateList(self.services[0], user=self.user):
+            for template_or_folder in TemplateList(self.services[0], user=self.user, recursive=self.recursive):
                 yield template_or_folder
 
             return
 
+        recursive = self.recursive
+
         for service in self.services:
 
             template_list_service = TemplateListService(service)
 
             yield template_list_service
 
+            if not recursive:
+                continue
+
             for service_templates_and_folders in TemplateList(service, user=self.user).get_templates_and_folders(
                 template_type="all",
                 template_folder_id=None,
@@ -9,6 +9,7 @@ from app.models import JSONModel, ModelList
 from app.models.organisation import Organisation
 from app.models.roles_and_permissions import (
     all_permissions,
+    get_roles_mask,
     translate_permissions_from_db_to_admin_roles,
 )
 from app.notify_client import InviteTokenError
@@ -52,6 +53,8 @@ class User(JSONModel, UserMixin):
     def __init__(self, _dict):
         super().__init__(_dict)
         self.permissions = _dict.get("permissions", {})
+        self._service_ids = frozenset(map(str, _dict.get("services", [])))
+        self._organisation_ids = frozenset(map(str, _dict.get("organisations", [])))
         self.max_failed_login_count = current_app.config["MAX_FAILED_LOGIN_COUNT"]
         self._platform_admin = _dict["platform_admin"]
 
@@ -108,6 +111,10 @@ class User(JSONModel, UserMixin):
             service: translate_permissions_from_db_to_admin_roles(permissions)
             for service, permissions in permissions_by_service.items()
         }
+        self._roles_masks = {
+            service: get_roles_mask(frozenset(permissions & all_permissions))
+            for service, permissions in self._permissions.items()
+        }
 
     def update(self, **kwargs):
         response = user_api_client.update_user_attribute(self.id, **kwargs)
@@ -192,9 +199,7 @@ class User(JSONModel, UserMixin):
         return self._platform_admin and not session.get("disable_platform_admin_view", False)
 
     def has_permissions(self, *permissions, restrict_admin_usage=False, allow_org_user=False):
-        unknown_permissions = set(permissions) - all_permissions
-        if unknown_permissions:
-            raise TypeError("{} are not valid permissions".format(list(unknown_permissions)))
+        roles_mask = get_roles_mask(frozenset(permissions))
 
         # Service id is always set on the request for service specific views.
         service_id = _get_service_id_from_view_args()
@@ -215,7 +220,7 @@ class User(JSONModel, UserMixin):
         if not permissions and self.belongs_to_service(service_id):
             return True
 
-        if any(self.has_permission_for_service(service_id, permission) for permission in permissions):
+        if self._roles_masks.get(service_id, 0) & roles_mask:
             return True
 
         from app.models.service import Service
@@ -246,14 +251,14 @@ class User(JSONModel, UserMixin):
         ]
 
     def belongs_to_service(self, service_id):
-        return str(service_id) in self.service_ids
+        return str(service_id) in self._service_ids
 
     def belongs_to_service_or_403(self, service_id):
         if not self.belongs_to_service(service_id):
             abort(403)
 
     def belongs_to_organisation(self, organisation_id):
-        return str(organisation_id) in self.organisation_ids
+        return str(organisation_id) in self._organisation_ids
 
     @property
     def locked(self):
@@ -162,6 +162,7 @@ class HeaderNavigation(Navigation):
             "edit_template_postage",
             "manage_template_folder",
             "s3_send",
+            "search_templates",
             "send_messages",
             "send_one_off",
             "send_one_off_step",
@@ -397,6 +398,7 @@ class MainNavigation(Navigation):
             "edit_template_postage",
             "manage_template_folder",
             "s3_send",
+            "search_templates",
             "send_messages",
             "send_one_off",
             "send_one_off_step",
@@ -696,6 +698,7 @@ class OrgNavigation(Navigation):
         "roadmap",
         "robots",
         "s3_send",
+        "search_templates",
         "security",
         "security_txt",
         "send_messages",
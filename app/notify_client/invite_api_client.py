@@ -44,6 +44,7 @@ class InviteApiClient(NotifyAdminAPIClient):
         self.post(url="/service/{0}/invite/{1}".format(service_id, invited_user_id), data=data)
 
     @cache.delete("service-{service_id}")
+    @cache.delete("service-{service_id}-trial-mode-safelist")
     @cache.delete("user-{invited_user_id}")
     def accept_invite(self, service_id, invited_user_id):
         data = {"status": "accepted"}
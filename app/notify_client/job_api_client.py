@@ -1,4 +1,6 @@
+import json
 from collections import defaultdict
+from datetime import datetime
 
 from app.extensions import redis_client
 from app.notify_client import NotifyAdminAPIClient, _attach_current_user, cache
@@ -19,6 +21,11 @@ class JobApiClient(NotifyAdminAPIClient):
 
     NON_SCHEDULED_JOB_STATUSES = JOB_STATUSES - {"scheduled", "cancelled"}
 
+    # Fingerprints of the jobs a service has created today are kept in a Redis
+    # hash, so checking for a duplicate send doesn’t mean fetching every job
+    FINGERPRINTS_LOADED = "__loaded__"
+    FINGERPRINTS_TTL = 24 * 60 * 60
+
     @staticmethod
     def __convert_statistics(job):
         results = defaultdict(int)
@@ -66,16 +73,34 @@ class JobApiClient(NotifyAdminAPIClient):
 
         return jobs
 
+    @staticmethod
+    def _sent_today_cache_key(service_id):
+        return "jobs-sent-{}-{}".format(service_id, datetime.utcnow().date().isoformat())
+
+    @staticmethod
+    def _job_fingerprint(template_id, template_version, original_file_name):
+        return json.dumps([str(template_id), str(template_version), original_file_name])
+
     def has_sent_previously(self, service_id, template_id, template_version, original_file_name):
-        return (template_id, template_version, original_file_name) in (
-            (
-                job["template"],
-                job["template_version"],
-                job["original_file_name"],
-            )
+        fingerprints = {
+            key.decode("utf-8") if isinstance(key, bytes) else key
+            for key in redis_client.get_all_from_hash(self._sent_today_cache_key(service_id)) or {}
+        }
+        # The index is only complete once it’s been loaded from the API; before
+        # that it might only contain the jobs created since it expired
+        if self.FINGERPRINTS_LOADED not in fingerprints:
+            fingerprints = self._load_sent_today(service_id)
+        return self._job_fingerprint(template_id, template_version, original_file_name) in fingerprints
+
+    def _load_sent_today(self, service_id):
+        fingerprints = {
+            self._job_fingerprint(job["template"], job["template_version"], job["original_file_name"]): 1
             for job in self.get_jobs(service_id, limit_days=0)["data"]
             if job["job_status"] != "cancelled"
-        )
+        }
+        fingerprints[self.FINGERPRINTS_LOADED] = 1
+        redis_client.set_hash_and_expire(self._sent_today_cache_key(service_id), fingerprints, self.FINGERPRINTS_TTL)
+        return fingerprints
 
     def get_page_of_jobs(self, service_id, page):
         return self.get_jobs(
@@ -115,6 +140,18 @@ class JobApiClient(NotifyAdminAPIClient):
             b"true",
             ex=cache.TTL,
         )
+        if {"template", "template_version", "original_file_name"} <= job["data"].keys():
+            redis_client.set_hash_and_expire(
+                self._sent_today_cache_key(service_id),
+                {
+                    self._job_fingerprint(
+                        job["data"]["template"],
+                        job["data"]["template_version"],
+                        job["data"]["original_file_name"],
+                    ): 1
+                },
+                self.FINGERPRINTS_TTL,
+            )
 
         stats = self.__convert_statistics(job["data"])
         job["data"]["notifications_sent"] = stats["delivered"] + stats["failed"]
@@ -128,6 +165,9 @@ class JobApiClient(NotifyAdminAPIClient):
     def cancel_job(self, service_id, job_id):
 
         job = self.post(url="/service/{}/job/{}/cancel".format(service_id, job_id), data={})
+        # Another job might have been sent with the same fingerprint, so load
+        # the index from the API again rather than removing it
+        redis_client.delete(self._sent_today_cache_key(service_id))
 
         stats = self.__convert_statistics(job["data"])
         job["data"]["notifications_sent"] = stats["delivered"] + stats["failed"]
@@ -139,10 +179,12 @@ class JobApiClient(NotifyAdminAPIClient):
 
     @cache.delete("has_jobs-{service_id}")
     def cancel_letter_job(self, service_id, job_id):
-        return self.post(
+        response = self.post(
             url="/service/{}/job/{}/cancel-letter-job".format(service_id, job_id),
             data={},
         )
+        redis_client.delete(self._sent_today_cache_key(service_id))
+        return response
 
 
 job_api_client = JobApiClient()
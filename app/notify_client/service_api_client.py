@@ -173,6 +173,7 @@ class ServiceAPIClient(NotifyAdminAPIClient):
         return self.post("/service/{}/resume".format(service_id), data=None)
 
     @cache.delete("service-{service_id}")
+    @cache.delete("service-{service_id}-trial-mode-safelist")
     @cache.delete("user-{user_id}")
     def remove_user_from_service(self, service_id, user_id):
         """
@@ -336,6 +337,7 @@ class ServiceAPIClient(NotifyAdminAPIClient):
         return self.get(url="/service/{}/safelist".format(service_id))
 
     @cache.delete("service-{service_id}")
+    @cache.delete("service-{service_id}-trial-mode-safelist")
     def update_safelist(self, service_id, data):
         return self.put(url="/service/{}/safelist".format(service_id), data=data)
 
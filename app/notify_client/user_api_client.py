@@ -62,6 +62,9 @@ class UserApiClient(NotifyAdminAPIClient):
 
         url = "/user/{}".format(user_id)
         user_data = self.post(url, data=data)
+        if {"email_address", "mobile_number"} & data.keys():
+            for service_id in user_data["data"].get("services", []):
+                redis_client.delete("service-{}-trial-mode-safelist".format(service_id))
         return user_data["data"]
 
     @cache.delete("user-{user_id}")
@@ -150,6 +153,7 @@ class UserApiClient(NotifyAdminAPIClient):
 
     @cache.delete("service-{service_id}")
     @cache.delete("service-{service_id}-template-folders")
+    @cache.delete("service-{service_id}-trial-mode-safelist")
     @cache.delete("user-{user_id}")
     def add_user_to_service(self, service_id, user_id, permissions, folder_permissions):
         # permissions passed in are the combined admin roles, not db permissions
@@ -0,0 +1,176 @@
+import json
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from app.extensions import redis_client
+from app.notify_client.billing_api_client import billing_api_client
+from app.notify_client.notification_api_client import notification_api_client
+from app.notify_client.platform_stats_api_client import platform_stats_api_client
+from app.statistics_utils import parse_api_date
+
+SNAPSHOT_KEY = "report-snapshot-{}-{}"
+
+
+def get_first_live_day():
+    """
+    The first day whose figures might still change, so which is always
+    fetched from the API rather than from a snapshot
+    """
+    return datetime.utcnow().date() - timedelta(days=current_app.config["REPORT_SNAPSHOT_LIVE_DAYS"] - 1)
+
+
+def get_days(start_date, end_date):
+    day = start_date
+    while day <= end_date:
+        yield day
+        day += timedelta(days=1)
+
+
+def get_missing_ranges(days, partitions):
+    """Groups the days which don’t have a partition into ranges of consecutive days"""
+    missing = []
+    for day in days:
+        if partitions[day] is not None:
+            continue
+        if missing and missing[-1][1] == day - timedelta(days=1):
+            missing[-1][1] = day
+        else:
+            missing.append([day, day])
+    return missing
+
+
+def _get_snapshots(keys):
+    if not keys or not redis_client.active:
+        return [None] * len(keys)
+    return [json.loads(snapshot) if snapshot is not None else None for snapshot in redis_client.redis_store.mget(keys)]
+
+
+def _set_snapshots(snapshots):
+    if not snapshots or not redis_client.active:
+        return
+    pipeline = redis_client.redis_store.pipeline(transaction=False)
+    for key, snapshot in snapshots.items():
+        pipeline.set(key, json.dumps(snapshot), ex=current_app.config["REPORT_SNAPSHOT_TTL"])
+    pipeline.execute()
+
+
+class DailyReport(ABC):
+    """
+    A platform admin report which can be put together from one partition
+    of rows per day.
+
+    Past days never change, so their partitions are kept in Redis, put
+    there either by the nightly `snapshot-platform-admin-reports` command
+    or by the first request which needed them. Only the most recent days,
+    and any past days which are missing, are fetched from the API.
+    """
+
+    name = None
+
+    @abstractmethod
+    def fetch(self, start_date, end_date):
+        pass
+
+    def split_by_day(self, rows, start_date, end_date):
+        """
+        Splits rows fetched for a range of days into a partition per day,
+        or returns `None` if the rows don’t say which day they’re from
+        """
+        return None
+
+    def combine(self, partitions):
+        return [row for partition in partitions for row in partition]
+
+    def get_key(self, day):
+        return SNAPSHOT_KEY.format(self.name, day.isoformat())
+
+    def snapshot(self, start_date, end_date):
+        """Fetches the partitions for a range of past days from the API and stores them"""
+        if start_date == end_date:
+            partitions = {start_date: self.fetch(start_date, end_date)}
+        else:
+            partitions = self.split_by_day(self.fetch(start_date, end_date), start_date, end_date)
+            if partitions is None:
+                for day in get_days(start_date, end_date):
+                    self.snapshot(day, day)
+                return
+        _set_snapshots({self.get_key(day): partition for day, partition in partitions.items()})
+
+    def get_rows(self, start_date, end_date):
+        first_live_day = get_first_live_day()
+        days = list(get_days(start_date, min(end_date, first_live_day - timedelta(days=1))))
+        partitions = OrderedDict(zip(days, _get_snapshots([self.get_key(day) for day in days])))
+        unpartitioned = []
+
+        for missing_start, missing_end in get_missing_ranges(days, partitions):
+            rows = self.fetch(missing_start, missing_end)
+            missing_partitions = (
+                {missing_start: rows} if missing_start == missing_end else self.split_by_day(rows, missing_start, missing_end)
+            )
+            if missing_partitions is None:
+                # Fetching each day separately would take longer than this
+                # request should, so leave those to the nightly snapshot
+                unpartitioned.append(rows)
+                continue
+            _set_snapshots({self.get_key(day): partition for day, partition in missing_partitions.items()})
+            partitions.update(missing_partitions)
+
+        if end_date >= first_live_day:
+            unpartitioned.append(self.fetch(max(start_date, first_live_day), end_date))
+
+        return self.combine([partition for partition in partitions.values() if partition is not None] + unpartitioned)
+
+
+class NotificationStatusByServiceReport(DailyReport):
+    name = "notification-status-by-service"
+
+    def fetch(self, start_date, end_date):
+        return notification_api_client.get_notification_status_by_service(start_date, end_date)
+
+    def split_by_day(self, rows, start_date, end_date):
+        partitions = OrderedDict((day, []) for day in get_days(start_date, end_date))
+        for row in rows:
+            partitions.setdefault(parse_api_date(row["date_created"]).date(), []).append(row)
+        return partitions
+
+
+class SendMethodStatsByServiceReport(DailyReport):
+    name = "send-method-stats-by-service"
+
+    def fetch(self, start_date, end_date):
+        return platform_stats_api_client.get_send_method_stats_by_service(start_date, end_date)
+
+    def combine(self, partitions):
+        # Rows are service ID, service name, organisation name, notification
+        # type and send method, then the count for those
+        counts = OrderedDict()
+        for partition in partitions:
+            for row in partition:
+                counts[tuple(row[:-1])] = counts.get(tuple(row[:-1]), 0) + int(row[-1])
+        return [list(key) + [count] for key, count in counts.items()]
+
+
+notification_status_by_service_report = NotificationStatusByServiceReport()
+send_method_stats_by_service_report = SendMethodStatsByServiceReport()
+
+DAILY_REPORTS = [notification_status_by_service_report, send_method_stats_by_service_report]
+
+
+def get_usage_for_all_services(start_date, end_date):
+    """
+    Usage is costed against each service’s free allowance for the year, so
+    the usage for a range of days isn’t the sum of the usage on each day.
+    Instead, whole ranges are kept once they’re entirely in the past.
+    """
+    if end_date >= get_first_live_day():
+        return billing_api_client.get_usage_for_all_services(start_date, end_date)
+
+    key = SNAPSHOT_KEY.format("usage-for-all-services", "{}-{}".format(start_date.isoformat(), end_date.isoformat()))
+    (usage,) = _get_snapshots([key])
+    if usage is None:
+        usage = billing_api_client.get_usage_for_all_services(start_date, end_date)
+        _set_snapshots({key: usage})
+    return usage
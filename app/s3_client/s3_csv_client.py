@@ -1,14 +1,40 @@
+import hashlib
+import io
+import json
+import time
 import uuid
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, count, islice
 
 import botocore
-from boto3 import resource
+from boto3 import client
 from flask import current_app
 from notifications_utils.s3 import s3upload as utils_s3upload
 
+from app.background_queue import BackgroundQueue
+from app.extensions import redis_client
 from app.s3_client.s3_logo_client import get_s3_object
 
 FILE_LOCATION_STRUCTURE = "service-{}-notify/{}.csv"
 
+# S3 won’t accept parts of a multipart upload smaller than 5MB, apart from the last one
+MULTIPART_UPLOAD_PART_SIZE = 5 * 1024 * 1024
+
+# Bigger objects are copied in parts, which S3 copies in parallel
+MULTIPART_COPY_THRESHOLD = 64 * 1024 * 1024
+MULTIPART_COPY_PART_SIZE = 64 * 1024 * 1024
+MULTIPART_COPY_CONCURRENCY = 8
+
+BULK_SEND_UPLOADS_CACHE_KEY = "bulk-send-uploads"
+# The cached listing is refreshed in the background once it’s older than this…
+BULK_SEND_UPLOADS_REFRESH_AFTER = 60
+# …and isn’t used at all once it’s older than this
+BULK_SEND_UPLOADS_CACHE_TTL = 10 * 60
+BULK_SEND_UPLOADS_PAGE_SIZE = 50
+
+BulkSendUpload = namedtuple("BulkSendUpload", ["key", "last_modified"])
+
 
 def get_csv_location(service_id, upload_id):
     return (
@@ -24,24 +50,246 @@ def get_csv_upload(service_id, upload_id):
 def s3upload(service_id, filedata, region):
     upload_id = str(uuid.uuid4())
     bucket_name, file_location = get_csv_location(service_id, upload_id)
-    utils_s3upload(
-        filedata=filedata["data"],
-        region=region,
-        bucket_name=bucket_name,
-        file_location=file_location,
-    )
+    if isinstance(filedata["data"], (str, bytes)):
+        utils_s3upload(
+            filedata=filedata["data"],
+            region=region,
+            bucket_name=bucket_name,
+            file_location=file_location,
+        )
+    else:
+        s3upload_in_parts(
+            filedata["data"],
+            region=region,
+            bucket_name=bucket_name,
+            file_location=file_location,
+        )
     return upload_id
 
 
-def s3download(service_id, upload_id):
-    contents = ""
+def get_parts(chunks, part_size=MULTIPART_UPLOAD_PART_SIZE):
+    buffer, parts_yielded = bytearray(), 0
+    for chunk in chunks:
+        buffer += chunk.encode("utf-8")
+        while len(buffer) >= part_size:
+            yield bytes(buffer[:part_size])
+            del buffer[:part_size]
+            parts_yielded += 1
+    if buffer or not parts_yielded:
+        yield bytes(buffer)
+
+
+def s3upload_in_parts(chunks, region, bucket_name, file_location):
+    s3 = client("s3", region_name=region)
+    put_args = {
+        "Bucket": bucket_name,
+        "Key": file_location,
+        "ServerSideEncryption": "AES256",
+        "ContentType": "binary/octet-stream",
+    }
+
+    parts = get_parts(chunks)
+    first_part, second_part = next(parts), next(parts, None)
+
+    if second_part is None:
+        s3.put_object(Body=first_part, **put_args)
+        return
+
+    multipart_upload_id = s3.create_multipart_upload(**put_args)["UploadId"]
+    try:
+        uploaded_parts = [
+            {
+                "PartNumber": part_number,
+                "ETag": s3.upload_part(
+                    Bucket=bucket_name,
+                    Key=file_location,
+                    UploadId=multipart_upload_id,
+                    PartNumber=part_number,
+                    Body=part,
+                )["ETag"],
+            }
+            for part_number, part in enumerate(chain([first_part, second_part], parts), start=1)
+        ]
+        s3.complete_multipart_upload(
+            Bucket=bucket_name,
+            Key=file_location,
+            UploadId=multipart_upload_id,
+            MultipartUpload={"Parts": uploaded_parts},
+        )
+    except Exception:
+        s3.abort_multipart_upload(Bucket=bucket_name, Key=file_location, UploadId=multipart_upload_id)
+        raise
+
+
+class S3DownloadChecksumError(Exception):
+    pass
+
+
+class ETagChecksum:
+    """
+    Recomputes the ETag S3 gives an object as it is downloaded, so that a
+    download assembled from several ranged requests can be checked against
+    what was uploaded.
+
+    For objects uploaded in one go this is the MD5 of the whole object. For
+    multipart uploads it is the MD5 of the MD5s of each part followed by the
+    number of parts, so the size the object was uploaded in parts of has to
+    be known.
+    """
+
+    def __init__(self, etag, upload_part_size=None):
+        self.expected = etag.strip('"')
+        self.upload_part_size = upload_part_size
+        self.part_digests = []
+        self.current_part = hashlib.md5()
+        self.current_part_size = 0
+
+    def update(self, data):
+        data = memoryview(data)
+        while data:
+            if self.upload_part_size:
+                size = min(len(data), self.upload_part_size - self.current_part_size)
+            else:
+                size = len(data)
+            self.current_part.update(data[:size])
+            self.current_part_size += size
+            data = data[size:]
+            if self.current_part_size == self.upload_part_size:
+                self.part_digests.append(self.current_part.digest())
+                self.current_part, self.current_part_size = hashlib.md5(), 0
+
+    @property
+    def hexdigest(self):
+        if not self.upload_part_size:
+            return self.current_part.hexdigest()
+        part_digests = self.part_digests + ([self.current_part.digest()] if self.current_part_size else [])
+        return "{}-{}".format(hashlib.md5(b"".join(part_digests)).hexdigest(), len(part_digests))
+
+    def verify(self, file_location):
+        if self.hexdigest != self.expected:
+            raise S3DownloadChecksumError(
+                "Checksum of {} is {}, expected {}".format(file_location, self.hexdigest, self.expected)
+            )
+
+
+class PartsReader(io.RawIOBase):
+    """
+    A file-like object which reads from an iterator of bytes, so that parts
+    of a download can be decoded as they arrive.
+    """
+
+    def __init__(self, parts):
+        self.parts = parts
+        self.buffer = memoryview(b"")
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self.buffer:
+            part = next(self.parts, None)
+            if part is None:
+                return 0
+            self.buffer = memoryview(part)
+        size = min(len(b), len(self.buffer))
+        b[:size] = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            self.parts.close()
+        super().close()
+
+
+def get_byte_ranges(start, content_length, part_size):
+    return [(offset, min(offset + part_size, content_length) - 1) for offset in range(start, content_length, part_size)]
+
+
+def get_object_range(s3, bucket_name, file_location, byte_range, etag=None):
+    start, end = byte_range
+    response = s3.get_object(
+        Bucket=bucket_name,
+        Key=file_location,
+        Range="bytes={}-{}".format(start, end),
+        # Every part has to come from the same version of the object
+        **({"IfMatch": etag} if etag else {}),
+    )
+    body = response["Body"].read()
+    if "ContentRange" in response:
+        # S3 returns less than was asked for if the range goes past the end of the object
+        returned_start, _, returned_end = response["ContentRange"].split()[1].partition("/")[0].partition("-")
+        if len(body) != int(returned_end) - int(returned_start) + 1:
+            raise S3DownloadChecksumError("Incomplete range {} of {}".format(response["ContentRange"], file_location))
+    return response, body
+
+
+def iter_object_parts(s3, bucket_name, file_location, part_size, concurrency):
     try:
-        key = get_csv_upload(service_id, upload_id)
-        contents = key.get()["Body"].read().decode("utf-8")
+        first_response, first_part = get_object_range(s3, bucket_name, file_location, (0, part_size - 1))
     except botocore.exceptions.ClientError as e:
+        # S3 can’t satisfy any range of an empty object
+        if e.response["Error"]["Code"] == "InvalidRange":
+            return
+        raise
+
+    etag = first_response["ETag"]
+    content_length = int(first_response.get("ContentRange", "/{}".format(len(first_part))).rpartition("/")[2])
+    upload_part_size = None
+    if "-" in etag:
+        upload_part_size = s3.head_object(Bucket=bucket_name, Key=file_location, PartNumber=1, IfMatch=etag)["ContentLength"]
+    checksum = ETagChecksum(etag, upload_part_size)
+    checksum.update(first_part)
+
+    byte_ranges = iter(get_byte_ranges(len(first_part), content_length, part_size))
+    executor = ThreadPoolExecutor(max_workers=max(concurrency, 1))
+    try:
+        # Only fetch a few parts ahead of the one being read, so that peak
+        # memory is bounded for callers which stream the download
+        pending = deque(
+            executor.submit(get_object_range, s3, bucket_name, file_location, byte_range, etag)
+            for byte_range in islice(byte_ranges, concurrency)
+        )
+        yield first_part
+        while pending:
+            _, part = pending.popleft().result()
+            for byte_range in islice(byte_ranges, 1):
+                pending.append(executor.submit(get_object_range, s3, bucket_name, file_location, byte_range, etag))
+            checksum.update(part)
+            yield part
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    checksum.verify(file_location)
+
+
+def s3download(service_id, upload_id, stream=False):
+    bucket_name, file_location = get_csv_location(service_id, upload_id)
+    s3 = client("s3", region_name=current_app.config["AWS_REGION"])
+    parts = iter_object_parts(
+        s3,
+        bucket_name,
+        file_location,
+        part_size=current_app.config["S3_DOWNLOAD_PART_SIZE"],
+        concurrency=current_app.config["S3_DOWNLOAD_CONCURRENCY"],
+    )
+    if stream:
+        return io.TextIOWrapper(io.BufferedReader(PartsReader(parts)), encoding="utf-8", newline="")
+    try:
+        return b"".join(parts).decode("utf-8")
+    except (botocore.exceptions.ClientError, S3DownloadChecksumError) as e:
         current_app.logger.error("Unable to download s3 file {}".format(FILE_LOCATION_STRUCTURE.format(service_id, upload_id)))
         raise e
-    return contents
+
+
+def s3download_range(service_id, upload_id, start, end):
+    """Downloads the part of an upload from byte `start` up to, but not including, byte `end`"""
+    if end <= start:
+        return ""
+    bucket_name, file_location = get_csv_location(service_id, upload_id)
+    s3 = client("s3", region_name=current_app.config["AWS_REGION"])
+    _, body = get_object_range(s3, bucket_name, file_location, (start, end - 1))
+    return body.decode("utf-8")
 
 
 def set_metadata_on_csv_upload(service_id, upload_id, **kwargs):
@@ -53,21 +301,129 @@ def set_metadata_on_csv_upload(service_id, upload_id, **kwargs):
     )
 
 
-def list_bulk_send_uploads():
-    s3 = resource("s3")
-    bulk_send_bucket = s3.Bucket(current_app.config["BULK_SEND_AWS_BUCKET"])
+def list_bulk_send_uploads(prefix="", page=1, page_size=BULK_SEND_UPLOADS_PAGE_SIZE):
+    """
+    Returns a page of the files in the bulk send bucket whose names start with
+    `prefix`, most recent first, and whether there is another page after it.
+    """
+    uploads = get_bulk_send_uploads(prefix)
+    start = (page - 1) * page_size
+    return uploads[start : start + page_size], len(uploads) > start + page_size
+
 
-    files = []
-    for f in bulk_send_bucket.objects.all():
-        files.append(f)
+def get_bulk_send_uploads(prefix=""):
+    return [upload for upload in get_bulk_send_uploads_index() if upload.key.startswith(prefix)]
+
+
+def get_bulk_send_uploads_index():
+    cached = redis_client.get(BULK_SEND_UPLOADS_CACHE_KEY)
+    if cached is None:
+        return refresh_bulk_send_uploads_index()
+
+    index = json.loads(cached)
+    if time.time() - index["refreshed_at"] > BULK_SEND_UPLOADS_REFRESH_AFTER:
+        refresh_bulk_send_uploads_index_in_background()
+    return [BulkSendUpload(*upload) for upload in index["uploads"]]
+
+
+def refresh_bulk_send_uploads_index():
+    paginator = client("s3", region_name=current_app.config["AWS_REGION"]).get_paginator("list_objects_v2")
+    uploads = [
+        BulkSendUpload(f["Key"], f["LastModified"].isoformat())
+        for page in paginator.paginate(Bucket=current_app.config["BULK_SEND_AWS_BUCKET"])
+        for f in page.get("Contents", [])
+    ]
     # sort so most recent files are at the top of the page
-    files.sort(key=lambda f: f.last_modified, reverse=True)
-    return files
+    uploads.sort(key=lambda upload: upload.last_modified, reverse=True)
+    redis_client.set(
+        BULK_SEND_UPLOADS_CACHE_KEY,
+        json.dumps({"refreshed_at": time.time(), "uploads": uploads}),
+        ex=BULK_SEND_UPLOADS_CACHE_TTL,
+    )
+    return uploads
+
+
+def _refresh_bulk_send_uploads_index(apps):
+    # Every request which finds the index out of date queues a refresh, so
+    # skip any that were queued while another one was already running
+    with apps[-1].app_context():
+        if not _bulk_send_uploads_index_is_out_of_date():
+            return
+        refresh_bulk_send_uploads_index()
+
+
+def _bulk_send_uploads_index_is_out_of_date():
+    cached = redis_client.get(BULK_SEND_UPLOADS_CACHE_KEY)
+    return cached is None or time.time() - json.loads(cached)["refreshed_at"] > BULK_SEND_UPLOADS_REFRESH_AFTER
+
+
+bulk_send_uploads_index_refreshes = BackgroundQueue(_refresh_bulk_send_uploads_index, batch_size=100)
+
+
+def refresh_bulk_send_uploads_index_in_background():
+    bulk_send_uploads_index_refreshes.put(current_app._get_current_object())
+
+
+def s3copy(source_bucket_name, source_file_location, bucket_name, file_location, region):
+    s3 = client("s3", region_name=region)
+    copy_source = {"Bucket": source_bucket_name, "Key": source_file_location}
+    put_args = {
+        "Bucket": bucket_name,
+        "Key": file_location,
+        "ServerSideEncryption": "AES256",
+        "ContentType": "binary/octet-stream",
+    }
+
+    source = s3.head_object(**copy_source)
+    # Every part has to be copied from the same version of the object
+    etag = source["ETag"]
+
+    if source["ContentLength"] <= MULTIPART_COPY_THRESHOLD:
+        s3.copy_object(CopySource=copy_source, CopySourceIfMatch=etag, MetadataDirective="REPLACE", **put_args)
+        return
+
+    multipart_upload_id = s3.create_multipart_upload(**put_args)["UploadId"]
+
+    def _copy_part(part_number, byte_range):
+        response = s3.upload_part_copy(
+            Bucket=bucket_name,
+            Key=file_location,
+            UploadId=multipart_upload_id,
+            PartNumber=part_number,
+            CopySource=copy_source,
+            CopySourceIfMatch=etag,
+            CopySourceRange="bytes={}-{}".format(*byte_range),
+        )
+        return {"PartNumber": part_number, "ETag": response["CopyPartResult"]["ETag"]}
+
+    try:
+        with ThreadPoolExecutor(max_workers=MULTIPART_COPY_CONCURRENCY) as executor:
+            copied_parts = list(
+                executor.map(
+                    _copy_part,
+                    count(1),
+                    get_byte_ranges(0, source["ContentLength"], MULTIPART_COPY_PART_SIZE),
+                )
+            )
+        s3.complete_multipart_upload(
+            Bucket=bucket_name,
+            Key=file_location,
+            UploadId=multipart_upload_id,
+            MultipartUpload={"Parts": copied_parts},
+        )
+    except Exception:
+        s3.abort_multipart_upload(Bucket=bucket_name, Key=file_location, UploadId=multipart_upload_id)
+        raise
 
 
 def copy_bulk_send_file_to_uploads(service_id, filekey):
-    s3 = resource("s3")
-    obj = s3.Object(current_app.config["BULK_SEND_AWS_BUCKET"], filekey)
-    body = obj.get()["Body"].read()
-    upload_id = s3upload(service_id, {"data": body}, current_app.config["AWS_REGION"])
+    upload_id = str(uuid.uuid4())
+    bucket_name, file_location = get_csv_location(service_id, upload_id)
+    s3copy(
+        source_bucket_name=current_app.config["BULK_SEND_AWS_BUCKET"],
+        source_file_location=filekey,
+        bucket_name=bucket_name,
+        file_location=file_location,
+        region=current_app.config["AWS_REGION"],
+    )
     return upload_id
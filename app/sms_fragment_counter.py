@@ -0,0 +1,107 @@
+import re
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+from notifications_utils.columns import Columns
+
+PLACEHOLDER_PATTERN = re.compile(r"\({2}([^()]+)\){2}")
+
+# Anything outside this set might be encoded as more than one GSM character,
+# force the message into unicode, or be escaped when the message is rendered.
+SPECIAL_CHARACTER_PATTERN = re.compile(r"[^ 0-9A-Za-z!#$%()*+,\-./:;=?@_]")
+
+# Values whose rendered length depends on what surrounds them, for example
+# because whitespace before punctuation gets removed, or on how whitespace
+# in them gets normalised, like runs of spaces, tabs and no-break spaces.
+POSITION_SENSITIVE_PATTERN = re.compile(r"^[^0-9A-Za-z]|\s$|\s[^0-9A-Za-z\s]|\s{2,}|[^\S ]")
+
+CHUNK_SIZE = 10_000
+
+
+def get_placeholder_weights(content):
+    occurrences, conditionals = Counter(), set()
+    for match in PLACEHOLDER_PATTERN.finditer(content):
+        name, separator, _ = match.group(1).partition("??")
+        if separator:
+            conditionals.add(Columns.make_key(name))
+        else:
+            occurrences[Columns.make_key(name)] += 1
+    keys = sorted(set(occurrences) | conditionals)
+    return keys, tuple(occurrences[key] for key in keys), tuple(key in conditionals for key in keys)
+
+
+def get_row_signature(values, weights, conditionals):
+    plain_length = 0
+    special_characters = Counter()
+    exact_values = []
+
+    for value, weight, is_conditional in zip(values, weights, conditionals):
+        if is_conditional:
+            exact_values.append(value)
+        if not weight:
+            continue
+        if POSITION_SENSITIVE_PATTERN.search(value):
+            exact_values.extend(repeat(value, weight))
+            continue
+        special = SPECIAL_CHARACTER_PATTERN.findall(value)
+        plain_length += (len(value) - len(special)) * weight
+        for character in special:
+            special_characters[character] += weight
+
+    return plain_length, tuple(sorted(special_characters.items())), tuple(exact_values)
+
+
+def get_row_signatures(rows, weights, conditionals):
+    return [get_row_signature(values, weights, conditionals) for values in rows]
+
+
+class SMSFragmentCounter:
+    """
+    Counts the exact number of fragments needed to send an SMS template to
+    every row of a spreadsheet.
+
+    Two rows whose personalisation has the same number of plain characters and
+    the same special characters render to messages of the same length and
+    encoding, so the template only has to be rendered once per distinct row
+    signature rather than once per row.
+    """
+
+    def __init__(self, template, processes=0):
+        self.template = template
+        self.processes = processes
+        self.keys, self.weights, self.conditionals = get_placeholder_weights(template.content)
+
+    def count(self, personalisations):
+        rows = [tuple(str(Columns(row).get(key) or "") for key in self.keys) for row in personalisations]
+
+        first_row_with_signature = {}
+        rows_with_signature = Counter()
+        for index, signature in enumerate(self._get_signatures(rows)):
+            first_row_with_signature.setdefault(signature, index)
+            rows_with_signature[signature] += 1
+
+        return sum(
+            self._get_fragment_count(rows[index]) * rows_with_signature[signature]
+            for signature, index in first_row_with_signature.items()
+        )
+
+    def _get_signatures(self, rows):
+        if self.processes <= 1 or len(rows) <= CHUNK_SIZE:
+            return get_row_signatures(rows, self.weights, self.conditionals)
+
+        chunks = [rows[start : start + CHUNK_SIZE] for start in range(0, len(rows), CHUNK_SIZE)]
+        with ProcessPoolExecutor(max_workers=self.processes) as executor:
+            signatures = []
+            for chunk in executor.map(
+                get_row_signatures,
+                chunks,
+                repeat(self.weights),
+                repeat(self.conditionals),
+            ):
+                signatures.extend(chunk)
+            return signatures
+
+    def _get_fragment_count(self, values):
+        self.template.values = dict(zip(self.keys, values))
+        return self.template.fragment_count
@@ -1,5 +1,6 @@
+import re
 from datetime import datetime
-from functools import reduce
+from functools import lru_cache, reduce
 
 from dateutil import parser
 
@@ -76,3 +77,36 @@ def get_failure_rate_for_job(job):
 
 def add_rate_to_job(job):
     return dict(failure_rate=(get_failure_rate_for_job(job)) * 100, **job)
+
+
+# Dates from the API look like `Sat, 29 Mar 2014 00:00:00 GMT`
+API_DATE_FORMAT = "%a, %d %b %Y %X %Z"
+API_DATE_PATTERN = re.compile(r"^\w{3}, (\d{2}) (\w{3}) (\d{4}) (\d{2}):(\d{2}):(\d{2}) GMT$")
+API_DATE_MONTHS = {
+    month: index
+    for index, month in enumerate(("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"), 1)
+}
+
+
+def parse_api_date(value):
+    match = API_DATE_PATTERN.match(value)
+    if not match or match.group(2) not in API_DATE_MONTHS:
+        return datetime.strptime(value, API_DATE_FORMAT)
+    day, month, year, hour, minute, second = match.groups()
+    return datetime(int(year), API_DATE_MONTHS[month], int(day), int(hour), int(minute), int(second))
+
+
+def get_api_date_converter(output_format):
+    """
+    Returns a function which reformats dates from the API, leaving empty
+    values alone. Rows in a report share a small number of dates, so each
+    one is only parsed once.
+    """
+
+    @lru_cache(maxsize=4096)
+    def convert(value):
+        if not value:
+            return value
+        return parse_api_date(value).strftime(output_format)
+
+    return convert
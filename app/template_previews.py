@@ -1,7 +1,44 @@
+import base64
+import hashlib
+from datetime import timedelta
+
 import requests
-from flask import current_app, json
+from flask import current_app, has_request_context, json, request
+from requests.adapters import HTTPAdapter
 
 from app import current_service
+from app.extensions import redis_client
+
+CACHE_TTL = int(timedelta(days=7).total_seconds())
+PAGE_COUNT_CACHE_TTL = int(timedelta(days=30).total_seconds())
+
+# Connections to the template preview API are kept open and shared
+# between requests rather than opened for every preview
+session = requests.Session()
+session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=20))
+session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=20))
+
+
+def _get_cache_key(filetype, data, page):
+    # Previews only depend on what we send to the template preview API,
+    # so identical requests can share the same response
+    return hashlib.sha256(json.dumps([filetype, page, data], sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _get_cached_preview(cache_key):
+    cached = redis_client.get("letter-preview-{}".format(cache_key))
+    if cached is None:
+        return None
+    cached = json.loads(cached)
+    return base64.b64decode(cached["content"]), cached["content_type"]
+
+
+def _set_cached_preview(cache_key, content, content_type):
+    redis_client.set(
+        "letter-preview-{}".format(cache_key),
+        json.dumps({"content": base64.b64encode(content).decode("ascii"), "content_type": content_type}),
+        ex=CACHE_TTL,
+    )
 
 
 class TemplatePreview:
@@ -13,16 +50,7 @@ class TemplatePreview:
             "values": values,
             "filename": current_service.letter_branding and current_service.letter_branding["filename"],
         }
-        resp = requests.post(
-            "{}/preview.{}{}".format(
-                current_app.config["TEMPLATE_PREVIEW_API_HOST"],
-                filetype,
-                "?page={}".format(page) if page else "",
-            ),
-            json=data,
-            headers={"Authorization": "Token {}".format(current_app.config["TEMPLATE_PREVIEW_API_KEY"])},
-        )
-        return (resp.content, resp.status_code, resp.headers.items())
+        return cls._get_preview(filetype, data, page=page)
 
     @classmethod
     def from_example_template(cls, template, filename):
@@ -32,12 +60,7 @@ class TemplatePreview:
             "values": None,
             "filename": filename,
         }
-        resp = requests.post(
-            "{}/preview.png".format(current_app.config["TEMPLATE_PREVIEW_API_HOST"]),
-            json=data,
-            headers={"Authorization": "Token {}".format(current_app.config["TEMPLATE_PREVIEW_API_KEY"])},
-        )
-        return (resp.content, resp.status_code, resp.headers.items())
+        return cls._get_preview("png", data)
 
     @classmethod
     def from_utils_template(cls, template, filetype, page=None):
@@ -48,21 +71,84 @@ class TemplatePreview:
             page=page,
         )
 
+    @classmethod
+    def _get_preview(cls, filetype, data, page=None):
+        cache_key = _get_cache_key(filetype, data, page)
+        # Previews depend on the service’s current letter branding as well
+        # as the URL, so browsers have to check they’re still up to date
+        cache_headers = [("ETag", '"{}"'.format(cache_key)), ("Cache-Control", "private, no-cache")]
+
+        if has_request_context() and request.if_none_match.contains(cache_key):
+            return (b"", 304, cache_headers)
+
+        # Personalised previews are rendered every time rather than being
+        # kept in Redis
+        use_redis = not data["values"]
+
+        cached = use_redis and _get_cached_preview(cache_key)
+        if cached:
+            content, content_type = cached
+            return (content, 200, [("Content-Type", content_type)] + cache_headers)
+
+        resp = session.post(
+            "{}/preview.{}{}".format(
+                current_app.config["TEMPLATE_PREVIEW_API_HOST"],
+                filetype,
+                "?page={}".format(page) if page else "",
+            ),
+            json=data,
+            headers={"Authorization": "Token {}".format(current_app.config["TEMPLATE_PREVIEW_API_KEY"])},
+            timeout=current_app.config["TEMPLATE_PREVIEW_API_TIMEOUT"],
+        )
+        if resp.status_code != 200:
+            return (resp.content, resp.status_code, resp.headers.items())
+
+        if use_redis:
+            _set_cached_preview(cache_key, resp.content, resp.headers.get("Content-Type"))
+        return (
+            resp.content,
+            resp.status_code,
+            [(name, value) for name, value in resp.headers.items() if name.lower() not in ("cache-control", "etag")]
+            + cache_headers,
+        )
+
+
+def _get_page_count_cache_key(template, values):
+    return "letter-page-count-{}-{}-{}".format(
+        template.get("id"),
+        template.get("version"),
+        # The subject and content are included in case this is a preview
+        # of changes which haven’t been saved as a new version yet
+        hashlib.sha256(
+            json.dumps(
+                [template.get("subject"), template.get("content"), template.get("reply_to_text"), values],
+                sort_keys=True,
+            ).encode("utf-8")
+        ).hexdigest(),
+    )
+
 
 def get_page_count_for_letter(template, values=None):
 
     if template["template_type"] != "letter":
         return None
 
+    cache_key = _get_page_count_cache_key(template, values)
+    cached = redis_client.get(cache_key)
+    if cached is not None:
+        return int(cached)
+
     page_count, _, _ = TemplatePreview.from_database_object(template, "json", values)
     page_count = json.loads(page_count.decode("utf-8"))["count"]
 
+    redis_client.set(cache_key, page_count, ex=PAGE_COUNT_CACHE_TTL)
     return page_count
 
 
 def validate_letter(pdf_file):
-    return requests.post(
+    return session.post(
         "{}/precompiled/validate?include_preview=true".format(current_app.config["TEMPLATE_PREVIEW_API_HOST"]),
         data=pdf_file,
         headers={"Authorization": "Token {}".format(current_app.config["TEMPLATE_PREVIEW_API_KEY"])},
+        timeout=current_app.config["TEMPLATE_PREVIEW_API_TIMEOUT"],
     )
@@ -0,0 +1,79 @@
+import hashlib
+import json
+from datetime import timedelta
+
+from flask import current_app
+from markupsafe import Markup
+from notifications_utils.template import EmailPreviewTemplate, SMSPreviewTemplate
+
+from app.extensions import redis_client
+from app.lru import LRUCache
+
+REDIS_KEY = "rendered-template-{}"
+REDIS_TTL = int(timedelta(days=1).total_seconds())
+
+
+def get_render_key(template_class, template, kwargs):
+    """
+    A digest of everything that goes into rendering a template preview:
+    the template itself (including its version), the service’s name and
+    branding, and the options the preview was created with.
+
+    Because the template and branding come from the `template-…`,
+    `service-…` and `email_branding-…` caches, when one of those keys is
+    deleted the data behind it is fetched again and, if it has changed,
+    the key changes with it. Old previews are never served after an
+    update; they fall out of the cache instead.
+    """
+    return hashlib.sha256(json.dumps([template_class, template, kwargs], sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class RenderedTemplateCache(LRUCache):
+    """
+    Rendered template previews, kept in a size-bounded in-memory cache for
+    each process, backed by Redis so they are shared between processes.
+    """
+
+    def __init__(self):
+        super().__init__(lambda: current_app.config["RENDERED_TEMPLATE_CACHE_SIZE"])
+
+    def get_or_render(self, render_key, render):
+        rendered = self.get(render_key)
+        if rendered is not None:
+            return rendered
+
+        rendered = redis_client.get(REDIS_KEY.format(render_key))
+        if rendered is not None:
+            rendered = rendered.decode("utf-8") if isinstance(rendered, bytes) else rendered
+        else:
+            rendered = str(render())
+            redis_client.set(REDIS_KEY.format(render_key), rendered, ex=REDIS_TTL)
+
+        return self.set(render_key, rendered)
+
+
+rendered_template_cache = RenderedTemplateCache()
+
+
+class CachedRenderMixin:
+    """
+    Renders the template from `rendered_template_cache`, unless it has
+    been personalised, in which case it’s rendered every time.
+    """
+
+    def __init__(self, template, **kwargs):
+        super().__init__(template, **kwargs)
+        self.render_key = get_render_key(type(self).__name__, template, kwargs)
+
+    def __str__(self):
+        if self.values:
+            return super().__str__()
+        return Markup(rendered_template_cache.get_or_render(self.render_key, super().__str__))
+
+
+class CachedEmailPreviewTemplate(CachedRenderMixin, EmailPreviewTemplate):
+    pass
+
+
+class CachedSMSPreviewTemplate(CachedRenderMixin, SMSPreviewTemplate):
+    pass
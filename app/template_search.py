@@ -0,0 +1,166 @@
+import re
+import unicodedata
+from bisect import bisect_left
+from collections import defaultdict
+from difflib import get_close_matches
+
+from app.lru import LRUCache
+
+TOKEN_PATTERN = re.compile(r"[^\W_]+")
+
+# How much a match counts towards an item’s score, by where it was found…
+FIELD_WEIGHTS = {"name": 3, "path": 2, "content": 1}
+# …and by how closely the query word matched
+EXACT_MATCH, PREFIX_MATCH, FUZZY_MATCH = 3, 2, 1
+
+FUZZY_MATCH_MIN_LENGTH = 4
+FUZZY_MATCH_CUTOFF = 0.8
+
+# Number of services whose indexes are kept in memory by each process
+MAX_CACHED_INDEXES = 100
+
+_indexes = LRUCache(MAX_CACHED_INDEXES)
+
+
+def tokenise(text):
+    text = unicodedata.normalize("NFKD", str(text or "")).lower()
+    return TOKEN_PATTERN.findall("".join(character for character in text if not unicodedata.combining(character)))
+
+
+class TemplateSearchIndex:
+    """
+    An inverted index of a service’s templates and folders, so searching
+    them is a lookup per word in the query rather than a scan of every
+    template.
+
+    Templates are indexed by their name, the names of the folders they’re
+    in, and their content. Folders are indexed by their name and path.
+    """
+
+    def __init__(self, templates, folders):
+        folders_by_id = {folder["id"]: folder for folder in folders}
+        self.items = {}
+        self.postings = {field: defaultdict(set) for field in FIELD_WEIGHTS}
+
+        for folder in folders:
+            self._add(
+                "folder",
+                folder,
+                path=self._get_path(folder["parent_id"], folders_by_id),
+                parent_id=folder["parent_id"],
+            )
+
+        for template in templates:
+            self._add(
+                "template",
+                template,
+                path=self._get_path(template.get("folder"), folders_by_id),
+                parent_id=template.get("folder"),
+                content=" ".join(filter(None, (template.get("subject"), template.get("content")))),
+            )
+
+        self.words = {field: sorted(postings) for field, postings in self.postings.items()}
+
+    @staticmethod
+    def _get_path(folder_id, folders_by_id):
+        path = []
+        while folder_id in folders_by_id and len(path) < len(folders_by_id):
+            path.insert(0, folders_by_id[folder_id]["name"])
+            folder_id = folders_by_id[folder_id]["parent_id"]
+        return path
+
+    def _add(self, item_type, item, path, parent_id, content=""):
+        key = (item_type, item["id"])
+        self.items[key] = {
+            "id": item["id"],
+            "name": item["name"],
+            "type": item_type,
+            "template_type": item.get("template_type"),
+            "parent_id": parent_id,
+            "path": path,
+        }
+        for field, text in (("name", item["name"]), ("path", " ".join(path)), ("content", content)):
+            for word in tokenise(text):
+                self.postings[field][word].add(key)
+
+    def _get_prefix_matches(self, field, query_word):
+        postings, words = self.postings[field], self.words[field]
+        matches = {}
+        for index in range(bisect_left(words, query_word), len(words)):
+            if not words[index].startswith(query_word):
+                break
+            match = EXACT_MATCH if words[index] == query_word else PREFIX_MATCH
+            for key in postings[words[index]]:
+                matches[key] = max(matches.get(key, 0), match)
+        return matches
+
+    def _get_fuzzy_matches(self, field, query_word):
+        if len(query_word) < FUZZY_MATCH_MIN_LENGTH:
+            return {}
+        return {
+            key: FUZZY_MATCH
+            for word in get_close_matches(query_word, self.words[field], n=5, cutoff=FUZZY_MATCH_CUTOFF)
+            for key in self.postings[field][word]
+        }
+
+    def _get_word_scores(self, query_word, fields):
+        # Comparing the query word with every word in the index is slow, so
+        # misspellings are only looked for if no word starts with it
+        for get_matches in (self._get_prefix_matches, self._get_fuzzy_matches):
+            word_scores = defaultdict(int)
+            for field in fields:
+                for key, match in get_matches(field, query_word).items():
+                    word_scores[key] = max(word_scores[key], match * FIELD_WEIGHTS[field])
+            if word_scores:
+                break
+        return word_scores
+
+    def search(self, query, include_content=False, permitted_folder_ids=None):
+        """
+        Returns the templates and folders which match every word in the
+        query, best matches first. If `permitted_folder_ids` is given,
+        only items in (or, for folders, being) one of those folders are
+        returned.
+        """
+        fields = [field for field in FIELD_WEIGHTS if include_content or field != "content"]
+        scores = None
+
+        for query_word in set(tokenise(query)):
+            word_scores = self._get_word_scores(query_word, fields)
+            if scores is None:
+                scores = word_scores
+            else:
+                scores = {key: score + word_scores[key] for key, score in scores.items() if key in word_scores}
+            if not scores:
+                return []
+
+        results = [
+            self.items[key]
+            for key in (scores or {})
+            if permitted_folder_ids is None
+            or (key[1] if key[0] == "folder" else self.items[key]["parent_id"]) in permitted_folder_ids
+        ]
+        return sorted(results, key=lambda item: (-scores[item["type"], item["id"]], item["name"].lower()))
+
+
+def get_template_search_index(service_id, templates, folders):
+    """
+    Returns the search index for a service, only rebuilding it if the
+    templates or folders have changed since it was last built. Templates
+    come from the `service-{id}-templates` cache, so anything which
+    invalidates that also invalidates the index.
+    """
+    version = hash(
+        (
+            tuple((t["id"], t.get("version"), t["name"], t.get("folder")) for t in templates),
+            tuple((f["id"], f["name"], f["parent_id"]) for f in folders),
+        )
+    )
+
+    cached_version, index = _indexes.get(service_id, (None, None))
+    if cached_version == version:
+        return index
+
+    index = TemplateSearchIndex(templates, folders)
+    _indexes.set(service_id, (version, index))
+    return index
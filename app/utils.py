@@ -1,3 +1,4 @@
+import codecs
 import csv
 import json
 import os
@@ -8,10 +9,11 @@ import urllib.request
 import uuid
 from collections import defaultdict
 from datetime import datetime, time, timedelta
-from functools import wraps
+from functools import lru_cache, partial, wraps
 from io import BytesIO, StringIO
 from itertools import chain
 from os import path
+from time import monotonic
 from typing import Any
 
 import boto3
@@ -19,7 +21,16 @@ import dateutil
 import pyexcel
 import pyexcel_xlsx
 from dateutil import parser
-from flask import abort, current_app, redirect, request, session, url_for
+from flask import (
+    Response,
+    abort,
+    current_app,
+    redirect,
+    request,
+    session,
+    stream_with_context,
+    url_for,
+)
 from flask_babel import _
 from flask_babel import lazy_gettext as _l
 from flask_login import current_user, login_required
@@ -29,12 +40,7 @@ from notifications_utils.letter_timings import letter_can_be_cancelled
 from notifications_utils.recipients import RecipientCSV
 from notifications_utils.strftime_codes import no_pad_month
 from notifications_utils.take import Take
-from notifications_utils.template import (
-    EmailPreviewTemplate,
-    LetterImageTemplate,
-    LetterPreviewTemplate,
-    SMSPreviewTemplate,
-)
+from notifications_utils.template import LetterImageTemplate, LetterPreviewTemplate
 from notifications_utils.timezones import (
     convert_utc_to_est,
     utc_string_to_aware_gmt_datetime,
@@ -44,8 +50,16 @@ from werkzeug.datastructures import MultiDict
 from werkzeug.routing import RequestRedirect
 
 from app import cache
+from app.background_queue import BackgroundQueue
+from app.extensions import redis_client
+from app.lru import LRUCache
+from app.models.roles_and_permissions import get_roles_mask
 from app.notify_client.organisations_api_client import organisations_client
 from app.notify_client.service_api_client import service_api_client
+from app.template_render_cache import (
+    CachedEmailPreviewTemplate,
+    CachedSMSPreviewTemplate,
+)
 
 SENDING_STATUSES = ["created", "pending", "sending", "pending-virus-check"]
 DELIVERED_STATUSES = ["delivered", "sent", "returned-letter"]
@@ -59,6 +73,11 @@ FAILURE_STATUSES = [
 ]
 REQUESTED_STATUSES = SENDING_STATUSES + DELIVERED_STATUSES + FAILURE_STATUSES
 
+IP_GEOLOCATION_CACHE_SIZE = 10_000
+IP_GEOLOCATION_CACHE_TTL = int(timedelta(days=1).total_seconds())
+
+_geolocations = LRUCache(IP_GEOLOCATION_CACHE_SIZE)
+
 with open("{}/email_domains.txt".format(os.path.dirname(os.path.realpath(__file__)))) as email_domains:
     GOVERNMENT_EMAIL_DOMAIN_NAMES = [line.strip() for line in email_domains]
 
@@ -114,6 +133,10 @@ def get_latest_stats(lang):
 
 
 def user_has_permissions(*permissions, **permission_kwargs):
+    # Fails when the view is defined, rather than when it’s requested, if
+    # any of the permissions aren’t real
+    get_roles_mask(frozenset(permissions))
+
     def wrap(func):
         @wraps(func)
         def wrap_func(*args, **kwargs):
@@ -164,11 +187,18 @@ def redirect_to_sign_in(f):
 
 
 def get_errors_for_csv(recipients, template_type):
+    return get_errors_for_csv_row_counts(
+        len(list(recipients.rows_with_bad_recipients)),
+        len(list(recipients.rows_with_missing_data)),
+        template_type,
+    )
+
+
+def get_errors_for_csv_row_counts(number_of_bad_recipients, number_of_rows_with_missing_data, template_type):
 
     errors = []
 
-    if any(recipients.rows_with_bad_recipients):
-        number_of_bad_recipients = len(list(recipients.rows_with_bad_recipients))
+    if number_of_bad_recipients:
         if "sms" == template_type:
             if 1 == number_of_bad_recipients:
                 errors.append(_("fix") + " 1 " + _("phone number"))
@@ -185,8 +215,7 @@ def get_errors_for_csv(recipients, template_type):
             else:
                 errors.append(_("fix") + " {} ".format(number_of_bad_recipients) + _("addresses"))
 
-    if any(recipients.rows_with_missing_data):
-        number_of_rows_with_missing_data = len(list(recipients.rows_with_missing_data))
+    if number_of_rows_with_missing_data:
         if 1 == number_of_rows_with_missing_data:
             errors.append(_("enter missing data in 1 row"))
         else:
@@ -203,9 +232,11 @@ def generate_notifications_csv(**kwargs):
         kwargs["page"] = 1
 
     if kwargs.get("job_id"):
-        original_file_contents = s3download(kwargs["service_id"], kwargs["job_id"])
+        with s3download(kwargs["service_id"], kwargs["job_id"], stream=True) as original_file:
+            # Only the column headers are needed, so stop reading after the first row
+            original_file_header = next((line for line in original_file if line.strip()), "")
         original_upload = RecipientCSV(
-            original_file_contents,
+            original_file_header,
             template_type=kwargs["template_type"],
         )
         original_column_headers = original_upload.column_headers
@@ -261,6 +292,28 @@ def generate_notifications_csv(**kwargs):
     raise Exception("Should never reach here")
 
 
+def stream_template(template_name, **context):
+    """
+    Like `render_template`, but sends the page in pieces as it’s rendered
+    rather than building the whole thing in memory first
+    """
+    current_app.update_template_context(context)
+    template = current_app.jinja_env.get_template(template_name)
+    return Response(stream_with_context(template.generate(context)))
+
+
+def stream_csv_report(headers, rows, filename, disposition="attachment"):
+    """
+    Sends a CSV report in chunks as its rows are produced, so `rows` can
+    be a generator and the report is never held in memory all at once
+    """
+    return Response(
+        stream_with_context(Spreadsheet.from_rows(chain([headers], rows)).as_csv_chunks()),
+        mimetype="text/csv",
+        headers={"Content-Disposition": '{}; filename="{}"'.format(disposition, filename)},
+    )
+
+
 def get_page_from_request():
     if "page" in request.args:
         try:
@@ -323,29 +376,60 @@ class Spreadsheet:
 
     allowed_file_extensions = ["csv", "xlsx", "xls", "ods", "xlsm", "tsv"]
 
-    def __init__(self, csv_data=None, rows=None, filename=""):
+    # Size of the bytes read from an uploaded file, and of the chunks of
+    # CSV data produced from it, when streaming
+    chunk_size = 64 * 1024
+
+    def __init__(self, csv_data=None, rows=None, filename="", csv_chunks=None):
+        """
+        `csv_chunks` is a function which returns the chunks of CSV data,
+        so that they can be read more than once
+        """
 
         self.filename = filename
 
-        if csv_data and rows:
+        if len([source for source in (csv_data, rows, csv_chunks) if source]) > 1:
             raise TypeError("Spreadsheet must be created from either rows or CSV data")
 
         self._csv_data = csv_data or ""
+        self._csv_chunks = csv_chunks
         self._rows = rows or []
 
     @property
     def as_dict(self):
         return {"file_name": self.filename, "data": self.as_csv_data}
 
+    @property
+    def as_streaming_dict(self):
+        return {"file_name": self.filename, "data": self.as_csv_chunks()}
+
     @property
     def as_csv_data(self):
         if not self._csv_data:
+            self._csv_data = "".join(self.as_csv_chunks())
+        return self._csv_data
+
+    def as_csv_chunks(self):
+        """
+        Returns a new generator of the CSV data each time it’s called. If
+        the spreadsheet was made from a generator of rows, those can still
+        only be read once.
+        """
+        if self._csv_data:
+            yield self._csv_data
+        elif self._csv_chunks is not None:
+            yield from self._csv_chunks()
+        else:
             with StringIO() as converted:
                 output = csv.writer(converted)
                 for row in self._rows:
                     output.writerow(row)
-                self._csv_data = converted.getvalue()
-        return self._csv_data
+                    if converted.tell() >= self.chunk_size:
+                        yield converted.getvalue()
+                        converted.seek(0)
+                        converted.truncate()
+                if converted.tell():
+                    yield converted.getvalue()
 
     @classmethod
     def can_handle(cls, filename):
@@ -355,9 +439,38 @@ class Spreadsheet:
     def get_extension(filename):
         return path.splitext(filename)[1].lower().lstrip(".")
 
-    @staticmethod
-    def normalise_newlines(file_content):
-        return "\r\n".join(file_content.read().decode("utf-8").splitlines())
+    @classmethod
+    def iter_lines(cls, file_content):
+        # The parts of a line which hasn’t ended yet, only joined up once
+        # it has, so long lines aren’t copied again for every chunk
+        pending = []
+        for text in codecs.iterdecode(iter(partial(file_content.read, cls.chunk_size), b""), "utf-8"):
+            lines = text.splitlines(keepends=True)
+            # The last line might be incomplete, or end with a `\r` whose
+            # `\n` is at the start of the next chunk
+            last_line = lines.pop() if lines else ""
+            if lines:
+                lines[:1] = "".join(pending + lines[:1]).splitlines(keepends=True)
+                pending = []
+            pending.append(last_line)
+            for line in lines:
+                yield line.splitlines()[0]
+        yield from "".join(pending).splitlines()
+
+    @classmethod
+    def iter_normalised_newlines(cls, file_content):
+        for index, line in enumerate(cls.iter_lines(file_content)):
+            yield "\r\n" + line if index else line
+
+    @classmethod
+    def _read_csv_chunks(cls, file_content):
+        # Rewound first, so the file can be read again
+        file_content.seek(0)
+        return cls.iter_normalised_newlines(file_content)
+
+    @classmethod
+    def normalise_newlines(cls, file_content):
+        return "".join(cls.iter_normalised_newlines(file_content))
 
     @classmethod
     def from_rows(cls, rows, filename=""):
@@ -375,21 +488,29 @@ class Spreadsheet:
         extension = cls.get_extension(filename)
 
         if extension == "csv":
-            return cls(csv_data=Spreadsheet.normalise_newlines(file_content), filename=filename)
+            return cls(csv_chunks=partial(cls._read_csv_chunks, file_content), filename=filename)
 
         if extension == "tsv":
             file_content = StringIO(Spreadsheet.normalise_newlines(file_content))
 
-        instance = cls.from_rows(pyexcel.iget_array(file_type=extension, file_stream=file_content), filename)
-        pyexcel.free_resources()
-        return instance
+        return cls.from_rows(
+            cls._free_resources_when_done(pyexcel.iget_array(file_type=extension, file_stream=file_content)),
+            filename,
+        )
+
+    @staticmethod
+    def _free_resources_when_done(rows):
+        try:
+            yield from rows
+        finally:
+            pyexcel.free_resources()
 
     @property
     def as_rows(self):
         if not self._rows:
             self._rows = list(
                 csv.reader(
-                    StringIO(self._csv_data),
+                    StringIO(self.as_csv_data),
                     quoting=csv.QUOTE_MINIMAL,
                     skipinitialspace=True,
                 )
@@ -407,22 +528,62 @@ def get_help_argument():
     return request.args.get("help") if request.args.get("help") in ("1", "2", "3") else None
 
 
-def email_address_ends_with(email_address, known_domains):
-    return any(
-        email_address.lower().endswith(
-            (
-                "@{}".format(known),
-                ".{}".format(known),
-            )
-        )
-        for known in known_domains
-    )
+class DomainSuffixIndex:
+    """
+    A set of domains which an email address can be checked against by
+    looking up each of the address’s domain suffixes in turn, so the cost
+    depends on how many labels the address has rather than on how many
+    domains there are.
+
+    An address matches a domain if it’s at that domain or any subdomain
+    of it.
+    """
+
+    def __init__(self, domains):
+        self.domains = frozenset(filter(None, (domain.strip().lower() for domain in domains)))
+
+    def __contains__(self, email_address):
+        _, at, domain = email_address.lower().rpartition("@")
+        if at and domain in self.domains:
+            return True
+        index = domain.find(".")
+        while index != -1:
+            if domain[index + 1 :] in self.domains:
+                return True
+            index = domain.find(".", index + 1)
+        return False
+
+
+GOVERNMENT_EMAIL_DOMAINS = DomainSuffixIndex(GOVERNMENT_EMAIL_DOMAIN_NAMES)
+
+# The organisation domains the index was built from, when they were
+# fetched, and the index
+_organisation_domains = ((), None, DomainSuffixIndex([]))
+
+
+def get_organisation_domains():
+    """
+    Returns an index of every organisation’s domains. The domains are only
+    fetched again once the index is ORGANISATION_DOMAINS_INDEX_TTL seconds
+    old, and the index is only rebuilt if they’ve changed. They come from
+    the `domains` cache, so anything which invalidates that also rebuilds
+    the index, at most that long afterwards.
+    """
+    global _organisation_domains
+
+    domains, fetched_at, index = _organisation_domains
+    if fetched_at is not None and monotonic() - fetched_at < current_app.config["ORGANISATION_DOMAINS_INDEX_TTL"]:
+        return index
+
+    latest_domains = tuple(organisations_client.get_domains())
+    if latest_domains != domains:
+        index = DomainSuffixIndex(latest_domains)
+    _organisation_domains = (latest_domains, monotonic(), index)
+    return index
 
 
 def is_gov_user(email_address):
-    return email_address_ends_with(email_address, GOVERNMENT_EMAIL_DOMAIN_NAMES) or email_address_ends_with(
-        email_address, organisations_client.get_domains()
-    )
+    return email_address in GOVERNMENT_EMAIL_DOMAINS or email_address in get_organisation_domains()
 
 
 def get_template(
@@ -442,7 +603,7 @@ def get_template(
     debug_template_path = path.dirname(path.abspath(__file__)) if os.environ.get("USE_LOCAL_JINJA_TEMPLATES") == "True" else None
 
     if "email" == template["template_type"]:
-        return EmailPreviewTemplate(
+        return CachedEmailPreviewTemplate(
             template,
             from_name=service.name,
             from_address="{}@notifications.service.gov.uk".format(service.email_from),
@@ -454,7 +615,7 @@ def get_template(
             **get_email_logo_options(service),
         )
     if "sms" == template["template_type"]:
-        return SMSPreviewTemplate(
+        return CachedSMSPreviewTemplate(
             template,
             prefix=service.name,
             show_prefix=service.prefix_sms,
@@ -634,6 +795,37 @@ def get_letter_printing_statement(status, created_at):
         return "Printed on {} at 5:30pm".format(printed_date)
 
 
+@lru_cache(maxsize=None)
+def _get_security_hub(region):
+    # Created once per region and reused, because working out the account
+    # means a call to STS
+    account = boto3.client("sts").get_caller_identity()["Account"]
+    return account, boto3.client("securityhub", region_name=region)
+
+
+def _send_security_findings(findings):
+    findings_by_region = defaultdict(list)
+    for region, finding in findings:
+        findings_by_region[region].append(finding)
+
+    for region, findings in findings_by_region.items():
+        account, client = _get_security_hub(region)
+        client.batch_import_findings(
+            Findings=[
+                dict(
+                    finding,
+                    ProductArn=f"arn:aws:securityhub:{region}:{account}:product/{account}/default",
+                    AwsAccountId=account,
+                )
+                for finding in findings
+            ]
+        )
+
+
+# Security Hub accepts at most 100 findings in each call
+security_findings = BackgroundQueue(_send_security_findings, batch_size=100)
+
+
 def report_security_finding(
     title,
     finding,
@@ -643,25 +835,19 @@ def report_security_finding(
     types=["Unusual Behaviors"],
     UserDefinedFields={"app": "NotifyAdmin"},
 ):
-    client = boto3.client("sts")
-    response = client.get_caller_identity()
-
-    account = response["Account"]
-
-    product = f'arn:aws:securityhub:{current_app.config["AWS_REGION"].lower()}:{account}:product/{account}/default'
-    client = boto3.client("securityhub", region_name=current_app.config["AWS_REGION"].lower())
-    client.batch_import_findings(
-        Findings=[
+    region = current_app.config["AWS_REGION"].lower()
+    now = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+    security_findings.put(
+        (
+            region,
             {
                 "SchemaVersion": "2018-10-08",
                 "Id": str(uuid.uuid4()),
-                "ProductArn": product,
                 "GeneratorId": "NotifyAdminFinding",
-                "AwsAccountId": account,
                 "Types": types,
-                "CreatedAt": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
-                "UpdatedAt": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
-                "FirstObservedAt": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "CreatedAt": now,
+                "UpdatedAt": now,
+                "FirstObservedAt": now,
                 "Severity": {"Normalized": severity},
                 "Criticality": criticality,
                 "Title": title,
@@ -672,7 +858,7 @@ def report_security_finding(
                         "Type": "Container",
                         "Id": os.getenv("HOST", "localhost"),
                         "Partition": "aws",
-                        "Region": current_app.config["AWS_REGION"].lower(),
+                        "Region": region,
                         "Details": {
                             "Container": {
                                 "Name": os.getenv("HOST", "localhost"),
@@ -686,7 +872,7 @@ def report_security_finding(
                 "RecordState": "ACTIVE",
                 "UserDefinedFields": UserDefinedFields,
             },
-        ]
+        )
     )
 
 
@@ -779,23 +965,33 @@ def _geolocate_lookup(ip):
     request = urllib.request.Request(url=f"{current_app.config['IP_GEOLOCATE_SERVICE']}/{ip}")
 
     try:
-        with urllib.request.urlopen(request) as f:
+        with urllib.request.urlopen(request, timeout=current_app.config["IP_GEOLOCATE_TIMEOUT"]) as f:
             response = f.read()
-    except urllib.error.HTTPError as e:
+    except (urllib.error.URLError, OSError) as e:
         current_app.logger.warning("Exception found: {}".format(e))
         return ip
     else:
         return json.loads(response.decode("utf-8-sig"))
 
 
-def _geolocate_ip(ip):
-    if not current_app.config["IP_GEOLOCATE_SERVICE"].startswith("http"):
-        return
-    resp = _geolocate_lookup(ip)
+def _get_cached_geolocation(ip):
+    resp = _geolocations.get(ip)
+    if resp is not None:
+        return resp
 
-    if isinstance(resp, str):
-        return ip
+    cached = redis_client.get(f"ip-geolocation-{ip}")
+    if cached is None:
+        return None
+    return _set_cached_geolocation(ip, json.loads(cached), in_redis=True)
 
+
+def _set_cached_geolocation(ip, resp, in_redis=False):
+    if not in_redis:
+        redis_client.set(f"ip-geolocation-{ip}", json.dumps(resp), ex=IP_GEOLOCATION_CACHE_TTL)
+    return _geolocations.set(ip, resp)
+
+
+def _get_location(ip, resp):
     if "continent" in resp and resp["continent"] is not None and resp["continent"]["code"] != "NA":
         report_security_finding(
             "Suspicious log in location",
@@ -811,6 +1007,33 @@ def _geolocate_ip(ip):
         return ip
 
 
+def _geolocate_in_background(lookups):
+    for app, ip in lookups:
+        with app.app_context():
+            resp = _geolocate_lookup(ip)
+            if not isinstance(resp, str):
+                _get_location(ip, _set_cached_geolocation(ip, resp))
+
+
+ip_geolocations = BackgroundQueue(_geolocate_in_background)
+
+
+def _geolocate_ip(ip):
+    if not current_app.config["IP_GEOLOCATE_SERVICE"].startswith("http"):
+        return
+
+    resp = _get_cached_geolocation(ip)
+
+    # Signing in doesn’t wait for an IP address which hasn’t been seen
+    # before to be looked up. It’s looked up in the background instead,
+    # where suspicious locations are still reported.
+    if resp is None:
+        ip_geolocations.put((current_app._get_current_object(), ip))
+        return ip
+
+    return _get_location(ip, resp)
+
+
 def _constructLoginData(request):
     return {
         "user-agent": request.headers["User-Agent"],
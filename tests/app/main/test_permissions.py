@@ -7,6 +7,8 @@ from werkzeug.exceptions import Forbidden, Unauthorized
 
 from app.main.views.index import index
 from app.models.roles_and_permissions import (
+    get_roles_mask,
+    role_bits,
     translate_permissions_from_admin_roles_to_db,
     translate_permissions_from_db_to_admin_roles,
 )
@@ -264,6 +266,19 @@ def test_translate_permissions_from_admin_roles_to_db():
     }
 
 
+def test_get_roles_mask():
+    assert get_roles_mask(frozenset()) == 0
+    assert get_roles_mask(frozenset({"send_messages", "manage_templates"})) == (
+        role_bits["send_messages"] | role_bits["manage_templates"]
+    )
+    assert len(set(role_bits.values())) == len(role_bits) == 5
+
+
+def test_user_has_permissions_rejects_unknown_permissions_when_defined():
+    with pytest.raises(TypeError):
+        user_has_permissions("view_activity", "to_do_bad_things")
+
+
 @pytest.mark.parametrize(
     "user_services, user_organisations, expected_status, organisation_checked",
     (
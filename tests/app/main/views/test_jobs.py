@@ -680,6 +680,49 @@ def test_should_show_updates_for_one_job_as_json(
     assert "2016-01-01T00:00:00.000001+0000" in content["status"]
 
 
+@freeze_time("2016-01-01 00:00:00.000001")
+def test_job_updates_only_include_partials_which_have_changed_since_cursor(
+    logged_in_client,
+    service_one,
+    active_user_with_permissions,
+    mock_get_notifications,
+    mock_get_service_template,
+    mock_get_service_data_retention,
+    mocker,
+    fake_uuid,
+):
+    job = job_json(service_one["id"], active_user_with_permissions, job_id=fake_uuid)
+    mocker.patch("app.job_api_client.get_job", side_effect=lambda service_id, job_id: {"data": dict(job)})
+
+    def _get_updates(**kwargs):
+        response = logged_in_client.get(
+            url_for("main.view_job_updates", service_id=service_one["id"], job_id=fake_uuid, **kwargs)
+        )
+        assert response.status_code == 200
+        return json.loads(response.get_data(as_text=True))
+
+    first_response = _get_updates()
+    assert {"counts", "notifications", "status", "cursor"} <= first_response.keys()
+    assert mock_get_notifications.call_count == 1
+
+    assert _get_updates(cursor=first_response["cursor"]) == {"cursor": first_response["cursor"]}
+    assert mock_get_notifications.call_count == 1
+    assert mock_get_service_template.call_count == 1
+
+    job["notifications_delivered"] = 1
+    second_response = _get_updates(cursor=first_response["cursor"])
+    assert mock_get_notifications.call_count == 2
+    assert "delivered" in second_response["counts"]
+    assert "notifications" not in second_response
+    assert "status" not in second_response
+    assert second_response["cursor"] != first_response["cursor"]
+
+    job["statistics"] = [{"status": "pending", "count": 1}]
+    third_response = _get_updates(cursor=second_response["cursor"])
+    assert mock_get_notifications.call_count == 3
+    assert third_response["cursor"] != second_response["cursor"]
+
+
 @pytest.mark.parametrize(
     "job_created_at, expected_date",
     [
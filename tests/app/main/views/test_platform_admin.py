@@ -19,7 +19,7 @@ from app.main.views.platform_admin import (
     sum_service_usage,
 )
 from tests import service_json
-from tests.conftest import SERVICE_ONE_ID, SERVICE_TWO_ID, normalize_spaces
+from tests.conftest import SERVICE_ONE_ID, SERVICE_TWO_ID, normalize_spaces, set_config
 
 
 @pytest.mark.parametrize(
@@ -505,6 +505,58 @@ def test_should_show_archived_services_last(
     assert services[2].td.text.strip() == "C"
 
 
+def test_live_services_are_paginated_from_one_fetch_of_services(
+    app_,
+    platform_admin_client,
+    mock_get_detailed_services,
+):
+    services = [
+        service_json(name=name, restricted=False, created_at="200{}-01-01 12:00:00".format(index))
+        for index, name in enumerate(("A", "B", "C"))
+    ]
+    for service in services:
+        service["statistics"] = create_stats()
+    mock_get_detailed_services.return_value = {"data": services}
+
+    pages = []
+    with set_config(app_, "PLATFORM_ADMIN_SERVICES_PAGE_SIZE", 2):
+        for page in (1, 2):
+            response = platform_admin_client.get(url_for("main.live_services", page=page))
+            assert response.status_code == 200
+            pages.append(BeautifulSoup(response.data.decode("utf-8"), "html.parser"))
+        assert platform_admin_client.get(url_for("main.live_services", page=3)).status_code == 404
+
+    assert [
+        [service.tr.td.text.strip() for service in page.find_all("table")[0].find_all("tbody")[0].find_all("tbody")]
+        for page in pages
+    ] == [["C", "B"], ["A"]]
+    assert pages[0].select_one("a[rel=next]")["href"] == url_for("main.live_services", page=2)
+    assert pages[0].select_one("a[rel=previous]") is None
+    assert pages[1].select_one("a[rel=previous]")["href"] == url_for("main.live_services", page=1)
+    assert pages[1].select_one("a[rel=next]") is None
+    assert mock_get_detailed_services.call_count == 1
+
+
+def test_live_services_can_be_sorted_by_name(
+    platform_admin_client,
+    mock_get_detailed_services,
+):
+    services = [
+        service_json(name=name, restricted=False, active=active) for name, active in (("b", True), ("C", False), ("a", True))
+    ]
+    for service in services:
+        service["statistics"] = create_stats()
+    mock_get_detailed_services.return_value = {"data": services}
+
+    response = platform_admin_client.get(url_for("main.live_services", sort="name"))
+    assert response.status_code == 200
+    page = BeautifulSoup(response.data.decode("utf-8"), "html.parser")
+
+    table_body = page.find_all("table")[0].find_all("tbody")[0]
+    assert [service.tr.td.text.strip() for service in table_body.find_all("tbody")] == ["a", "b", "C"]
+    assert platform_admin_client.get(url_for("main.live_services", sort="foo")).status_code == 404
+
+
 @pytest.mark.parametrize("research_mode", (True, False))
 def test_shows_archived_label_instead_of_live_or_research_mode_label(
     platform_admin_client,
@@ -1224,7 +1276,7 @@ def test_get_notifications_sent_by_service_shows_date_form(client_request, platf
 
 
 def test_get_notifications_sent_by_service_validates_form(mocker, client_request, platform_admin_user):
-    mock_get_stats_from_api = mocker.patch("app.main.views.platform_admin.notification_api_client")
+    mock_get_stats_from_api = mocker.patch("app.report_snapshots.notification_api_client")
 
     client_request.login(platform_admin_user)
 
@@ -1247,7 +1299,7 @@ def test_usage_for_all_services_when_no_results_for_date(client_request, platfor
     client_request.login(platform_admin_user)
 
     mocker.patch(
-        "app.main.views.platform_admin.billing_api_client.get_usage_for_all_services",
+        "app.report_snapshots.billing_api_client.get_usage_for_all_services",
         return_value=[],
     )
 
@@ -1263,7 +1315,7 @@ def test_usage_for_all_services_when_no_results_for_date(client_request, platfor
 
 def test_usage_for_all_services_when_calls_api_and_download_data(platform_admin_client, mocker):
     mocker.patch(
-        "app.main.views.platform_admin.billing_api_client.get_usage_for_all_services",
+        "app.report_snapshots.billing_api_client.get_usage_for_all_services",
         return_value=[
             {
                 "letter_breakdown": "6 second class letters at 45p\n2 first class letters at 35p\n",
@@ -1352,7 +1404,7 @@ def test_usage_for_all_services_when_calls_api_and_download_data(platform_admin_
 )
 def test_get_notifications_sent_by_service_calls_api_and_downloads_data(mocker, platform_admin_client, api_data):
     mocker.patch(
-        "app.main.views.platform_admin.notification_api_client.get_notification_status_by_service",
+        "app.report_snapshots.notification_api_client.get_notification_status_by_service",
         return_value=api_data,
     )
     start_date = datetime.date(2019, 1, 1)
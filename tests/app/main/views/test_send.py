@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import json
 import sys
 import uuid
 from functools import partial
@@ -6,6 +7,7 @@ from glob import glob
 from io import BytesIO
 from itertools import repeat
 from os import path
+from unittest.mock import call
 from uuid import uuid4
 from zipfile import BadZipFile
 
@@ -19,7 +21,16 @@ from notifications_utils.template import LetterImageTemplate, LetterPreviewTempl
 from xlrd.biffh import XLRDError
 from xlrd.xldate import XLDateAmbiguous, XLDateError, XLDateNegative, XLDateTooLarge
 
-from app.main.views.send import daily_sms_fragment_count
+from app.csv_validation import index_rows
+from app.extensions import redis_client
+from app.main.views.send import (
+    csv_check_cache_key,
+    csv_column_headers_cache_key,
+    csv_row_index_cache_key,
+    daily_sms_fragment_count,
+    get_recipients_from_csv,
+)
+from app.s3_client.s3_csv_client import BulkSendUpload
 from tests import validate_route_permission, validate_route_permission_with_client
 from tests.conftest import (
     SERVICE_ONE_ID,
@@ -39,6 +50,7 @@ from tests.conftest import (
     mock_get_service_template,
     normalize_spaces,
     set_config,
+    set_config_values,
 )
 
 template_types = ["email", "sms"]
@@ -50,6 +62,14 @@ test_spreadsheet_files = glob(path.join("tests", "spreadsheet_files", "*"))
 test_non_spreadsheet_files = glob(path.join("tests", "non_spreadsheet_files", "*"))
 
 
+@pytest.fixture(autouse=True)
+def mock_get_empty_safelist(mocker):
+    return mocker.patch(
+        "app.service_api_client.get_safelist",
+        return_value={"email_addresses": [], "phone_numbers": []},
+    )
+
+
 @pytest.mark.parametrize("redis_value,expected_result", [(None, 0), ("3", 3)])
 def test_daily_sms_fragment_count(mocker, redis_value, expected_result):
     mocker.patch(
@@ -58,6 +78,40 @@ def test_daily_sms_fragment_count(mocker, redis_value, expected_result):
     assert daily_sms_fragment_count(SERVICE_ONE_ID) == expected_result
 
 
+def test_csv_check_cache_key_changes_with_trial_mode_and_safelist(fake_uuid):
+    keys = [
+        csv_check_cache_key(fake_uuid, fake_uuid, 1, False, safelist)
+        for safelist in (None, [], ["6502532222"], ["6502532222", "test@example.com"])
+    ]
+
+    assert len(set(keys)) == 4
+    assert csv_check_cache_key(fake_uuid, fake_uuid, 1, False, ["a@example.com", "b@example.com"]) == csv_check_cache_key(
+        fake_uuid, fake_uuid, 1, False, ["b@example.com", "a@example.com"]
+    )
+
+
+@pytest.mark.parametrize(
+    "processes, min_rows, expected_validated_in_chunks",
+    [
+        (2, 3, True),
+        (2, 4, False),
+        (1, 3, False),
+    ],
+)
+def test_get_recipients_from_csv_only_uses_processes_for_big_files(
+    app_, mocker, processes, min_rows, expected_validated_in_chunks
+):
+    mocker.patch("app.main.views.send.service_can_bulk_send", return_value=True)
+    mock_validate_in_chunks = mocker.patch("app.main.views.send.validate_in_chunks")
+    contents = "phone number\n6502532222\n6502532223\n6502532224"
+
+    with set_config_values(app_, {"CSV_VALIDATION_PROCESSES": processes, "CSV_VALIDATION_MIN_ROWS_FOR_PROCESSES": min_rows}):
+        recipients = get_recipients_from_csv(SERVICE_ONE_ID, contents, template_type="sms")
+
+    assert mock_validate_in_chunks.called is expected_validated_in_chunks
+    assert isinstance(recipients, RecipientCSV) is not expected_validated_in_chunks
+
+
 @pytest.mark.parametrize(
     "template_type, sender_data, expected_title, expected_description",
     [
@@ -691,6 +745,118 @@ def test_upload_valid_csv_shows_preview_and_table(
             assert normalize_spaces(str(row.select("td")[index + 1])) == cell
 
 
+def test_check_messages_reuses_cached_summary(
+    client_request,
+    mocker,
+    mock_get_live_service,
+    mock_get_service_template_with_placeholders,
+    mock_get_users_by_service,
+    mock_get_service_statistics,
+    mock_get_template_statistics,
+    mock_get_job_doesnt_exist,
+    mock_get_jobs,
+    mock_s3_set_metadata,
+    fake_uuid,
+):
+    mocker.patch(
+        "app.main.views.send.s3download",
+        return_value="phone number,name,thing,thing,thing\n6502532223,A,foo,foo,foo",
+    )
+    cached_summary = {
+        "count_of_recipients": 1,
+        "rows_with_bad_recipients": 0,
+        "rows_with_missing_data": 0,
+        "sms_parts_to_send": 1,
+        "has_errors": False,
+    }
+    mocker.patch(
+        "app.extensions.RedisClient.get",
+        side_effect=lambda key: json.dumps(cached_summary) if key.startswith("csv-upload-{}-check-".format(fake_uuid)) else None,
+    )
+    mock_count_sms_parts = mocker.patch("app.main.views.send.count_sms_parts_to_send")
+
+    page = client_request.get(
+        "main.check_messages",
+        service_id=SERVICE_ONE_ID,
+        template_id=fake_uuid,
+        upload_id=fake_uuid,
+        original_file_name="example.csv",
+    )
+
+    assert page.h1.text.strip() == "Review before sending"
+    assert mock_count_sms_parts.called is False
+    mock_s3_set_metadata.assert_called_once_with(
+        SERVICE_ONE_ID,
+        fake_uuid,
+        notification_count=1,
+        template_id=fake_uuid,
+        valid=True,
+        original_file_name="example.csv",
+    )
+
+
+def test_check_messages_only_reads_the_rows_it_shows_once_checked(
+    client_request,
+    mocker,
+    mock_get_live_service,
+    mock_get_service_template_with_placeholders,
+    mock_get_users_by_service,
+    mock_get_service_statistics,
+    mock_get_template_statistics,
+    mock_get_job_doesnt_exist,
+    mock_get_jobs,
+    mock_s3_set_metadata,
+    fake_uuid,
+):
+    contents = "phone number,name\r\n6502532222,Jo\r\n6502532223,Al\r\n6502532224,Ed"
+    column_headers, offsets = index_rows(contents)
+    row_index = "".join("{:012x}".format(offset) for offset in offsets)
+    cached = {
+        csv_column_headers_cache_key(fake_uuid): json.dumps(column_headers),
+    }
+    cached_summary = {
+        "count_of_recipients": 3,
+        "rows_with_bad_recipients": 0,
+        "rows_with_missing_data": 0,
+        "sms_parts_to_send": 3,
+        "has_errors": False,
+    }
+    mocker.patch.object(redis_client, "active", True)
+    mock_redis_store = mocker.patch.object(redis_client, "redis_store")
+    mock_redis_store.getrange.side_effect = lambda key, start, end: (
+        row_index[start : end + 1] if key == csv_row_index_cache_key(fake_uuid) else ""
+    )
+    mocker.patch(
+        "app.extensions.RedisClient.get",
+        side_effect=lambda key: (
+            json.dumps(cached_summary) if key.startswith("csv-upload-{}-check-".format(fake_uuid)) else cached.get(key)
+        ),
+    )
+    mock_s3download = mocker.patch("app.main.views.send.s3download")
+    mock_s3download_range = mocker.patch(
+        "app.main.views.send.s3download_range",
+        side_effect=lambda service_id, upload_id, start, end: contents.encode("utf-8")[start:end].decode("utf-8"),
+    )
+
+    page = client_request.get(
+        "main.check_messages",
+        service_id=SERVICE_ONE_ID,
+        template_id=fake_uuid,
+        upload_id=fake_uuid,
+        row_index=4,
+        show=1,
+        original_file_name="example.csv",
+    )
+
+    assert mock_s3download.called is False
+    assert mock_s3download_range.call_args_list == [
+        call(SERVICE_ONE_ID, fake_uuid, offsets[0], offsets[1]),
+        call(SERVICE_ONE_ID, fake_uuid, offsets[2], offsets[3]),
+    ]
+    assert page.select_one(".sms-message-wrapper").text.strip() == "Test Service: Ed, Template <em>content</em> with & entity"
+    assert len(page.select("tbody tr")) == 1
+
+
 def test_upload_valid_csv_only_sets_meta_if_filename_known(
     client_request,
     mocker,
@@ -3679,7 +3845,7 @@ def test_s3_send_page_only_visible_to_hc(logged_in_client, fake_uuid, mocker, bu
         s3_file_objects.append(x)
 
     mocker.patch("app.main.views.send.service_can_bulk_send", return_value=bulk_send_allowed)
-    mocker.patch("app.main.views.send.list_bulk_send_uploads", return_value=s3_file_objects)
+    mocker.patch("app.main.views.send.list_bulk_send_uploads", return_value=(s3_file_objects, False))
     mocker.patch("app.service_api_client.get_service_template", return_value=create_template(template_type="email"))
     partial_url = partial(url_for, "main.s3_send")
     response = logged_in_client.get(
@@ -3708,7 +3874,7 @@ def test_s3_send_shows_available_files(
         s3_file_objects.append(x)
 
     mocker.patch("app.main.views.send.service_can_bulk_send", return_value=True)
-    mocker.patch("app.main.views.send.list_bulk_send_uploads", return_value=s3_file_objects)
+    mocker.patch("app.main.views.send.list_bulk_send_uploads", return_value=(s3_file_objects, False))
     mocker.patch("app.service_api_client.get_service_template", return_value=create_template(template_type="email"))
     partial_url = partial(url_for, "main.s3_send")
     response = logged_in_client.get(
@@ -3725,6 +3891,64 @@ def test_s3_send_shows_available_files(
     assert multiple_choise_options == expected_filenames
 
 
+def test_s3_send_shows_page_of_files_matching_prefix(
+    logged_in_client,
+    fake_uuid,
+    mocker,
+):
+    mocker.patch("app.main.views.send.service_can_bulk_send", return_value=True)
+    mock_list_bulk_send_uploads = mocker.patch(
+        "app.main.views.send.list_bulk_send_uploads",
+        return_value=([BulkSendUpload("hc/file2.csv", "2021-01-01T00:00:00+00:00")], True),
+    )
+    mocker.patch("app.service_api_client.get_service_template", return_value=create_template(template_type="email"))
+    response = logged_in_client.get(
+        url_for("main.s3_send", service_id=SERVICE_ONE_ID, template_id=fake_uuid, prefix="hc/", page=2),
+    )
+    page = BeautifulSoup(response.data.decode("utf-8"), "html.parser")
+
+    assert response.status_code == 200
+    mock_list_bulk_send_uploads.assert_called_once_with(prefix="hc/", page=2)
+    assert [x.text.strip() for x in page.select(".multiple-choice label")] == ["hc/file2.csv"]
+    assert page.select_one("input[name=prefix]")["value"] == "hc/"
+    assert page.select_one("a[rel=previous]")["href"] == url_for(
+        "main.s3_send", service_id=SERVICE_ONE_ID, template_id=fake_uuid, prefix="hc/", page=1
+    )
+    assert page.select_one("a[rel=next]")["href"] == url_for(
+        "main.s3_send", service_id=SERVICE_ONE_ID, template_id=fake_uuid, prefix="hc/", page=3
+    )
+
+
+def test_s3_send_accepts_a_file_which_has_moved_to_another_page(
+    logged_in_client,
+    fake_uuid,
+    mocker,
+):
+    mocker.patch("app.main.views.send.service_can_bulk_send", return_value=True)
+    mocker.patch(
+        "app.main.views.send.list_bulk_send_uploads",
+        return_value=([BulkSendUpload("hc/file3.csv", "2021-01-02T00:00:00+00:00")], True),
+    )
+    mock_get_bulk_send_uploads = mocker.patch(
+        "app.main.views.send.get_bulk_send_uploads",
+        return_value=[
+            BulkSendUpload("hc/file3.csv", "2021-01-02T00:00:00+00:00"),
+            BulkSendUpload("hc/file2.csv", "2021-01-01T00:00:00+00:00"),
+        ],
+    )
+    mock_copy = mocker.patch("app.main.views.send.copy_bulk_send_file_to_uploads", return_value=fake_uuid)
+    mocker.patch("app.service_api_client.get_service_template", return_value=create_template(template_type="email"))
+
+    response = logged_in_client.post(
+        url_for("main.s3_send", service_id=SERVICE_ONE_ID, template_id=fake_uuid, prefix="hc/"),
+        data={"s3_files": "hc/file2.csv"},
+    )
+
+    assert response.status_code == 302
+    mock_get_bulk_send_uploads.assert_called_once_with("hc/")
+    mock_copy.assert_called_once_with(SERVICE_ONE_ID, "hc/file2.csv")
+
+
 @pytest.mark.parametrize(
     "feature_flag, expected",
     [(True, 1), (False, 0)],
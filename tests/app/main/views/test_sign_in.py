@@ -7,6 +7,7 @@ from bs4 import BeautifulSoup
 from flask import current_app, url_for
 
 from app.models.user import User
+from app.utils import ip_geolocations
 from tests.conftest import normalize_spaces
 
 
@@ -433,6 +434,8 @@ def test_sign_in_security_center_notification_for_non_NA_signins(
     )
     assert response.status_code == 302
 
+    # New IP addresses are looked up after the response has been sent
+    ip_geolocations.join()
     reporter.assert_called()
 
 
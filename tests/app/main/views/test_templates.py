@@ -45,6 +45,7 @@ from tests.conftest import (
     fake_uuid,
     mock_get_service_template_with_process_type,
     normalize_spaces,
+    set_config,
 )
 
 
@@ -342,6 +343,106 @@ def test_should_show_live_search_if_service_has_lots_of_folders(
     assert count_of_templates == 4
 
 
+def test_should_only_list_current_folder_and_search_on_server_if_service_has_lots_of_templates(
+    app_,
+    client_request,
+    mock_get_template_folders,
+    mock_get_service_templates,  # returns 4 templates
+):
+    mock_get_template_folders.return_value = [
+        _folder("one", PARENT_FOLDER_ID),
+        _folder("two", None, parent=PARENT_FOLDER_ID),
+        _folder("three", None, parent=PARENT_FOLDER_ID),
+        _folder("four", None, parent=PARENT_FOLDER_ID),
+    ]
+
+    with set_config(app_, "TEMPLATE_LIST_MAX_NESTED_ITEMS", 7):
+        page = client_request.get(
+            "main.choose_template",
+            service_id=SERVICE_ONE_ID,
+        )
+
+    assert [normalize_spaces(link.text) for link in page.select(".message-name a")] == [
+        "one",
+        "sms_template_one",
+        "sms_template_two",
+        "email_template_one",
+        "email_template_two",
+    ]
+    assert page.select_one(".live-search")["data-search-url"] == url_for(
+        "main.search_templates", service_id=SERVICE_ONE_ID, template_type="all"
+    )
+
+
+@pytest.mark.parametrize(
+    "extra_args, expected_names",
+    (
+        ({"q": "email tem"}, ["email_template_one", "email_template_two"]),
+        ({"q": "templte two", "template_type": "sms"}, ["sms_template_two"]),
+        ({"q": "two"}, ["email_template_two", "sms_template_two", "two"]),
+        ({"q": "subject", "content": "1"}, ["email_template_one", "email_template_two"]),
+        ({"q": "subject"}, []),
+        ({"q": "template", "page": "2"}, []),
+    ),
+)
+def test_search_templates(
+    logged_in_client,
+    mock_get_template_folders,
+    mock_get_service_templates,
+    extra_args,
+    expected_names,
+):
+    mock_get_template_folders.return_value = [
+        _folder("one", PARENT_FOLDER_ID),
+        _folder("two", CHILD_FOLDER_ID, parent=PARENT_FOLDER_ID),
+    ]
+
+    response = logged_in_client.get(url_for("main.search_templates", service_id=SERVICE_ONE_ID, **extra_args))
+
+    assert response.status_code == 200
+    assert [item["name"] for item in response.json["results"]] == expected_names
+    assert response.json["next_page"] is None
+
+    for item in response.json["results"]:
+        if item["type"] == "folder":
+            assert item["path"] == ["one"]
+            assert item["url"] == url_for(
+                "main.choose_template", service_id=SERVICE_ONE_ID, template_type="all", template_folder_id=CHILD_FOLDER_ID
+            )
+        else:
+            assert item["url"] == url_for("main.view_template", service_id=SERVICE_ONE_ID, template_id=item["id"])
+
+
+@pytest.mark.parametrize("page", ["0", "-1", "two"])
+def test_search_templates_rejects_invalid_pages(
+    logged_in_client,
+    mock_get_template_folders,
+    mock_get_service_templates,
+    page,
+):
+    response = logged_in_client.get(url_for("main.search_templates", service_id=SERVICE_ONE_ID, q="template", page=page))
+
+    assert response.status_code == 404
+
+
+def test_search_templates_leaves_out_folders_the_user_cannot_see(
+    logged_in_client,
+    active_user_with_permissions,
+    mock_get_template_folders,
+    mock_get_service_templates,
+):
+    mock_get_template_folders.return_value = [
+        _folder("visible", PARENT_FOLDER_ID, users_with_permission=[active_user_with_permissions["id"]]),
+        _folder("hidden", CHILD_FOLDER_ID, users_with_permission=[]),
+    ]
+
+    response = logged_in_client.get(url_for("main.search_templates", service_id=SERVICE_ONE_ID, q="hidden"))
+    assert response.json["results"] == []
+
+    response = logged_in_client.get(url_for("main.search_templates", service_id=SERVICE_ONE_ID, q="visible"))
+    assert [item["name"] for item in response.json["results"]] == ["visible"]
+
+
 @pytest.mark.parametrize(
     "extra_permissions, expected_values, expected_labels",
     (
@@ -935,6 +1036,58 @@ def test_choose_a_template_to_copy(
     )
 
 
+@pytest.mark.parametrize("concurrency", [1, 8])
+def test_choose_a_template_to_copy_only_lists_services_when_there_are_lots_of_templates(
+    app_,
+    client_request,
+    mock_get_service_templates,
+    mock_get_template_folders,
+    mock_get_just_services_for_user,
+    concurrency,
+):
+    with set_config(app_, "TEMPLATE_LIST_MAX_NESTED_ITEMS", 11), set_config(app_, "TEMPLATE_PREFETCH_CONCURRENCY", concurrency):
+        page = client_request.get(
+            "main.choose_template_to_copy",
+            service_id=SERVICE_ONE_ID,
+        )
+
+    assert [normalize_spaces(item.text) for item in page.select(".template-list-item")] == [
+        "Service 1 6 templates",
+        "Service 2 6 templates",
+    ]
+    assert page.select("main nav a")[0]["href"] == url_for(
+        "main.choose_template_to_copy",
+        service_id=SERVICE_ONE_ID,
+        from_service=SERVICE_TWO_ID,
+    )
+
+
+def test_choose_a_template_to_copy_prefetches_through_the_api_client(
+    app_,
+    client_request,
+    mock_get_just_services_for_user,
+    mocker,
+):
+    def _request(method, url, params=None):
+        if url.endswith("/template-folder"):
+            return {"template_folders": []}
+        return {"data": []}
+
+    # Patches the request under `NotifyAdminAPIClient.get`, rather than the
+    # client methods, so that logging the call looks up the current service
+    mock_request = mocker.patch("notifications_python_client.base.BaseAPIClient.request", side_effect=_request)
+
+    with set_config(app_, "TEMPLATE_PREFETCH_CONCURRENCY", 8):
+        client_request.get("main.choose_template_to_copy", service_id=SERVICE_ONE_ID)
+
+    assert {args[1] for args, _ in mock_request.call_args_list} >= {
+        "/service/{}/template".format(SERVICE_ONE_ID),
+        "/service/{}/template-folder".format(SERVICE_ONE_ID),
+        "/service/{}/template".format(SERVICE_TWO_ID),
+        "/service/{}/template-folder".format(SERVICE_TWO_ID),
+    }
+
+
 def test_choose_a_template_to_copy_when_user_has_one_service(
     client_request,
     mock_get_service_templates,
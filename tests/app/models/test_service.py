@@ -1,3 +1,4 @@
+import json
 import uuid
 from unittest.mock import PropertyMock
 
@@ -359,3 +360,98 @@ def test_go_live_checklist_completed(
 
     with app_.test_request_context():
         assert Service(service_one).go_live_checklist_completed == expected_readyness
+
+
+def test_trial_mode_safelist_is_formatted_and_cached(mocker, service_one, mock_get_users_by_service):
+    mocker.patch("app.extensions.RedisClient.get", return_value=None)
+    mock_redis_set = mocker.patch("app.extensions.RedisClient.set")
+    mocker.patch(
+        "app.service_api_client.get_safelist",
+        return_value={"email_addresses": ["Someone@Example.com"], "phone_numbers": ["(650) 253-2223"]},
+    )
+
+    safelist = Service(service_one).trial_mode_safelist
+
+    assert safelist == frozenset(
+        {"+16502532222", "+16502532223", "notify@digital.cabinet-office.canada.ca", "someone@example.com"}
+    )
+    mock_redis_set.assert_called_once_with(
+        "service-{}-trial-mode-safelist".format(service_one["id"]),
+        json.dumps(sorted(safelist)),
+        ex=604800,
+    )
+
+
+def test_trial_mode_safelist_comes_from_cache(mocker, service_one):
+    mocker.patch("app.extensions.RedisClient.get", return_value=json.dumps(["+16502532222"]))
+    mock_get_users = mocker.patch("app.models.user.Users.client")
+    mock_get_safelist = mocker.patch("app.service_api_client.get_safelist")
+
+    assert Service(service_one).trial_mode_safelist == frozenset({"+16502532222"})
+    assert not mock_get_users.called
+    assert not mock_get_safelist.called
+
+
+def test_trial_mode_safelist_is_only_built_once_per_service(mocker, service_one):
+    mock_redis_get = mocker.patch("app.extensions.RedisClient.get", return_value=json.dumps(["+16502532222"]))
+    service = Service(service_one)
+
+    assert service.trial_mode_safelist is service.trial_mode_safelist
+    mock_redis_get.assert_called_once_with("service-{}-trial-mode-safelist".format(service_one["id"]))
+
+
+def test_get_template_folders_only_shows_folders_with_templates_of_type_somewhere_inside(
+    mocker, service_one, mock_get_template_folders
+):
+    mock_get_template_folders.return_value = [
+        {"id": "a", "name": "A", "parent_id": None},
+        {"id": "b", "name": "B", "parent_id": "a"},
+        {"id": "c", "name": "C", "parent_id": "b"},
+        {"id": "d", "name": "D", "parent_id": None},
+    ]
+    mock_get_service_templates = mocker.patch(
+        "app.service_api_client.get_service_templates",
+        return_value={
+            "data": [
+                {"id": "1", "name": "one", "template_type": "sms", "folder": "c"},
+                {"id": "2", "name": "two", "template_type": "email", "folder": "d"},
+                {"id": "3", "name": "three", "template_type": "email", "folder": None},
+            ]
+        },
+    )
+    service = Service(service_one)
+
+    assert [folder["id"] for folder in service.get_template_folders("sms")] == ["a"]
+    assert [folder["id"] for folder in service.get_template_folders("sms", "a")] == ["b"]
+    assert [folder["id"] for folder in service.get_template_folders("email")] == ["d"]
+    assert [folder["id"] for folder in service.get_template_folders("all")] == ["a", "d"]
+    assert [template["id"] for template in service.get_templates("email")] == ["3"]
+    assert [template["id"] for template in service.get_templates("sms", "c")] == ["1"]
+    assert service.is_folder_visible("b", "sms") is True
+    assert service.is_folder_visible("b", "email") is False
+
+    assert mock_get_template_folders.call_count == 1
+    assert mock_get_service_templates.call_count == 1
+
+
+def test_get_user_template_folders_is_worked_out_once_per_user(
+    mocker, mock_get_template_folders, service_one, active_user_with_permissions
+):
+    mock_get_template_folders.return_value = _get_all_folders(active_user_with_permissions)
+    service = Service(service_one)
+    user = User(active_user_with_permissions)
+    mock_get_folder_ids = mocker.spy(service, "get_template_folder_ids_with_permission")
+
+    assert service.get_user_template_folders(user) is service.get_user_template_folders(user)
+    assert mock_get_folder_ids.call_count == 1
+    assert mock_get_template_folders.call_count == 1
+
+
+def test_get_template_folder_ids_with_permission(mock_get_template_folders, service_one, active_user_with_permissions):
+    mock_get_template_folders.return_value = _get_all_folders(active_user_with_permissions)
+    service = Service(service_one)
+
+    assert len(service.get_template_folder_ids_with_permission(User(active_user_with_permissions))) == 6
+    assert (
+        len(service.get_template_folder_ids_with_permission(User(dict(active_user_with_permissions, platform_admin=True)))) == 10
+    )
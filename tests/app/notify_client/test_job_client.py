@@ -2,15 +2,18 @@ import uuid
 from unittest.mock import ANY
 
 import pytest
+from freezegun import freeze_time
 
 from app.notify_client.job_api_client import JobApiClient
 
 
+@freeze_time("2021-01-01 12:00")
 def test_client_creates_job_data_correctly(mocker, fake_uuid):
     job_id = fake_uuid
     service_id = fake_uuid
     mocker.patch("app.notify_client.current_user", id="1")
     mock_redis_set = mocker.patch("app.extensions.RedisClient.set")
+    mock_redis_set_hash = mocker.patch("app.extensions.RedisClient.set_hash_and_expire")
 
     expected_data = {"id": job_id, "created_by": "1"}
 
@@ -19,7 +22,15 @@ def test_client_creates_job_data_correctly(mocker, fake_uuid):
     client = JobApiClient()
     mock_post = mocker.patch(
         "app.notify_client.job_api_client.JobApiClient.post",
-        return_value={"data": dict(statistics=[], **expected_data)},
+        return_value={
+            "data": dict(
+                statistics=[],
+                template="template-id",
+                template_version=2,
+                original_file_name="file.csv",
+                **expected_data,
+            )
+        },
     )
 
     client.create_job(service_id, job_id)
@@ -29,6 +40,11 @@ def test_client_creates_job_data_correctly(mocker, fake_uuid):
         b"true",
         ex=604800,
     )
+    mock_redis_set_hash.assert_called_once_with(
+        "jobs-sent-{}-2021-01-01".format(service_id),
+        {'["template-id", "2", "file.csv"]': 1},
+        86400,
+    )
 
 
 def test_client_schedules_job(mocker, fake_uuid):
@@ -316,6 +332,96 @@ def test_cancel_job(mocker):
     mock_post.assert_called_once_with(url="/service/{}/job/{}/cancel".format("service_id", "job_id"), data={})
 
 
+@freeze_time("2021-01-01 12:00")
+@pytest.mark.parametrize("method", ["cancel_job", "cancel_letter_job"])
+def test_cancelling_a_job_clears_fingerprints_for_today(mocker, method):
+    mocker.patch("app.notify_client.job_api_client.JobApiClient.post", return_value={"data": {"statistics": []}})
+    mock_redis_delete = mocker.patch("app.extensions.RedisClient.delete")
+
+    getattr(JobApiClient(), method)("service_id", "job_id")
+
+    mock_redis_delete.assert_any_call("jobs-sent-service_id-2021-01-01")
+
+
+@freeze_time("2021-01-01 12:00")
+@pytest.mark.parametrize(
+    "template_id, template_version, original_file_name, expected",
+    [
+        ("template-id", 2, "file.csv", True),
+        ("template-id", 1, "file.csv", False),
+        ("template-id", 2, "other.csv", False),
+        ("cancelled-template-id", 1, "file.csv", False),
+    ],
+)
+def test_has_sent_previously_loads_fingerprints_on_cold_miss(
+    mocker,
+    template_id,
+    template_version,
+    original_file_name,
+    expected,
+):
+    mocker.patch("app.extensions.RedisClient.get_all_from_hash", return_value=None)
+    mock_redis_set_hash = mocker.patch("app.extensions.RedisClient.set_hash_and_expire")
+    mock_get_jobs = mocker.patch(
+        "app.notify_client.job_api_client.JobApiClient.get_jobs",
+        return_value={
+            "data": [
+                {
+                    "template": "template-id",
+                    "template_version": 2,
+                    "original_file_name": "file.csv",
+                    "job_status": "finished",
+                },
+                {
+                    "template": "cancelled-template-id",
+                    "template_version": 1,
+                    "original_file_name": "file.csv",
+                    "job_status": "cancelled",
+                },
+            ]
+        },
+    )
+
+    assert JobApiClient().has_sent_previously("service_id", template_id, template_version, original_file_name) is expected
+
+    mock_get_jobs.assert_called_once_with("service_id", limit_days=0)
+    mock_redis_set_hash.assert_called_once_with(
+        "jobs-sent-service_id-2021-01-01",
+        {'["template-id", "2", "file.csv"]': 1, "__loaded__": 1},
+        86400,
+    )
+
+
+@pytest.mark.parametrize(
+    "cached_fingerprints, expected",
+    [
+        ({b'["template-id", "2", "file.csv"]': b"1", b"__loaded__": b"1"}, True),
+        ({"__loaded__": "1"}, False),
+    ],
+)
+def test_has_sent_previously_uses_loaded_fingerprints(mocker, cached_fingerprints, expected):
+    mocker.patch("app.extensions.RedisClient.get_all_from_hash", return_value=cached_fingerprints)
+    mock_get_jobs = mocker.patch("app.notify_client.job_api_client.JobApiClient.get_jobs")
+
+    assert JobApiClient().has_sent_previously("service_id", "template-id", 2, "file.csv") is expected
+    assert not mock_get_jobs.called
+
+
+def test_has_sent_previously_reloads_fingerprints_if_not_fully_loaded(mocker):
+    mocker.patch(
+        "app.extensions.RedisClient.get_all_from_hash",
+        return_value={b'["other-template-id", "1", "file.csv"]': b"1"},
+    )
+    mocker.patch("app.extensions.RedisClient.set_hash_and_expire")
+    mock_get_jobs = mocker.patch(
+        "app.notify_client.job_api_client.JobApiClient.get_jobs",
+        return_value={"data": []},
+    )
+
+    assert JobApiClient().has_sent_previously("service_id", "template-id", 2, "file.csv") is False
+    mock_get_jobs.assert_called_once_with("service_id", limit_days=0)
+
+
 @pytest.mark.parametrize(
     "job_data, expected_cache_value",
     [
@@ -1,8 +1,31 @@
-from unittest.mock import Mock
+import hashlib
+import json
+from datetime import datetime, timezone
+from io import BytesIO
+from unittest.mock import Mock, call
 
+import pytest
 from flask import current_app
 
-from app.s3_client.s3_csv_client import set_metadata_on_csv_upload
+from app.s3_client.s3_csv_client import (
+    BULK_SEND_UPLOADS_CACHE_KEY,
+    BULK_SEND_UPLOADS_CACHE_TTL,
+    BulkSendUpload,
+    ETagChecksum,
+    S3DownloadChecksumError,
+    bulk_send_uploads_index_refreshes,
+    copy_bulk_send_file_to_uploads,
+    get_bulk_send_uploads_index,
+    get_parts,
+    iter_object_parts,
+    list_bulk_send_uploads,
+    refresh_bulk_send_uploads_index_in_background,
+    s3download,
+    s3download_range,
+    s3upload_in_parts,
+    set_metadata_on_csv_upload,
+)
+from tests.conftest import set_config
 
 
 def test_sets_metadata(client, mocker):
@@ -21,3 +44,299 @@ def test_sets_metadata(client, mocker):
         MetadataDirective="REPLACE",
         ServerSideEncryption="AES256",
     )
+
+
+@pytest.mark.parametrize(
+    "chunks, expected_parts",
+    [
+        ([], [b""]),
+        (["ab", "cd"], [b"abc", b"d"]),
+        (["abcdef"], [b"abc", b"def"]),
+        (["é", "é"], [b"\xc3\xa9\xc3", b"\xa9"]),
+    ],
+)
+def test_get_parts(chunks, expected_parts):
+    assert list(get_parts(iter(chunks), part_size=3)) == expected_parts
+
+
+def test_s3upload_in_parts_puts_small_files_in_one_go(mocker):
+    mock_client = mocker.patch("app.s3_client.s3_csv_client.client").return_value
+
+    s3upload_in_parts(iter(["phone number\r\n", "6502532222"]), "ca-central-1", "bucket", "file.csv")
+
+    mock_client.put_object.assert_called_once_with(
+        Body=b"phone number\r\n6502532222",
+        Bucket="bucket",
+        Key="file.csv",
+        ServerSideEncryption="AES256",
+        ContentType="binary/octet-stream",
+    )
+    assert not mock_client.create_multipart_upload.called
+
+
+def test_s3upload_in_parts_uses_multipart_upload_for_large_files(mocker):
+    mocker.patch("app.s3_client.s3_csv_client.MULTIPART_UPLOAD_PART_SIZE", 4)
+    mocker.patch(
+        "app.s3_client.s3_csv_client.get_parts",
+        return_value=iter([b"1234", b"5678", b"9"]),
+    )
+    mock_client = mocker.patch("app.s3_client.s3_csv_client.client").return_value
+    mock_client.create_multipart_upload.return_value = {"UploadId": "upload-id"}
+    mock_client.upload_part.side_effect = [{"ETag": "a"}, {"ETag": "b"}, {"ETag": "c"}]
+
+    s3upload_in_parts(iter([]), "ca-central-1", "bucket", "file.csv")
+
+    assert mock_client.upload_part.call_args_list == [
+        call(Bucket="bucket", Key="file.csv", UploadId="upload-id", PartNumber=1, Body=b"1234"),
+        call(Bucket="bucket", Key="file.csv", UploadId="upload-id", PartNumber=2, Body=b"5678"),
+        call(Bucket="bucket", Key="file.csv", UploadId="upload-id", PartNumber=3, Body=b"9"),
+    ]
+    mock_client.complete_multipart_upload.assert_called_once_with(
+        Bucket="bucket",
+        Key="file.csv",
+        UploadId="upload-id",
+        MultipartUpload={
+            "Parts": [
+                {"PartNumber": 1, "ETag": "a"},
+                {"PartNumber": 2, "ETag": "b"},
+                {"PartNumber": 3, "ETag": "c"},
+            ]
+        },
+    )
+
+
+def test_s3upload_in_parts_aborts_upload_if_reading_the_file_fails(mocker):
+    def _parts(chunks):
+        yield b"1234"
+        yield b"5678"
+        raise UnicodeDecodeError("utf-8", b"", 0, 1, "bad")
+
+    mocker.patch("app.s3_client.s3_csv_client.get_parts", side_effect=_parts)
+    mock_client = mocker.patch("app.s3_client.s3_csv_client.client").return_value
+    mock_client.create_multipart_upload.return_value = {"UploadId": "upload-id"}
+
+    with pytest.raises(UnicodeDecodeError):
+        s3upload_in_parts(iter([]), "ca-central-1", "bucket", "file.csv")
+
+    mock_client.abort_multipart_upload.assert_called_once_with(Bucket="bucket", Key="file.csv", UploadId="upload-id")
+    assert not mock_client.complete_multipart_upload.called
+
+
+def _etag(data, upload_part_size=None):
+    if not upload_part_size:
+        return '"{}"'.format(hashlib.md5(data).hexdigest())
+    part_digests = [
+        hashlib.md5(data[start : start + upload_part_size]).digest() for start in range(0, len(data), upload_part_size)
+    ]
+    return '"{}-{}"'.format(hashlib.md5(b"".join(part_digests)).hexdigest(), len(part_digests))
+
+
+def _mock_s3_client(data, etag=None, upload_part_size=None):
+    etag = etag or _etag(data, upload_part_size)
+
+    def _get_object(Bucket, Key, Range, IfMatch=None):
+        start, end = map(int, Range.replace("bytes=", "").split("-"))
+        return {
+            "Body": BytesIO(data[start : end + 1]),
+            "ETag": etag,
+            "ContentRange": "bytes {}-{}/{}".format(start, min(end, len(data) - 1), len(data)),
+        }
+
+    s3 = Mock()
+    s3.get_object.side_effect = _get_object
+    s3.head_object.return_value = {"ContentLength": upload_part_size}
+    return s3
+
+
+@pytest.mark.parametrize("upload_part_size", [None, 3, 4, 100])
+@pytest.mark.parametrize("chunk_size", [1, 2, 5])
+def test_etag_checksum(upload_part_size, chunk_size):
+    data = b"phone number\r\n6502532222"
+    checksum = ETagChecksum(_etag(data, upload_part_size), upload_part_size)
+    for start in range(0, len(data), chunk_size):
+        checksum.update(data[start : start + chunk_size])
+
+    checksum.verify("file.csv")
+
+
+@pytest.mark.parametrize("upload_part_size", [None, 7])
+@pytest.mark.parametrize("part_size, concurrency", [(4, 1), (4, 3), (100, 2)])
+def test_iter_object_parts_downloads_ranges_in_order(upload_part_size, part_size, concurrency):
+    data = "phone number\r\n6502532222\r\n6502532223 ✅".encode("utf-8")
+    s3 = _mock_s3_client(data, upload_part_size=upload_part_size)
+
+    parts = list(iter_object_parts(s3, "bucket", "file.csv", part_size=part_size, concurrency=concurrency))
+
+    assert b"".join(parts) == data
+    assert all(len(part) <= part_size for part in parts)
+    assert s3.get_object.call_count == len(parts)
+    for get_object_call in s3.get_object.call_args_list[1:]:
+        assert get_object_call.kwargs["IfMatch"] == _etag(data, upload_part_size)
+
+
+def test_iter_object_parts_raises_if_checksum_doesnt_match():
+    s3 = _mock_s3_client(b"phone number\r\n6502532222", etag='"{}"'.format(hashlib.md5(b"something else").hexdigest()))
+
+    with pytest.raises(S3DownloadChecksumError):
+        list(iter_object_parts(s3, "bucket", "file.csv", part_size=4, concurrency=2))
+
+
+def test_s3download_can_return_a_streaming_reader(app_, mocker):
+    data = "phone number\r\n6502532222\r\nAmélie".encode("utf-8")
+    mocker.patch("app.s3_client.s3_csv_client.client", return_value=_mock_s3_client(data))
+
+    with set_config(app_, "S3_DOWNLOAD_PART_SIZE", 5):
+        contents = s3download("1234", "5678")
+        with s3download("1234", "5678", stream=True) as reader:
+            lines = list(reader)
+
+    assert contents == data.decode("utf-8")
+    assert lines == ["phone number\r\n", "6502532222\r\n", "Amélie"]
+
+
+def test_s3download_range_only_downloads_the_bytes_asked_for(app_, mocker):
+    data = "phone number\r\n6502532222\r\nAmélie".encode("utf-8")
+    s3 = _mock_s3_client(data)
+    mocker.patch("app.s3_client.s3_csv_client.client", return_value=s3)
+
+    assert s3download_range("1234", "5678", 26, len(data)) == "Amélie"
+    assert s3download_range("1234", "5678", 26, 26) == ""
+    assert s3.get_object.call_count == 1
+    assert s3.get_object.call_args[1]["Range"] == "bytes=26-{}".format(len(data) - 1)
+
+
+def test_copy_bulk_send_file_to_uploads_copies_small_files_in_one_request(app_, mocker):
+    mock_client = mocker.patch("app.s3_client.s3_csv_client.client").return_value
+    mock_client.head_object.return_value = {"ContentLength": 1024, "ETag": '"etag"'}
+    mocker.patch("app.s3_client.s3_csv_client.uuid.uuid4", return_value="5678")
+
+    with set_config(app_, "BULK_SEND_AWS_BUCKET", "bulk-send-bucket"):
+        upload_id = copy_bulk_send_file_to_uploads("1234", "bulk.csv")
+
+    assert upload_id == "5678"
+    mock_client.head_object.assert_called_once_with(Bucket="bulk-send-bucket", Key="bulk.csv")
+    mock_client.copy_object.assert_called_once_with(
+        CopySource={"Bucket": "bulk-send-bucket", "Key": "bulk.csv"},
+        CopySourceIfMatch='"etag"',
+        MetadataDirective="REPLACE",
+        Bucket=current_app.config["CSV_UPLOAD_BUCKET_NAME"],
+        Key="service-1234-notify/5678.csv",
+        ServerSideEncryption="AES256",
+        ContentType="binary/octet-stream",
+    )
+    assert not mock_client.create_multipart_upload.called
+    assert not mock_client.get_object.called
+
+
+def test_copy_bulk_send_file_to_uploads_copies_large_files_in_parts(app_, mocker):
+    mocker.patch("app.s3_client.s3_csv_client.MULTIPART_COPY_THRESHOLD", 10)
+    mocker.patch("app.s3_client.s3_csv_client.MULTIPART_COPY_PART_SIZE", 4)
+    mock_client = mocker.patch("app.s3_client.s3_csv_client.client").return_value
+    mock_client.head_object.return_value = {"ContentLength": 11, "ETag": '"etag"'}
+    mock_client.create_multipart_upload.return_value = {"UploadId": "upload-id"}
+    mock_client.upload_part_copy.side_effect = lambda PartNumber, **kwargs: {"CopyPartResult": {"ETag": str(PartNumber)}}
+    mocker.patch("app.s3_client.s3_csv_client.uuid.uuid4", return_value="5678")
+
+    with set_config(app_, "BULK_SEND_AWS_BUCKET", "bulk-send-bucket"):
+        copy_bulk_send_file_to_uploads("1234", "bulk.csv")
+
+    assert sorted(
+        (part_call.kwargs["PartNumber"], part_call.kwargs["CopySourceRange"])
+        for part_call in mock_client.upload_part_copy.call_args_list
+    ) == [(1, "bytes=0-3"), (2, "bytes=4-7"), (3, "bytes=8-10")]
+    for upload_part_copy_call in mock_client.upload_part_copy.call_args_list:
+        assert upload_part_copy_call.kwargs["CopySourceIfMatch"] == '"etag"'
+    mock_client.complete_multipart_upload.assert_called_once_with(
+        Bucket=current_app.config["CSV_UPLOAD_BUCKET_NAME"],
+        Key="service-1234-notify/5678.csv",
+        UploadId="upload-id",
+        MultipartUpload={
+            "Parts": [
+                {"PartNumber": 1, "ETag": "1"},
+                {"PartNumber": 2, "ETag": "2"},
+                {"PartNumber": 3, "ETag": "3"},
+            ]
+        },
+    )
+
+
+@pytest.mark.parametrize(
+    "prefix, page, expected_keys, expected_has_next_page",
+    [
+        ("", 1, ["hc/c.csv", "b.csv"], True),
+        ("", 2, ["hc/a.csv"], False),
+        ("hc/", 1, ["hc/c.csv", "hc/a.csv"], False),
+        ("x", 1, [], False),
+    ],
+)
+def test_list_bulk_send_uploads(mocker, prefix, page, expected_keys, expected_has_next_page):
+    mocker.patch(
+        "app.s3_client.s3_csv_client.get_bulk_send_uploads_index",
+        return_value=[
+            BulkSendUpload("hc/c.csv", "2021-01-03T00:00:00+00:00"),
+            BulkSendUpload("b.csv", "2021-01-02T00:00:00+00:00"),
+            BulkSendUpload("hc/a.csv", "2021-01-01T00:00:00+00:00"),
+        ],
+    )
+
+    uploads, has_next_page = list_bulk_send_uploads(prefix=prefix, page=page, page_size=2)
+
+    assert [upload.key for upload in uploads] == expected_keys
+    assert has_next_page == expected_has_next_page
+
+
+def test_get_bulk_send_uploads_index_lists_bucket_newest_first_on_cache_miss(app_, mocker):
+    mocker.patch("app.s3_client.s3_csv_client.redis_client.get", return_value=None)
+    mock_redis_set = mocker.patch("app.s3_client.s3_csv_client.redis_client.set")
+    mocker.patch("app.s3_client.s3_csv_client.time").time.return_value = 1000
+    mock_paginator = mocker.patch("app.s3_client.s3_csv_client.client").return_value.get_paginator.return_value
+    mock_paginator.paginate.return_value = [
+        {"Contents": [{"Key": "old.csv", "LastModified": datetime(2021, 1, 1, tzinfo=timezone.utc)}]},
+        {"Contents": [{"Key": "new.csv", "LastModified": datetime(2021, 2, 1, tzinfo=timezone.utc)}]},
+    ]
+
+    with set_config(app_, "BULK_SEND_AWS_BUCKET", "bulk-send-bucket"):
+        uploads = get_bulk_send_uploads_index()
+
+    assert uploads == [
+        BulkSendUpload("new.csv", "2021-02-01T00:00:00+00:00"),
+        BulkSendUpload("old.csv", "2021-01-01T00:00:00+00:00"),
+    ]
+    mock_paginator.paginate.assert_called_once_with(Bucket="bulk-send-bucket")
+    mock_redis_set.assert_called_once_with(
+        BULK_SEND_UPLOADS_CACHE_KEY,
+        json.dumps({"refreshed_at": 1000, "uploads": uploads}),
+        ex=BULK_SEND_UPLOADS_CACHE_TTL,
+    )
+
+
+@pytest.mark.parametrize("refreshed_at, expect_refresh", [(990, False), (900, True)])
+def test_get_bulk_send_uploads_index_uses_cache(app_, mocker, refreshed_at, expect_refresh):
+    mocker.patch(
+        "app.s3_client.s3_csv_client.redis_client.get",
+        return_value=json.dumps({"refreshed_at": refreshed_at, "uploads": [["a.csv", "2021-01-01T00:00:00+00:00"]]}),
+    )
+    mocker.patch("app.s3_client.s3_csv_client.time").time.return_value = 1000
+    mock_client = mocker.patch("app.s3_client.s3_csv_client.client")
+    mock_refresh = mocker.patch("app.s3_client.s3_csv_client.refresh_bulk_send_uploads_index_in_background")
+
+    assert get_bulk_send_uploads_index() == [BulkSendUpload("a.csv", "2021-01-01T00:00:00+00:00")]
+    assert mock_refresh.called is expect_refresh
+    assert not mock_client.called
+
+
+def test_refreshing_bulk_send_uploads_index_in_background_only_refreshes_it_once(app_, mocker):
+    index = {"refreshed_at": 900, "uploads": []}
+    mocker.patch("app.s3_client.s3_csv_client.redis_client.get", side_effect=lambda key: json.dumps(index))
+    mocker.patch("app.s3_client.s3_csv_client.time").time.return_value = 1000
+
+    def refresh():
+        index["refreshed_at"] = 1000
+
+    mock_refresh = mocker.patch("app.s3_client.s3_csv_client.refresh_bulk_send_uploads_index", side_effect=refresh)
+
+    for _ in range(3):
+        refresh_bulk_send_uploads_index_in_background()
+    bulk_send_uploads_index_refreshes.join()
+
+    mock_refresh.assert_called_once_with()
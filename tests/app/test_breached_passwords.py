@@ -0,0 +1,97 @@
+import hashlib
+from unittest.mock import Mock
+
+import pytest
+from wtforms import ValidationError
+
+from app.breached_passwords import (
+    BloomFilter,
+    build_breached_passwords_filter,
+    is_breached_password,
+    read_password_hashes,
+)
+from app.main.validators import Blocklist
+from tests.conftest import set_config
+
+BREACHED_PASSWORDS = ["correct horse battery staple", "hunter2", "letmein1"]
+
+
+@pytest.fixture
+def breached_passwords_filter(tmp_path):
+    path = str(tmp_path / "breached-passwords.bin")
+    lines = ["{}:{}".format(hashlib.sha1(password.encode("utf-8")).hexdigest().upper(), 5) for password in BREACHED_PASSWORDS]
+    build_breached_passwords_filter(read_password_hashes(lines), len(lines), 0.001).save(path)
+    return path
+
+
+def test_read_password_hashes_skips_passwords_seen_less_often():
+    lines = ["{}:3\n".format("AB" * 20), "{}:1\n".format("CD" * 20), "\n"]
+    assert list(read_password_hashes(lines, min_count=2)) == [bytes.fromhex("AB" * 20)]
+
+
+def test_bloom_filter_is_read_back_from_file(breached_passwords_filter):
+    bloom_filter = BloomFilter.load(breached_passwords_filter)
+
+    for password in BREACHED_PASSWORDS:
+        assert hashlib.sha1(password.encode("utf-8")).digest() in bloom_filter
+    assert hashlib.sha1(b"a very unusual password").digest() not in bloom_filter
+
+
+def test_bloom_filter_rejects_files_which_arent_filters(tmp_path):
+    path = tmp_path / "not-a-filter.bin"
+    path.write_bytes(b"not a filter at all")
+
+    with pytest.raises(ValueError):
+        BloomFilter.load(str(path))
+
+
+def test_is_breached_password_without_a_filter(app_):
+    with set_config(app_, "BREACHED_PASSWORDS_FILTER", None):
+        assert is_breached_password("hunter2") is None
+
+
+@pytest.mark.parametrize(
+    "password, allowed",
+    [
+        ("hunter2", False),
+        ("letmein1", False),
+        ("canada", False),
+        ("a very unusual password", True),
+    ],
+)
+def test_blocklist_checks_passwords_without_calling_the_api(mocker, app_, breached_passwords_filter, password, allowed):
+    mock_check = mocker.patch("app.main.validators.pwnedpasswords.check")
+
+    with app_.test_request_context(), set_config(app_, "BREACHED_PASSWORDS_FILTER", breached_passwords_filter):
+        if allowed:
+            Blocklist()(None, Mock(data=password))
+        else:
+            with pytest.raises(ValidationError):
+                Blocklist()(None, Mock(data=password))
+
+    assert mock_check.called is False
+
+
+@pytest.mark.parametrize("response, allowed", [(0, True), (10, False)])
+def test_blocklist_asks_the_api_once_without_a_filter(mocker, app_, response, allowed):
+    mock_check = mocker.patch("app.main.validators.pwnedpasswords.check", return_value=response)
+
+    with app_.test_request_context(), set_config(app_, "BREACHED_PASSWORDS_FILTER", None), set_config(app_, "HIPB_ENABLED", True):
+        if allowed:
+            Blocklist()(None, Mock(data="a very unusual password"))
+        else:
+            with pytest.raises(ValidationError):
+                Blocklist()(None, Mock(data="a very unusual password"))
+
+    mock_check.assert_called_once_with("a very unusual password")
+
+
+def test_blocklist_doesnt_call_the_api_without_a_filter_by_default(mocker, app_):
+    mock_check = mocker.patch("app.main.validators.pwnedpasswords.check")
+
+    with app_.test_request_context(), set_config(app_, "BREACHED_PASSWORDS_FILTER", None):
+        Blocklist()(None, Mock(data="a very unusual password"))
+        with pytest.raises(ValidationError):
+            Blocklist()(None, Mock(data="password"))
+
+    assert mock_check.called is False
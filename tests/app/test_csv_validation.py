@@ -0,0 +1,110 @@
+import pytest
+from notifications_utils.recipients import RecipientCSV
+
+from app.csv_validation import (
+    index_rows,
+    recipients_from_rows,
+    split_into_chunks,
+    validate_in_chunks,
+)
+
+FILE_DATA = """
+    phone number,name
+    6502532222,Jo
+    6502532223,
+    not a number,Al
+
+    6502532225,Ed
+    12345,Sam
+    6502532227,Bo
+"""
+
+RECIPIENT_CSV_KWARGS = dict(
+    template_type="sms",
+    placeholders=["name"],
+    max_errors_shown=2,
+    max_initial_rows_shown=10,
+    safelist=None,
+    remaining_messages=100,
+    international_sms=False,
+    max_rows=5,
+)
+
+
+def test_split_into_chunks_doesnt_end_a_chunk_on_a_blank_row():
+    assert [offset for offset, _ in split_into_chunks(FILE_DATA, 4)] == [0, 5]
+
+
+def test_split_into_chunks_repeats_the_header():
+    for _, chunk in split_into_chunks(FILE_DATA, 2):
+        assert chunk.startswith("phone number,name\r\n")
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 100])
+def test_validate_in_chunks_matches_validating_in_one_go(chunk_size):
+    expected = RecipientCSV(FILE_DATA, **RECIPIENT_CSV_KWARGS)
+    recipients = validate_in_chunks(FILE_DATA, processes=1, chunk_size=chunk_size, **RECIPIENT_CSV_KWARGS)
+
+    assert len(recipients) == len(expected)
+    assert recipients.too_many_rows == expected.too_many_rows
+    assert recipients.has_errors == expected.has_errors
+    assert [row.index for row in recipients.rows_with_bad_recipients] == [row.index for row in expected.rows_with_bad_recipients]
+    assert [row.index for row in recipients.rows_with_missing_data] == [row.index for row in expected.rows_with_missing_data]
+    assert [row.index for row in recipients.displayed_rows] == [row.index for row in expected.displayed_rows]
+    assert recipients[0].recipient_and_personalisation == expected[0].recipient_and_personalisation
+
+
+def test_validate_in_chunks_in_several_processes_matches_validating_serially():
+    file_data = "phone number,name\n" + "\n".join(
+        "{},{}".format("6502532{:03}".format(index) if index % 7 else "12345", "Jo" if index % 5 else "") for index in range(60)
+    )
+    recipient_csv_kwargs = dict(RECIPIENT_CSV_KWARGS, max_rows=100)
+
+    serial = validate_in_chunks(file_data, processes=1, chunk_size=10, **recipient_csv_kwargs)
+    recipients = validate_in_chunks(file_data, processes=2, chunk_size=10, **recipient_csv_kwargs)
+
+    assert len(recipients) == len(serial) == 60
+    assert [row.index for row in recipients.rows_with_bad_recipients] == [row.index for row in serial.rows_with_bad_recipients]
+    assert [row.index for row in recipients.rows_with_missing_data] == [row.index for row in serial.rows_with_missing_data]
+    assert [row.recipient_and_personalisation for row in recipients] == [row.recipient_and_personalisation for row in serial]
+
+
+def test_index_rows_gives_the_byte_offsets_of_each_row():
+    file_data = '\n  phone number,name\n6502532222,Jö\r\n6502532223,"Al\nEd"\n6502532224,Bo\n'
+    column_headers, offsets = index_rows(file_data)
+
+    assert column_headers == ["phone number", "name"]
+    assert [file_data.encode("utf-8")[start:end].decode("utf-8") for start, end in zip(offsets, offsets[1:])] == [
+        "6502532222,Jö\r\n",
+        '6502532223,"Al\nEd"\n',
+        "6502532224,Bo",
+    ]
+
+
+def test_index_rows_only_splits_rows_on_newlines():
+    file_data = "phone number,name\n6502532222,Jo\u2028Smith\n6502532223,Al\x0cEd\n6502532224,Bo"
+    column_headers, offsets = index_rows(file_data)
+    expected = RecipientCSV(file_data, **dict(RECIPIENT_CSV_KWARGS, max_rows=10))
+
+    assert len(offsets) == len(expected) + 1 == 4
+    for index, (start, end) in enumerate(zip(offsets, offsets[1:])):
+        recipients = recipients_from_rows(
+            column_headers,
+            file_data.encode("utf-8")[start:end].decode("utf-8"),
+            **dict(RECIPIENT_CSV_KWARGS, max_rows=10),
+        )
+        assert recipients[0].recipient_and_personalisation == expected[index].recipient_and_personalisation
+
+
+def test_recipients_from_rows_matches_the_whole_file():
+    column_headers, offsets = index_rows(FILE_DATA)
+    expected = RecipientCSV(FILE_DATA, **RECIPIENT_CSV_KWARGS)
+
+    recipients = recipients_from_rows(
+        column_headers,
+        FILE_DATA.encode("utf-8")[offsets[1] : offsets[2]].decode("utf-8"),
+        **RECIPIENT_CSV_KWARGS,
+    )
+
+    assert len(recipients) == 1
+    assert recipients[0].recipient_and_personalisation == expected[1].recipient_and_personalisation
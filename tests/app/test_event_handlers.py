@@ -1,13 +1,20 @@
+import json
 import uuid
-from unittest.mock import ANY
+from unittest.mock import ANY, call
+
+import pytest
 
 from app.event_handlers import (
+    _send_events,
     create_archive_user_event,
     create_email_change_event,
     create_mobile_number_change_event,
+    event_queue,
     on_user_logged_in,
 )
+from app.extensions import redis_client
 from app.models.user import User
+from tests.conftest import set_config
 
 
 def test_on_user_logged_in_calls_events_api(app_, api_user_active, mock_events):
@@ -100,3 +107,91 @@ def test_create_archive_user_event_calls_events_api(app_, mock_events):
                 "archived_by_id": archived_by_id,
             },
         )
+
+
+def test_events_are_sent_in_the_background(app_, mock_events):
+    user_id = str(uuid.uuid4())
+    archived_by_id = str(uuid.uuid4())
+
+    with app_.test_request_context(environ_base={"REMOTE_ADDR": "1.2.3.4"}), set_config(app_, "EVENTS_QUEUE_ENABLED", True):
+        create_archive_user_event(user_id, archived_by_id)
+        event_queue.join()
+
+    mock_events.assert_called_once_with(
+        "archive_user",
+        {
+            "browser_fingerprint": ANY,
+            "ip_address": "1.2.3.4",
+            "user_id": user_id,
+            "archived_by_id": archived_by_id,
+        },
+    )
+
+
+def test_send_events_retries_failed_events(mocker, app_):
+    mocker.patch("app.event_handlers.time.sleep")
+    mock_create_event = mocker.patch("app.events_api_client.create_event", side_effect=[Exception, {"some": "data"}])
+
+    _send_events([(app_, "archive_user", {"user_id": "1"})])
+
+    assert mock_create_event.call_args_list == [
+        call("archive_user", {"user_id": "1"}),
+        call("archive_user", {"user_id": "1"}),
+    ]
+
+
+def test_send_events_spills_events_to_redis_when_the_api_is_down(mocker, app_):
+    mocker.patch("app.event_handlers.time.sleep")
+    mocker.patch.object(redis_client, "active", True)
+    mock_redis_store = mocker.patch.object(redis_client, "redis_store")
+    mock_create_event = mocker.patch("app.events_api_client.create_event", side_effect=Exception)
+
+    _send_events([(app_, "archive_user", {"user_id": "1"}), (app_, "archive_user", {"user_id": "2"})])
+
+    assert mock_create_event.call_count == 3
+    mock_redis_store.rpush.assert_called_once_with(
+        "pending-events",
+        json.dumps(["archive_user", {"user_id": "1"}, 0]),
+        json.dumps(["archive_user", {"user_id": "2"}, 0]),
+    )
+
+
+def test_send_events_resends_spilled_events(mocker, app_):
+    mocker.patch.object(redis_client, "active", True)
+    mock_redis_store = mocker.patch.object(redis_client, "redis_store")
+    mock_redis_store.lpop.side_effect = [json.dumps(["update_user_email", {"user_id": "2"}]), None]
+    mock_create_event = mocker.patch("app.events_api_client.create_event")
+
+    _send_events([(app_, "archive_user", {"user_id": "1"})])
+
+    assert mock_create_event.call_args_list == [
+        call("archive_user", {"user_id": "1"}),
+        call("update_user_email", {"user_id": "2"}),
+    ]
+
+
+@pytest.mark.parametrize(
+    "spilled, expected_respilled",
+    [
+        (["update_user_email", {"user_id": "2"}], ["update_user_email", {"user_id": "2"}, 1]),
+        (["update_user_email", {"user_id": "2"}, 3], ["update_user_email", {"user_id": "2"}, 4]),
+        (["update_user_email", {"user_id": "2"}, 4], None),
+    ],
+)
+def test_send_events_drops_spilled_events_which_keep_failing(mocker, app_, spilled, expected_respilled):
+    def create_event(event_type, event_data):
+        if event_type == "update_user_email":
+            raise Exception
+
+    mocker.patch("app.event_handlers.time.sleep")
+    mocker.patch.object(redis_client, "active", True)
+    mock_redis_store = mocker.patch.object(redis_client, "redis_store")
+    mock_redis_store.lpop.side_effect = [json.dumps(spilled), None]
+    mocker.patch("app.events_api_client.create_event", side_effect=create_event)
+
+    _send_events([(app_, "archive_user", {"user_id": "1"})])
+
+    if expected_respilled:
+        mock_redis_store.rpush.assert_called_once_with("pending-events", json.dumps(expected_respilled))
+    else:
+        assert mock_redis_store.rpush.called is False
@@ -0,0 +1,23 @@
+from app.lru import LRUCache
+
+
+def test_lru_cache_forgets_least_recently_used_items():
+    cache = LRUCache(2)
+    cache.set("one", 1)
+    cache.set("two", 2)
+    assert cache.get("one") == 1
+    cache.set("three", 3)
+
+    assert list(cache) == ["one", "three"]
+    assert cache.get("two", "missing") == "missing"
+
+
+def test_lru_cache_can_get_its_size_from_a_function():
+    max_size = 1
+    cache = LRUCache(lambda: max_size)
+    cache.set("one", 1)
+    max_size = 2
+    cache.set("two", 2)
+
+    assert len(cache) == 2
+    assert "one" in cache
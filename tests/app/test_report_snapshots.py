@@ -0,0 +1,161 @@
+import json
+from datetime import date
+from unittest.mock import call
+
+import pytest
+from freezegun import freeze_time
+
+from app.extensions import redis_client
+from app.report_snapshots import (
+    get_missing_ranges,
+    get_usage_for_all_services,
+    notification_status_by_service_report,
+    send_method_stats_by_service_report,
+)
+
+
+@pytest.fixture
+def redis_store(mocker):
+    mocker.patch.object(redis_client, "active", True)
+    return mocker.patch.object(redis_client, "redis_store")
+
+
+def _notification_status_row(day, service_name):
+    return {
+        "date_created": day.strftime("%a, %d %b %Y 00:00:00 GMT"),
+        "service_name": service_name,
+    }
+
+
+def test_get_missing_ranges():
+    days = [date(2019, 1, day) for day in range(1, 7)]
+    partitions = dict(zip(days, [None, [], None, None, [], None]))
+
+    assert get_missing_ranges(days, partitions) == [
+        [date(2019, 1, 1), date(2019, 1, 1)],
+        [date(2019, 1, 3), date(2019, 1, 4)],
+        [date(2019, 1, 6), date(2019, 1, 6)],
+    ]
+
+
+@freeze_time("2019-01-10 12:00")
+def test_daily_report_uses_snapshots_for_past_days_and_api_for_recent_days(app_, redis_store, mocker):
+    redis_store.mget.return_value = [
+        json.dumps([_notification_status_row(date(2019, 1, 4), "one")]),
+        json.dumps([_notification_status_row(date(2019, 1, 5), "two")]),
+    ]
+    mock_fetch = mocker.patch(
+        "app.report_snapshots.notification_api_client.get_notification_status_by_service",
+        return_value=[_notification_status_row(date(2019, 1, 10), "three")],
+    )
+
+    rows = notification_status_by_service_report.get_rows(date(2019, 1, 4), date(2019, 1, 10))
+
+    redis_store.mget.assert_called_once_with(
+        [
+            "report-snapshot-notification-status-by-service-2019-01-04",
+            "report-snapshot-notification-status-by-service-2019-01-05",
+        ]
+    )
+    mock_fetch.assert_called_once_with(date(2019, 1, 6), date(2019, 1, 10))
+    assert [row["service_name"] for row in rows] == ["one", "two", "three"]
+    assert not redis_store.pipeline.called
+
+
+@freeze_time("2019-01-10 12:00")
+def test_daily_report_fetches_and_stores_missing_days(app_, redis_store, mocker):
+    redis_store.mget.return_value = [None, json.dumps([]), None, None]
+    mock_fetch = mocker.patch(
+        "app.report_snapshots.notification_api_client.get_notification_status_by_service",
+        side_effect=[
+            [_notification_status_row(date(2019, 1, 1), "one")],
+            [_notification_status_row(date(2019, 1, 4), "four")],
+        ],
+    )
+
+    rows = notification_status_by_service_report.get_rows(date(2019, 1, 1), date(2019, 1, 4))
+
+    assert mock_fetch.call_args_list == [
+        call(date(2019, 1, 1), date(2019, 1, 1)),
+        call(date(2019, 1, 3), date(2019, 1, 4)),
+    ]
+    assert [row["service_name"] for row in rows] == ["one", "four"]
+    assert [args[0] for args, _ in redis_store.pipeline.return_value.set.call_args_list] == [
+        "report-snapshot-notification-status-by-service-2019-01-01",
+        "report-snapshot-notification-status-by-service-2019-01-03",
+        "report-snapshot-notification-status-by-service-2019-01-04",
+    ]
+
+
+@freeze_time("2019-01-10 12:00")
+def test_send_method_stats_adds_up_counts_from_each_day(app_, redis_store, mocker):
+    redis_store.mget.return_value = [
+        json.dumps([["id 1", "service 1", "org", "email", "api", "5"]]),
+        json.dumps([["id 1", "service 1", "org", "email", "api", 2], ["id 2", "service 2", "org", "sms", "admin", 1]]),
+    ]
+    mock_fetch = mocker.patch(
+        "app.report_snapshots.platform_stats_api_client.get_send_method_stats_by_service",
+        return_value=[["id 2", "service 2", "org", "sms", "admin", 3]],
+    )
+
+    rows = send_method_stats_by_service_report.get_rows(date(2019, 1, 4), date(2019, 1, 6))
+
+    mock_fetch.assert_called_once_with(date(2019, 1, 6), date(2019, 1, 6))
+    assert rows == [
+        ["id 1", "service 1", "org", "email", "api", 7],
+        ["id 2", "service 2", "org", "sms", "admin", 4],
+    ]
+
+
+@freeze_time("2019-01-10 12:00")
+def test_send_method_stats_doesnt_store_ranges_it_cant_split_by_day(app_, redis_store, mocker):
+    redis_store.mget.return_value = [None, None, None]
+    mock_fetch = mocker.patch(
+        "app.report_snapshots.platform_stats_api_client.get_send_method_stats_by_service",
+        return_value=[["id 1", "service 1", "org", "email", "api", 5]],
+    )
+
+    rows = send_method_stats_by_service_report.get_rows(date(2019, 1, 1), date(2019, 1, 3))
+
+    mock_fetch.assert_called_once_with(date(2019, 1, 1), date(2019, 1, 3))
+    assert rows == [["id 1", "service 1", "org", "email", "api", 5]]
+    assert not redis_store.pipeline.called
+
+
+@freeze_time("2019-01-10 12:00")
+def test_snapshot_fetches_each_day_if_report_cant_be_split_by_day(app_, redis_store, mocker):
+    mock_fetch = mocker.patch(
+        "app.report_snapshots.platform_stats_api_client.get_send_method_stats_by_service",
+        return_value=[],
+    )
+
+    send_method_stats_by_service_report.snapshot(date(2019, 1, 1), date(2019, 1, 2))
+
+    assert mock_fetch.call_args_list == [
+        call(date(2019, 1, 1), date(2019, 1, 1)),
+        call(date(2019, 1, 2), date(2019, 1, 2)),
+    ]
+    assert redis_store.pipeline.return_value.set.call_args_list == [
+        call("report-snapshot-send-method-stats-by-service-2019-01-01", "[]", ex=app_.config["REPORT_SNAPSHOT_TTL"]),
+        call("report-snapshot-send-method-stats-by-service-2019-01-02", "[]", ex=app_.config["REPORT_SNAPSHOT_TTL"]),
+    ]
+
+
+@freeze_time("2019-01-10 12:00")
+@pytest.mark.parametrize(
+    "end_date, expected_cached",
+    [
+        (date(2019, 1, 5), True),
+        (date(2019, 1, 6), False),
+    ],
+)
+def test_usage_for_all_services_is_only_stored_for_past_ranges(app_, redis_store, mocker, end_date, expected_cached):
+    redis_store.mget.return_value = [None]
+    mock_fetch = mocker.patch(
+        "app.report_snapshots.billing_api_client.get_usage_for_all_services",
+        return_value=[{"service_id": "abc"}],
+    )
+
+    assert get_usage_for_all_services(date(2019, 1, 1), end_date) == [{"service_id": "abc"}]
+    mock_fetch.assert_called_once_with(date(2019, 1, 1), end_date)
+    assert redis_store.pipeline.called is expected_cached
@@ -0,0 +1,65 @@
+import pytest
+from notifications_utils.template import SMSPreviewTemplate
+
+from app.sms_fragment_counter import SMSFragmentCounter, get_placeholder_weights
+
+
+def _count_by_rendering_every_row(template, rows):
+    total = 0
+    for row in rows:
+        template.values = row
+        total += template.fragment_count
+    return total
+
+
+def test_get_placeholder_weights():
+    assert get_placeholder_weights("Hi ((Name)), ((name)) ((thing??yes)) ((Other_thing))") == (
+        ["name", "otherthing", "thing"],
+        (2, 1, 0),
+        (False, False, True),
+    )
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        "No placeholders at all",
+        "Hello ((name)), your code is ((code))",
+        "((name)) ((name)) ((name)) " + "a" * 120,
+        "Hello ((name))((urgent?? – this is urgent)). " + "b" * 100,
+    ],
+)
+def test_sms_fragment_counter_matches_rendering_every_row(content):
+    rows = [
+        {"phone number": "6502532222", "name": name, "code": code, "urgent": urgent}
+        for name, code, urgent in [
+            ("Jo", "1234", "yes"),
+            ("Jo", "5678", ""),
+            ("Amélie", "1", "no"),
+            ("Ẃïłłìäm", "12345678901234567890", "yes"),
+            ("Sam [admin]", "{}", ""),
+            ("x" * 200, "0", "yes"),
+            (" Sam", ", code", ""),
+            ("Sam ,", "", "yes"),
+            ("Jo Smith", "12 34", ""),
+            ("Jo  Smith", "12  34", "yes"),
+            ("Jo\tSmith", "12\t\t34", ""),
+            ("Jo\u00a0Smith", "12 \u00a034", "yes"),
+        ]
+    ]
+
+    assert SMSFragmentCounter(
+        SMSPreviewTemplate({"content": content, "template_type": "sms"}, prefix="Service", show_prefix=True)
+    ).count(rows) == _count_by_rendering_every_row(
+        SMSPreviewTemplate({"content": content, "template_type": "sms"}, prefix="Service", show_prefix=True),
+        rows,
+    )
+
+
+def test_sms_fragment_counter_renders_once_per_row_signature(mocker):
+    template = SMSPreviewTemplate({"content": "Hello ((name))", "template_type": "sms"})
+    counter = SMSFragmentCounter(template)
+    mock_get_fragment_count = mocker.patch.object(counter, "_get_fragment_count", return_value=1)
+
+    assert counter.count({"name": name} for name in ["Jo", "Al", "Sam", "Jo", "Ed"]) == 5
+    assert mock_get_fragment_count.call_count == 2
@@ -1,8 +1,12 @@
+from datetime import datetime
+
 import pytest
 
 from app.statistics_utils import (
     add_rate_to_job,
     add_rates_to,
+    get_api_date_converter,
+    parse_api_date,
     statistics_by_state,
     sum_of_statistics,
 )
@@ -143,3 +147,28 @@ def test_add_rate_to_job_preserves_initial_fields():
         "id",
         "failure_rate",
     }
+
+
+@pytest.mark.parametrize(
+    "value, output_format, expected",
+    [
+        ("Sat, 29 Mar 2014 00:00:00 GMT", "%d-%m-%Y", "29-03-2014"),
+        ("Tue, 01 Jan 2019 13:04:05 GMT", "%Y-%m-%dT%H:%M:%SZ", "2019-01-01T13:04:05Z"),
+        (None, "%Y-%m-%d", None),
+        ("", "%Y-%m-%d", ""),
+    ],
+)
+def test_get_api_date_converter(value, output_format, expected):
+    assert get_api_date_converter(output_format)(value) == expected
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        "Sat, 29 Mar 2014 00:00:00 GMT",
+        "Mon, 31 Dec 2018 23:59:59 GMT",
+        "Sat, 29 Mar 2014 00:00:00 UTC",
+    ],
+)
+def test_parse_api_date_matches_strptime(value):
+    assert parse_api_date(value) == datetime.strptime(value, "%a, %d %b %Y %X %Z")
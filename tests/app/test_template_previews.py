@@ -1,3 +1,4 @@
+import json
 from functools import partial
 from unittest.mock import Mock
 
@@ -5,7 +6,11 @@ import pytest
 from notifications_utils.template import LetterPreviewTemplate
 
 from app import load_service_before_request
-from app.template_previews import TemplatePreview, get_page_count_for_letter
+from app.template_previews import (
+    TemplatePreview,
+    _get_page_count_cache_key,
+    get_page_count_for_letter,
+)
 
 
 @pytest.mark.parametrize(
@@ -65,7 +70,7 @@ def test_from_database_object_makes_request(
     # `service` is in the `_request_ctx_stack` to avoid an error
     load_service_before_request()
     resp = Mock(content="a", status_code="b", headers={"c": "d"})
-    request_mock = mocker.patch("app.template_previews.requests.post", return_value=resp)
+    request_mock = mocker.patch("app.template_previews.session.post", return_value=resp)
     mocker.patch("app.template_previews.current_service", letter_branding=letter_branding)
     template = mock_get_service_letter_template("123", "456")["data"]
 
@@ -83,7 +88,7 @@ def test_from_database_object_makes_request(
     }
     headers = {"Authorization": "Token {}".format("dev-notify-secret-key")}
 
-    request_mock.assert_called_once_with(expected_url, json=data, headers=headers)
+    request_mock.assert_called_once_with(expected_url, json=data, headers=headers, timeout=30)
 
 
 @pytest.mark.parametrize("template_type", ["email", "sms"])
@@ -109,15 +114,44 @@ def test_page_count_unpacks_from_json_response(
     partial_call,
     expected_template_preview_args,
 ):
+    mocker.patch("app.extensions.RedisClient.get", return_value=None)
+    mock_redis_set = mocker.patch("app.extensions.RedisClient.set")
     mock_template_preview = mocker.patch("app.template_previews.TemplatePreview.from_database_object")
     mock_template_preview.return_value = (b'{"count": 99}', 200, {})
 
     assert partial_call({"template_type": "letter"}) == 99
     mock_template_preview.assert_called_once_with(*expected_template_preview_args)
+    mock_redis_set.assert_called_once_with(mocker.ANY, 99, ex=2592000)
+
+
+def test_page_count_comes_from_cache(mocker):
+    mock_redis_get = mocker.patch("app.extensions.RedisClient.get", return_value="3")
+    mock_template_preview = mocker.patch("app.template_previews.TemplatePreview.from_database_object")
+    template = {"id": "1234", "version": 2, "template_type": "letter", "content": "Hello", "reply_to_text": "1 Street"}
+
+    assert get_page_count_for_letter(template, values={"name": "Jo"}) == 3
+    assert mock_redis_get.call_args[0][0].startswith("letter-page-count-1234-2-")
+    assert mock_template_preview.called is False
+
+
+@pytest.mark.parametrize(
+    "changes",
+    [
+        {"version": 3},
+        {"reply_to_text": "2 Street"},
+        {"content": "Hello again"},
+        {"values": {"name": "Al"}},
+    ],
+)
+def test_page_count_cache_key_changes_with_anything_affecting_page_count(changes):
+    template = {"id": "1234", "version": 2, "template_type": "letter", "content": "Hello", "reply_to_text": "1 Street"}
+    values = changes.pop("values", {"name": "Jo"})
+
+    assert _get_page_count_cache_key(template, {"name": "Jo"}) != _get_page_count_cache_key(dict(template, **changes), values)
 
 
 def test_from_example_template_makes_request(app_, mocker):
-    request_mock = mocker.patch("app.template_previews.requests.post")
+    request_mock = mocker.patch("app.template_previews.session.post")
     template = {}
     filename = "geo"
 
@@ -132,4 +166,93 @@ def test_from_example_template_makes_request(app_, mocker):
             "filename": filename,
             "letter_contact_block": None,
         },
+        timeout=30,
+    )
+
+
+def test_from_example_template_caches_successful_previews(app_, mocker):
+    mock_redis_set = mocker.patch("app.extensions.RedisClient.set")
+    mocker.patch(
+        "app.template_previews.session.post",
+        return_value=Mock(content=b"\x89PNG", status_code=200, headers={"Content-Type": "image/png"}),
+    )
+
+    with app_.test_request_context():
+        content, status_code, headers = TemplatePreview.from_example_template({}, "geo")
+
+    assert (content, status_code) == (b"\x89PNG", 200)
+    cache_key = mock_redis_set.call_args[0][0]
+    assert cache_key.startswith("letter-preview-")
+    assert json.loads(mock_redis_set.call_args[0][1]) == {"content": "iVBORw==", "content_type": "image/png"}
+    assert ("ETag", '"{}"'.format(cache_key[len("letter-preview-") :])) in headers
+    assert ("Cache-Control", "private, no-cache") in headers
+
+
+def test_from_example_template_uses_cached_preview(app_, mocker):
+    mocker.patch(
+        "app.extensions.RedisClient.get",
+        return_value=json.dumps({"content": "iVBORw==", "content_type": "image/png"}),
     )
+    request_mock = mocker.patch("app.template_previews.session.post")
+
+    with app_.test_request_context():
+        content, status_code, headers = TemplatePreview.from_example_template({}, "geo")
+
+    assert (content, status_code) == (b"\x89PNG", 200)
+    assert ("Content-Type", "image/png") in headers
+    assert request_mock.called is False
+
+
+def test_preview_is_not_modified_if_etag_matches(app_, mocker):
+    mock_redis_get = mocker.patch("app.extensions.RedisClient.get", return_value=None)
+    request_mock = mocker.patch(
+        "app.template_previews.session.post",
+        return_value=Mock(content=b"\x89PNG", status_code=200, headers={"Content-Type": "image/png"}),
+    )
+
+    with app_.test_request_context():
+        _, _, headers = TemplatePreview.from_example_template({}, "geo")
+    etag = dict(headers)["ETag"]
+
+    with app_.test_request_context(headers={"If-None-Match": etag}):
+        assert TemplatePreview.from_example_template({}, "geo")[:2] == (b"", 304)
+
+    assert mock_redis_get.call_count == 1
+    assert request_mock.call_count == 1
+
+
+def test_from_database_object_etag_changes_with_letter_branding(app_, mocker, mock_get_service_letter_template):
+    mock_current_service = mocker.patch("app.template_previews.current_service", letter_branding=None)
+    mocker.patch(
+        "app.template_previews.session.post",
+        return_value=Mock(content=b"%PDF", status_code=200, headers={"Content-Type": "application/pdf"}),
+    )
+    template = mock_get_service_letter_template("123", "456")["data"]
+
+    with app_.test_request_context():
+        _, _, headers = TemplatePreview.from_database_object(template, "pdf")
+        mock_current_service.letter_branding = {"filename": "hm-government"}
+        _, _, rebranded_headers = TemplatePreview.from_database_object(template, "pdf")
+
+    assert dict(headers)["Cache-Control"] == dict(rebranded_headers)["Cache-Control"] == "private, no-cache"
+    assert dict(headers)["ETag"] != dict(rebranded_headers)["ETag"]
+
+
+def test_from_database_object_doesnt_cache_personalised_previews(app_, mocker, mock_get_service_letter_template):
+    mocker.patch("app.template_previews.current_service", letter_branding=None)
+    mock_redis_get = mocker.patch("app.extensions.RedisClient.get")
+    mock_redis_set = mocker.patch("app.extensions.RedisClient.set")
+    request_mock = mocker.patch(
+        "app.template_previews.session.post",
+        return_value=Mock(content=b"%PDF", status_code=200, headers={"Content-Type": "application/pdf"}),
+    )
+    template = mock_get_service_letter_template("123", "456")["data"]
+
+    with app_.test_request_context():
+        content, status_code, headers = TemplatePreview.from_database_object(template, "pdf", {"name": "Jo"})
+
+    assert (content, status_code) == (b"%PDF", 200)
+    assert ("Cache-Control", "private, no-cache") in headers
+    assert request_mock.call_args[1]["json"]["values"] == {"name": "Jo"}
+    assert mock_redis_get.called is False
+    assert mock_redis_set.called is False
@@ -0,0 +1,94 @@
+import pytest
+
+from app.template_render_cache import (
+    CachedEmailPreviewTemplate,
+    CachedSMSPreviewTemplate,
+    rendered_template_cache,
+)
+from tests.conftest import set_config
+
+
+@pytest.fixture(autouse=True)
+def empty_rendered_template_cache():
+    rendered_template_cache.clear()
+    yield
+    rendered_template_cache.clear()
+
+
+def _sms_template(**kwargs):
+    return dict({"id": "1", "version": 1, "content": "Hello ((name))", "template_type": "sms"}, **kwargs)
+
+
+def test_renders_each_preview_once(app_, mocker):
+    mock_render = mocker.patch("notifications_utils.template.SMSPreviewTemplate.__str__", return_value="<p>rendered</p>")
+    mock_redis_set = mocker.patch("app.extensions.RedisClient.set")
+
+    with app_.app_context():
+        assert str(CachedSMSPreviewTemplate(_sms_template(), prefix="Service")) == "<p>rendered</p>"
+        assert str(CachedSMSPreviewTemplate(_sms_template(), prefix="Service")) == "<p>rendered</p>"
+
+    assert mock_render.call_count == 1
+    mock_redis_set.assert_called_once_with(mocker.ANY, "<p>rendered</p>", ex=86400)
+
+
+@pytest.mark.parametrize(
+    "template, kwargs",
+    [
+        (_sms_template(version=2), {"prefix": "Service"}),
+        (_sms_template(), {"prefix": "Renamed service"}),
+        (_sms_template(), {"prefix": "Service", "show_recipient": True}),
+    ],
+)
+def test_renders_again_if_template_or_options_change(app_, mocker, template, kwargs):
+    mock_render = mocker.patch("notifications_utils.template.SMSPreviewTemplate.__str__", return_value="<p>rendered</p>")
+
+    with app_.app_context():
+        str(CachedSMSPreviewTemplate(_sms_template(), prefix="Service"))
+        str(CachedSMSPreviewTemplate(template, **kwargs))
+
+    assert mock_render.call_count == 2
+
+
+def test_renders_again_if_branding_changes(app_, mocker):
+    mock_render = mocker.patch("notifications_utils.template.EmailPreviewTemplate.__str__", return_value="<p>rendered</p>")
+    template = {"id": "1", "version": 1, "subject": "Hi", "content": "Hello", "template_type": "email"}
+
+    with app_.app_context():
+        str(CachedEmailPreviewTemplate(template, brand_colour="#000000"))
+        str(CachedEmailPreviewTemplate(template, brand_colour="#000000"))
+        str(CachedEmailPreviewTemplate(template, brand_colour="#ffffff"))
+
+    assert mock_render.call_count == 2
+
+
+def test_does_not_cache_personalised_previews(app_, mocker):
+    mock_render = mocker.patch("notifications_utils.template.SMSPreviewTemplate.__str__", return_value="<p>rendered</p>")
+
+    with app_.app_context():
+        for name in ("Jo", "Jo"):
+            template = CachedSMSPreviewTemplate(_sms_template(), prefix="Service")
+            template.values = {"name": name}
+            str(template)
+
+    assert mock_render.call_count == 2
+
+
+def test_uses_previews_rendered_by_other_processes(app_, mocker):
+    mock_render = mocker.patch("notifications_utils.template.SMSPreviewTemplate.__str__")
+    mocker.patch("app.extensions.RedisClient.get", return_value=b"<p>from redis</p>")
+
+    with app_.app_context():
+        assert str(CachedSMSPreviewTemplate(_sms_template(), prefix="Service")) == "<p>from redis</p>"
+
+    assert mock_render.called is False
+
+
+def test_forgets_least_recently_used_previews(app_, mocker):
+    mock_render = mocker.patch("notifications_utils.template.SMSPreviewTemplate.__str__", return_value="<p>rendered</p>")
+
+    with app_.app_context(), set_config(app_, "RENDERED_TEMPLATE_CACHE_SIZE", 1):
+        str(CachedSMSPreviewTemplate(_sms_template(), prefix="Service"))
+        str(CachedSMSPreviewTemplate(_sms_template(version=2), prefix="Service"))
+        str(CachedSMSPreviewTemplate(_sms_template(), prefix="Service"))
+
+    assert mock_render.call_count == 3
@@ -0,0 +1,103 @@
+import pytest
+
+from app import template_search
+from app.lru import LRUCache
+from app.template_search import TemplateSearchIndex, get_template_search_index, tokenise
+
+FOLDERS = [
+    {"id": "f1", "name": "Appointments", "parent_id": None},
+    {"id": "f2", "name": "Reminders", "parent_id": "f1"},
+    {"id": "f3", "name": "Secret", "parent_id": None},
+]
+TEMPLATES = [
+    {"id": "t1", "name": "Flu shot", "template_type": "sms", "folder": "f2", "content": "Your vaccination is tomorrow"},
+    {"id": "t2", "name": "Passport renewal", "template_type": "email", "folder": None, "subject": "Renew", "content": "Hi"},
+    {"id": "t3", "name": "Passport secret", "template_type": "email", "folder": "f3", "content": "Hi"},
+]
+
+
+def _ids(results):
+    return [item["id"] for item in results]
+
+
+def test_tokenise_ignores_case_punctuation_and_accents():
+    assert tokenise("Rappel : Vaccin contre la GRIPPE, été") == ["rappel", "vaccin", "contre", "la", "grippe", "ete"]
+
+
+@pytest.mark.parametrize(
+    "query, expected_ids",
+    [
+        ("passport", ["t2", "t3"]),
+        ("pass", ["t2", "t3"]),
+        ("pasport", ["t2", "t3"]),
+        ("passport renewal", ["t2"]),
+        ("reminders", ["f2", "t1"]),
+        ("appointments flu", ["t1"]),
+        ("vaccination", []),
+        ("", []),
+    ],
+)
+def test_search_matches_names_and_folder_paths(query, expected_ids):
+    assert sorted(_ids(TemplateSearchIndex(TEMPLATES, FOLDERS).search(query))) == expected_ids
+
+
+def test_search_only_looks_for_misspellings_if_nothing_starts_with_the_query(mocker):
+    index = TemplateSearchIndex(TEMPLATES, FOLDERS)
+    mock_get_close_matches = mocker.patch.object(template_search, "get_close_matches", return_value=[])
+
+    assert sorted(_ids(index.search("passport"))) == ["t2", "t3"]
+    assert mock_get_close_matches.called is False
+
+    index.search("pasport")
+    assert mock_get_close_matches.called is True
+
+
+def test_search_ranks_name_matches_above_folder_path_matches():
+    index = TemplateSearchIndex(
+        TEMPLATES + [{"id": "t4", "name": "Reminder", "template_type": "sms", "folder": None}],
+        FOLDERS,
+    )
+    assert _ids(index.search("reminder"))[0] == "t4"
+
+
+def test_search_only_includes_content_if_asked():
+    index = TemplateSearchIndex(TEMPLATES, FOLDERS)
+    assert _ids(index.search("vaccination", include_content=True)) == ["t1"]
+    assert _ids(index.search("renew", include_content=True)) == ["t2"]
+
+
+def test_search_only_returns_items_in_permitted_folders():
+    index = TemplateSearchIndex(TEMPLATES, FOLDERS)
+    assert _ids(index.search("secret", permitted_folder_ids={None, "f1", "f2"})) == []
+    assert _ids(index.search("passport", permitted_folder_ids={None, "f1", "f2"})) == ["t2"]
+    assert sorted(_ids(index.search("secret", permitted_folder_ids={None, "f3"}))) == ["f3", "t3"]
+
+
+def test_search_returns_folder_path():
+    assert TemplateSearchIndex(TEMPLATES, FOLDERS).search("flu") == [
+        {
+            "id": "t1",
+            "name": "Flu shot",
+            "type": "template",
+            "template_type": "sms",
+            "parent_id": "f2",
+            "path": ["Appointments", "Reminders"],
+        }
+    ]
+
+
+def test_get_template_search_index_only_rebuilds_when_templates_change(mocker):
+    mocker.patch.object(template_search, "_indexes", LRUCache(template_search.MAX_CACHED_INDEXES))
+    index = get_template_search_index("service", TEMPLATES, FOLDERS)
+
+    assert get_template_search_index("service", list(TEMPLATES), list(FOLDERS)) is index
+    assert get_template_search_index("service", TEMPLATES[:1], FOLDERS) is not index
+
+
+def test_get_template_search_index_forgets_least_recently_used_services(mocker):
+    mocker.patch.object(template_search, "_indexes", LRUCache(2))
+
+    for service_id in ("one", "two", "one", "three"):
+        get_template_search_index(service_id, TEMPLATES, FOLDERS)
+
+    assert list(template_search._indexes) == ["one", "three"]
@@ -1,6 +1,6 @@
 from collections import OrderedDict
 from csv import DictReader
-from io import StringIO
+from io import BytesIO, StringIO
 from pathlib import Path
 
 import pytest
@@ -9,7 +9,11 @@ from freezegun import freeze_time
 
 from app import format_datetime_relative
 from app.utils import (
+    DomainSuffixIndex,
     Spreadsheet,
+    _geolocate_ip,
+    _get_security_hub,
+    _send_security_findings,
     documentation_url,
     email_safe,
     generate_next_dict,
@@ -20,8 +24,11 @@ from app.utils import (
     get_logo_cdn_domain,
     get_remote_addr,
     get_template,
+    ip_geolocations,
+    is_gov_user,
     printing_today_or_tomorrow,
     report_security_finding,
+    security_findings,
 )
 from tests.conftest import SERVICE_ONE_ID, fake_uuid, set_config, template_json
 
@@ -131,12 +138,104 @@ def test_generate_previous_next_dict_adds_other_url_args(client):
     assert "notifications/blah" in ret["url"]
 
 
+@pytest.mark.parametrize(
+    "email_address, expected",
+    [
+        ("test@canada.ca", True),
+        ("test@Department.CANADA.ca", True),
+        ("test@notcanada.ca", False),
+        ("test@canada.ca.example.com", False),
+        ("canada.ca", False),
+        ("test@gc.ca", False),
+        ("test@tbs-sct.gc.ca", True),
+    ],
+)
+def test_domain_suffix_index(email_address, expected):
+    assert (email_address in DomainSuffixIndex(["canada.ca", " tbs-sct.gc.ca\n", ""])) is expected
+
+
+def test_is_gov_user_rebuilds_index_when_domains_change(app_, mocker):
+    mock_get_domains = mocker.patch("app.organisations_client.get_domains", return_value=["example.com"])
+    assert is_gov_user("test@example.com") is True
+
+    mock_get_domains.return_value = ["example.org"]
+    assert is_gov_user("test@example.com") is False
+    assert is_gov_user("test@sub.example.org") is True
+
+
+def test_is_gov_user_only_fetches_domains_again_once_the_index_is_old(app_, mocker):
+    mocker.patch("app.utils._organisation_domains", ((), None, DomainSuffixIndex([])))
+    mock_monotonic = mocker.patch("app.utils.monotonic", return_value=100)
+    mock_get_domains = mocker.patch("app.organisations_client.get_domains", return_value=["example.com"])
+
+    with set_config(app_, "ORGANISATION_DOMAINS_INDEX_TTL", 60):
+        assert is_gov_user("test@example.com") is True
+
+        mock_get_domains.return_value = ["example.org"]
+        mock_monotonic.return_value = 159
+        assert is_gov_user("test@example.com") is True
+        assert mock_get_domains.call_count == 1
+
+        mock_monotonic.return_value = 160
+        assert is_gov_user("test@example.com") is False
+        assert mock_get_domains.call_count == 2
+
+
 def test_can_create_spreadsheet_from_large_excel_file():
     with open(str(Path.cwd() / "tests" / "spreadsheet_files" / "excel 2007.xlsx"), "rb") as xl:
         ret = Spreadsheet.from_file(xl, filename="xl.xlsx")
     assert ret.as_csv_data
 
 
+@pytest.mark.parametrize(
+    "file_contents",
+    [
+        b"phone number,name\r\n6502532222,Jo\r\n",
+        b"phone number,name\n6502532222,Jo\n\n6502532223,Al",
+        b"phone number,name\r6502532222,Zo\xc3\xa9\r\n",
+        b"",
+    ],
+)
+def test_normalise_newlines_when_file_is_read_in_chunks(mocker, file_contents):
+    mocker.patch.object(Spreadsheet, "chunk_size", 3)
+    assert Spreadsheet.normalise_newlines(BytesIO(file_contents)) == "\r\n".join(file_contents.decode("utf-8").splitlines())
+
+
+def test_spreadsheet_from_csv_file_is_read_lazily():
+    file_contents = BytesIO(b"phone number\n6502532222\n")
+    spreadsheet = Spreadsheet.from_file(file_contents, filename="file.csv")
+
+    assert file_contents.tell() == 0
+    assert "".join(spreadsheet.as_streaming_dict["data"]) == "phone number\r\n6502532222"
+
+
+def test_spreadsheet_from_csv_file_can_be_read_more_than_once():
+    spreadsheet = Spreadsheet.from_file(BytesIO(b"phone number\n6502532222\n"), filename="file.csv")
+
+    assert "".join(spreadsheet.as_streaming_dict["data"]) == "phone number\r\n6502532222"
+    assert "".join(spreadsheet.as_csv_chunks()) == "phone number\r\n6502532222"
+    assert spreadsheet.as_csv_data == "phone number\r\n6502532222"
+
+
+def test_iter_lines_joins_up_lines_longer_than_a_chunk(mocker):
+    mocker.patch.object(Spreadsheet, "chunk_size", 3)
+    file_contents = b"phone number,name\r\n6502532222," + b"x" * 100 + b"\r\n6502532223,Jo"
+
+    assert list(Spreadsheet.iter_lines(BytesIO(file_contents))) == [
+        "phone number,name",
+        "6502532222," + "x" * 100,
+        "6502532223,Jo",
+    ]
+
+
+def test_spreadsheet_from_rows_yields_csv_in_chunks(mocker):
+    mocker.patch.object(Spreadsheet, "chunk_size", 10)
+    chunks = list(Spreadsheet.from_rows([["phone number", "name"]] + [["6502532222", "Jo"]] * 3).as_csv_chunks())
+
+    assert len(chunks) == 4
+    assert "".join(chunks) == "phone number,name\r\n" + "6502532222,Jo\r\n" * 3
+
+
 def test_can_create_spreadsheet_from_dict():
     assert Spreadsheet.from_dict(
         OrderedDict(
@@ -294,7 +393,7 @@ def test_generate_notifications_csv_returns_correct_csv_file(
 ):
     mocker.patch(
         "app.s3_client.s3_csv_client.s3download",
-        return_value=original_file_contents,
+        return_value=StringIO(original_file_contents),
     )
     csv_content = generate_notifications_csv(service_id="1234", job_id=fake_uuid, template_type="sms")
     csv_file = DictReader(StringIO("\n".join(csv_content)))
@@ -320,7 +419,8 @@ def test_generate_notifications_csv_calls_twice_if_next_link(
 
     mocker.patch(
         "app.s3_client.s3_csv_client.s3download",
-        return_value="""
+        return_value=StringIO(
+            """
             phone_number
             07700900000
             07700900001
@@ -332,7 +432,8 @@ def test_generate_notifications_csv_calls_twice_if_next_link(
             07700900007
             07700900008
             07700900009
-        """,
+        """
+        ),
     )
 
     service_id = "1234"
@@ -501,19 +602,67 @@ def test_get_letter_printing_statement_for_letter_that_has_been_sent(created_at,
     assert statement == "Printed {} at 5:30pm".format(print_day)
 
 
-def test_report_security_finding(mocker, app_):
+@pytest.fixture
+def security_hub(mocker):
+    _get_security_hub.cache_clear()
     boto_client = mocker.patch("app.utils.boto3")
     client = boto_client.client.return_value = mocker.Mock()
     client.get_caller_identity.return_value = {"Account": "123456789"}
+    yield boto_client
+    _get_security_hub.cache_clear()
+
+
+def test_report_security_finding(security_hub, app_):
+    client = security_hub.client.return_value
 
     with app_.app_context():
         report_security_finding("foo", "bar", 50, 50)
+        security_findings.join()
 
-    boto_client.client.assert_called_with("securityhub", region_name=current_app.config["AWS_REGION"])
+    security_hub.client.assert_called_with("securityhub", region_name=current_app.config["AWS_REGION"])
     client.get_caller_identity.assert_called()
     client.batch_import_findings.assert_called()
 
 
+def test_send_security_findings_in_one_batch_and_reuses_clients(security_hub):
+    client = security_hub.client.return_value
+
+    _send_security_findings([("us-east-1", {"Title": "foo"}), ("us-east-1", {"Title": "bar"})])
+    _send_security_findings([("us-east-1", {"Title": "baz"})])
+
+    assert client.get_caller_identity.call_count == 1
+    assert security_hub.client.call_count == 2
+    assert client.batch_import_findings.call_args_list[0][1]["Findings"] == [
+        {
+            "Title": "foo",
+            "ProductArn": "arn:aws:securityhub:us-east-1:123456789:product/123456789/default",
+            "AwsAccountId": "123456789",
+        },
+        {
+            "Title": "bar",
+            "ProductArn": "arn:aws:securityhub:us-east-1:123456789:product/123456789/default",
+            "AwsAccountId": "123456789",
+        },
+    ]
+    assert len(client.batch_import_findings.call_args_list[1][1]["Findings"]) == 1
+
+
+def test_geolocate_ip_looks_up_new_ips_in_the_background(mocker, app_):
+    mock_lookup = mocker.patch(
+        "app.utils._geolocate_lookup",
+        return_value={"continent": {"code": "NA"}, "city": {"names": {"en": "Ottawa"}}, "subdivisions": [{"iso_code": "ON"}]},
+    )
+    mocker.patch("app.utils.redis_client.get", return_value=None)
+    mocker.patch("app.utils.redis_client.set")
+
+    with set_config(app_, "IP_GEOLOCATE_SERVICE", "https://example.com"):
+        assert _geolocate_ip("5.6.7.8") == "5.6.7.8"
+        ip_geolocations.join()
+        assert _geolocate_ip("5.6.7.8") == "Ottawa, ON (5.6.7.8)"
+
+    mock_lookup.assert_called_once_with("5.6.7.8")
+
+
 @pytest.mark.parametrize(
     "forwarded_for, remote_addr, expected",
     [
@@ -2579,6 +2579,9 @@ def mock_get_users_by_service(mocker):
 @pytest.fixture(scope="function")
 def mock_s3_upload(mocker):
     def _upload(service_id, filedata, region):
+        # Read streamed uploads while the uploaded file is still open
+        if not isinstance(filedata["data"], (str, bytes)):
+            filedata["data"] = "".join(filedata["data"])
         return sample_uuid()
 
     return mocker.patch("app.main.views.send.s3upload", side_effect=_upload)